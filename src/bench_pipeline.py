@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from utils.mock_server import MockLLMServer, MockProfile
+from utils.gen_cons import gen_data
+from utils.scenario import Scenario
+from utils.cache import get_cache
+from utils.pool import close_pool
+from utils.tracing import configure_tracing, tracer
+from utils.jsonextract import extract_json
+from main import ConsumptionModifier, Energy_manager
+
+### Benchmark del pipeline (generación -> limpieza -> parseo -> modificación) contra el servidor LLM local.
+# No necesita claves ni red: arranca utils.mock_server en el mismo proceso y apunta los proveedores a él con
+# GEMINI_BASE_URL / OPENROUTER_BASE_URL. Para cada tamaño de dataset y nivel de concurrencia mide latencia
+# (p50/p95/p99) y rendimiento de cada etapa y del ciclo completo Energy_manager.generate_and_modify_data().
+#
+#   python bench_pipeline.py                                   # 30, 1000 y 10000 casas; concurrencia 1, 4 y 16
+#   python bench_pipeline.py --provider openrouter --latency lognormal:800:0.5 --error-rate 0.05 --json pipeline.json
+
+MODELS = {"gemini": "gemini-2.0-flash", "openrouter": "deepseek-r1"}
+HOUSES_PER_SECTOR = 10
+RULES = "Consumption >= 0.5 is not normal, subtract 0.3. Ensure final values are between 0.0 and 1.0."
+
+
+def _stats(latencies, elapsed, ok, total, houses):
+    latencies = np.asarray(latencies, dtype=np.float64) * 1000.0
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99)) if len(latencies) else (np.nan,) * 3
+    return {
+        "ok": ok, "total": total,
+        "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+        "per_s": ok / elapsed if elapsed else 0.0, # peticiones (o escenarios) correctas por segundo
+        "houses_per_s": ok * houses / elapsed if elapsed else 0.0,
+    }
+
+
+async def _timed_batch(make_call, count, concurrency):
+    """Lanza `count` llamadas con como mucho `concurrency` simultáneas; devuelve (resultados, latencias, segundos)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await make_call(i)
+            except Exception:
+                result = None
+            latencies.append(time.perf_counter() - start)
+            return result
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(count)))
+    return results, latencies, time.perf_counter() - start
+
+
+def _parse(texts):
+    """Tiempos (s) de extract_json y Scenario.from_dict sobre las respuestas de generación."""
+    timings = {"extract": [], "scenario": []}
+    scenarios = []
+    for text in texts:
+        if not isinstance(text, str):
+            continue
+        t0 = time.perf_counter()
+        try:
+            data, _ = extract_json(text)
+        except json.JSONDecodeError:
+            continue
+        t1 = time.perf_counter()
+        scenarios.append(Scenario.from_dict(data))
+        t2 = time.perf_counter()
+        timings["extract"].append(t1 - t0)
+        timings["scenario"].append(t2 - t1)
+    return timings, scenarios
+
+
+async def run_case(profile, model, houses, concurrency, requests):
+    profile.sectors = max(1, houses // HOUSES_PER_SECTOR)
+    profile.houses_per_sector = HOUSES_PER_SECTOR
+    houses = profile.sectors * HOUSES_PER_SECTOR
+    get_cache().clear() # cada caso parte sin respuestas cacheadas
+    case = {"houses": houses, "concurrency": concurrency}
+
+    texts, latencies, elapsed = await _timed_batch(lambda i: gen_data(model), requests, concurrency)
+    case["generate"] = _stats(latencies, elapsed, sum(isinstance(t, str) for t in texts), requests, houses)
+
+    timings, scenarios = _parse(texts)
+    size = sum(len(t) for t in texts if isinstance(t, str)) / max(1, len(timings["extract"]))
+    for stage, values in timings.items():
+        case[stage] = {"mean_ms": float(np.mean(values)) * 1000.0 if values else float("nan"),
+                       "mb_per_s": size / float(np.mean(values)) / 1e6 if values and np.mean(values) else float("nan")}
+
+    modifier = ConsumptionModifier("bench-modifier", model)
+    if scenarios:
+        modified, latencies, elapsed = await _timed_batch(
+            lambda i: modifier.modify_scenario(scenarios[i % len(scenarios)], RULES), requests, concurrency)
+        case["modify"] = _stats(latencies, elapsed, sum(m is not None for m in modified), requests, houses)
+
+    get_cache().clear()
+    manager = Energy_manager("bench", ai_model=model)
+    manager.modification_rules = RULES
+    results, latencies, elapsed = await _timed_batch(lambda i: manager.generate_and_modify_data(), requests, concurrency)
+    case["end_to_end"] = _stats(latencies, elapsed, sum(r is not None for r in results), requests, houses)
+    return case
+
+
+def print_case(case):
+    print(f"\n=== {case['houses']} casas, concurrencia {case['concurrency']} ===")
+    print(f"{'etapa':<11} {'ok':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'casas/s':>10}")
+    for stage in ("generate", "modify", "end_to_end"):
+        s = case.get(stage)
+        if s:
+            print(f"{stage:<11} {s['ok']:>3}/{s['total']:<3} {s['p50_ms']:9.1f} {s['p95_ms']:9.1f} {s['p99_ms']:9.1f} "
+                  f"{s['per_s']:8.2f} {s['houses_per_s']:10.0f}")
+    for stage in ("extract", "scenario"):
+        s = case[stage]
+        print(f"{stage:<11} {'':>7} {s['mean_ms']:9.3f} ms de media  {s['mb_per_s']:8.1f} MB/s")
+
+
+async def main(args):
+    profile = MockProfile(latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                          chars_per_second=args.chars_per_second, fence_rate=args.fence_rate,
+                          truncate_rate=args.truncate_rate, seed=args.seed)
+    if args.trace:
+        configure_tracing(jsonl_path=args.trace)
+    async with MockLLMServer(profile) as server:
+        os.environ.update(server.env())
+        print(f"--- [Bench] Servidor LLM local en {server.url} (proveedor {args.provider}, latencia {args.latency}) ---")
+        results = []
+        for houses in (int(h) for h in args.sizes.split(",")):
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                # Los logs por petición del pipeline no interesan aquí (y su coste no debe contar como ruido de salida)
+                with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+                    case = await run_case(profile, MODELS[args.provider], houses, concurrency, args.requests)
+                results.append(case)
+                print_case(case)
+        await close_pool()
+        print(f"\n--- [Bench] Servidor: {server.stats} ---")
+        if args.trace:
+            counters = tracer.snapshot()["counters"]
+            print(f"--- [Bench] Contadores: {counters} ---")
+            tracer.close()
+            print(f"--- [Bench] Trazas guardadas en {args.trace} ---")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline generación/modificación contra un LLM local")
+    parser.add_argument("--provider", choices=MODELS, default="gemini")
+    parser.add_argument("--sizes", default="30,1000,10000", help="casas por dataset, separadas por comas")
+    parser.add_argument("--concurrency", default="1,4,16", help="peticiones simultáneas, separadas por comas")
+    parser.add_argument("--requests", type=int, default=16, help="peticiones por etapa y caso")
+    parser.add_argument("--latency", default="lognormal:200:0.4", help="fixed:MS | uniform:MIN:MAX | lognormal:MEDIANA:SIGMA")
+    parser.add_argument("--chars-per-second", type=float, default=None, help="velocidad de generación simulada")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--fence-rate", type=float, default=0.2, help="fracción de respuestas con ```json ... ```")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="fracción de respuestas cortadas a medias")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="guardar los resultados en este fichero JSON")
+    parser.add_argument("--verbose", action="store_true", help="mostrar los logs del pipeline")
+    parser.add_argument("--trace", default=None, help="activar utils.tracing y guardar los spans en este fichero JSONL")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"--- [Bench] Resultados guardados en {args.json} ---")
@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import json
+import sys
+
+import numpy as np
+import pygame
+
+from main import visualize_data_pygame
+from utils.gen_cons import gen_arrays
+from utils.scenario import Scenario
+from utils.frame_timer import FrameTimer, PHASES
+from utils.lod import LEVELS
+
+### Benchmark del render de visualize_data_pygame sin pantalla (SDL "dummy") y sin límite de FPS.
+# Cada tamaño repite la misma sesión: frames estables, "Regenerar" (tecla R) con overlay de carga durante
+# --delay ms, la transición animada al escenario nuevo, y una segunda regeneración. Se informa p50/p95/p99 del
+# frame y de cada fase (events, layout, text, colour, draw, flip) para detectar regresiones del renderer.
+#
+#   python bench_render.py                      # 100, 10k y 1M casas
+#   python bench_render.py --sizes 10k --level circles --json resultados.json
+#   python bench_render.py --sizes 1M --check   # falla (código 1) si el p95 del frame supera P95_BUDGET_MS
+
+SIZES = {
+    "100": (10, 10),          # sectores, casas por sector
+    "10k": (500, 20),
+    "1M": (10000, 100),
+}
+# Presupuesto de regresión del p95 del frame (ms): con 1M de casas el coste debe depender de los píxeles del panel,
+# no de las casas, así que tiene que caber de sobra en un frame de 60 Hz
+P95_BUDGET_MS = {
+    "1M": 16.7,
+}
+
+
+def build_scenarios(sectors, houses_per_sector, count=3, seed=0):
+    """`count` escenarios con la misma estructura y valores distintos (uno inicial y los de cada regeneración)."""
+    scenarios = []
+    for i in range(count):
+        names, counts, values = gen_arrays(sectors=sectors, houses_per_sector=houses_per_sector, seed=seed + i)
+        scenario = Scenario.from_arrays(names, counts, values)
+        modified = np.round(scenario.initial * np.float32(0.8 - 0.1 * i), 2)
+        modified[::97] = np.nan # algunas casas sin valor modificado, como las respuestas incompletas del LLM
+        scenarios.append(scenario.with_modified(modified))
+    return scenarios
+
+
+class ReplayManager:
+    """Sustituye a Energy_manager: devuelve escenarios ya generados tras un retardo fijo (el overlay de carga)."""
+
+    def __init__(self, scenarios, delay):
+        self.scenarios = scenarios
+        self.delay = delay
+        self.calls = 0
+
+    async def next_scenario(self, on_partial=None, progress=None):
+        if progress is not None:
+            progress("Generando datos iniciales...")
+        await asyncio.sleep(self.delay)
+        self.calls += 1
+        return self.scenarios[self.calls % len(self.scenarios)]
+
+
+class Script:
+    """Eventos de la sesión según el tiempo transcurrido desde el primer frame (ms)."""
+
+    def __init__(self, regenerate_at, duration, level=None):
+        self.regenerate_at = list(regenerate_at)
+        self.duration = duration
+        self.level = level
+        self.start = None
+
+    def __call__(self, frame, time_ms):
+        events = []
+        if self.start is None:
+            self.start = time_ms
+            if self.level is not None:
+                # L recorre automático -> circles -> pixels -> sectors
+                for _ in range(LEVELS.index(self.level) + 1):
+                    events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_l, mod=0, unicode="l"))
+        elapsed = time_ms - self.start
+        while self.regenerate_at and elapsed >= self.regenerate_at[0]:
+            self.regenerate_at.pop(0)
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_r, mod=0, unicode="r"))
+        if elapsed >= self.duration:
+            events.append(pygame.event.Event(pygame.QUIT))
+        return events
+
+
+def run(size, duration, delay, level=None):
+    sectors, houses_per_sector = SIZES[size]
+    scenarios = build_scenarios(sectors, houses_per_sector)
+    manager = ReplayManager(scenarios, delay / 1000.0)
+    timer = FrameTimer()
+    script = Script(regenerate_at=(duration * 0.2, duration * 0.6), duration=duration, level=level)
+    visualize_data_pygame(scenarios[0], manager, headless=True, fps=0, scripted_events=script, frame_timer=timer)
+    return {"houses": len(scenarios[0]), "frames": timer.frames, "regenerations": manager.calls, "ms": timer.summary()}
+
+
+def check_budgets(results):
+    """[(tamaño, p95, presupuesto)] de los tamaños cuyo p95 del frame supera P95_BUDGET_MS."""
+    over = []
+    for size, result in results.items():
+        budget = P95_BUDGET_MS.get(size)
+        p95 = result["ms"]["frame"]["p95"]
+        if budget is not None and p95 > budget:
+            over.append((size, p95, budget))
+    return over
+
+
+def print_report(size, result):
+    print(f"\n=== {size}: {result['houses']} casas, {result['frames']} frames, {result['regenerations']} regeneraciones ===")
+    print(f"{'fase':<8} {'p50':>9} {'p95':>9} {'p99':>9} {'media':>9}  (ms)")
+    for name in ("frame",) + PHASES:
+        stats = result["ms"].get(name)
+        if stats:
+            print(f"{name:<8} {stats['p50']:9.3f} {stats['p95']:9.3f} {stats['p99']:9.3f} {stats['mean']:9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sin pantalla del visualizador pygame")
+    parser.add_argument("--sizes", default=",".join(SIZES), help=f"tamaños separados por comas ({', '.join(SIZES)})")
+    parser.add_argument("--duration", type=float, default=5000, help="duración de cada sesión (ms)")
+    parser.add_argument("--delay", type=float, default=600, help="duración del overlay de carga de cada regeneración (ms)")
+    parser.add_argument("--level", choices=LEVELS, default=None, help="forzar un nivel de detalle (por defecto automático)")
+    parser.add_argument("--json", default=None, help="guardar los resultados en este fichero JSON")
+    parser.add_argument("--check", action="store_true", help="salir con código 1 si algún p95 del frame supera su presupuesto")
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes.split(","):
+        if size not in SIZES:
+            sys.exit(f"Tamaño desconocido: {size} (opciones: {', '.join(SIZES)})")
+        print(f"--- [Bench] Renderizando {size} casas ---")
+        results[size] = run(size, args.duration, args.delay, args.level)
+        print_report(size, results[size])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n--- [Bench] Resultados guardados en {args.json} ---")
+
+    over_budget = check_budgets(results)
+    for size, p95, budget in over_budget:
+        print(f"--- [Bench] REGRESIÓN: p95 del frame con {size} casas = {p95:.3f} ms (presupuesto {budget} ms) ---")
+    if args.check and over_budget:
+        sys.exit(1)
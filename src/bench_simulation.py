@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from utils.gen_cons import gen_arrays
+from utils.rules import compile_rules
+from utils.scenario import Scenario
+from utils.simulation import Simulation
+
+### Benchmark de la simulación temporal (utils.simulation) sin pantalla, sin red y sin límite de ticks por segundo.
+# Para cada tamaño mide los ticks por segundo de:
+#   - step: sólo la dinámica en el sitio (perfil diurno, deriva, clima y ruido),
+#   - run: el generador completo de Simulation.run(), con la copia del tick y la política de reglas compilada
+#     (lo mismo que Energy_manager.simulate), cediendo el loop en cada tick.
+#
+#   python bench_simulation.py                         # 1k, 20k y 100k casas
+#   python bench_simulation.py --sizes 20k --ticks 5000 --json simulacion.json
+
+SIZES = {
+    "1k": (50, 20),           # sectores, casas por sector
+    "20k": (1000, 20),
+    "100k": (5000, 20),
+}
+RULES = "Consumption >= 0.5 is not normal, subtract 0.3. Ensure final values are between 0.0 and 1.0."
+
+
+def build_simulation(sectors, houses_per_sector, seed=0):
+    names, counts, values = gen_arrays(sectors=sectors, houses_per_sector=houses_per_sector, seed=seed)
+    scenario = Scenario.from_arrays(names, counts, values)
+    return Simulation(scenario, policy=compile_rules(RULES, seed=seed).apply_array, seed=seed)
+
+
+def bench_step(simulation, ticks):
+    started = time.perf_counter()
+    for _ in range(ticks):
+        simulation.step()
+    return ticks / (time.perf_counter() - started)
+
+
+async def bench_run(simulation, ticks):
+    started = time.perf_counter()
+    async for _ in simulation.run(ticks):
+        pass
+    return ticks / (time.perf_counter() - started)
+
+
+def run_size(label, ticks, warmup):
+    sectors, houses_per_sector = SIZES[label]
+    step_sim = build_simulation(sectors, houses_per_sector)
+    bench_step(step_sim, warmup)
+    run_sim = build_simulation(sectors, houses_per_sector)
+    asyncio.run(bench_run(run_sim, warmup))
+    result = {
+        "houses": len(step_sim.scenario),
+        "ticks": ticks,
+        "step_ticks_per_s": bench_step(step_sim, ticks),
+        "run_ticks_per_s": asyncio.run(bench_run(run_sim, ticks)),
+    }
+    print(f"--- [Bench] {label}: {result['houses']} casas, {ticks} ticks ---")
+    print(f"    step: {result['step_ticks_per_s']:>10.0f} ticks/s")
+    print(f"    run:  {result['run_ticks_per_s']:>10.0f} ticks/s (copia + reglas + cesión del loop)")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la simulación temporal (ticks por segundo)")
+    parser.add_argument("--sizes", default=",".join(SIZES), help=f"tamaños separados por comas ({', '.join(SIZES)})")
+    parser.add_argument("--ticks", type=int, default=2000, help="ticks medidos por tamaño")
+    parser.add_argument("--warmup", type=int, default=100, help="ticks de calentamiento (no medidos)")
+    parser.add_argument("--json", default=None, help="guardar los resultados en este fichero JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes.split(","):
+        if size not in SIZES:
+            sys.exit(f"Tamaño desconocido: {size} (opciones: {', '.join(SIZES)})")
+        results[size] = run_size(size, args.ticks, args.warmup)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n--- [Bench] Resultados guardados en {args.json} ---")
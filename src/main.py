@@ -1,31 +1,52 @@
 # --- Dentro de main.py ---
 from utils.agent import flowtask
-from utils.gen_cons import gen_data
+from utils.gen_cons import gen_data, gen_arrays
+from utils.scenario import Scenario
+from utils.worker import RegenerationWorker
+from utils.cache import get_cache
+from utils.resilience import ProviderError
+from utils.jsonstream import IncrementalJSONParser
+from utils.rules import compile_rules
+from utils.prefetch import PrefetchBuffer
+from utils.simulation import Simulation
+from utils.text_cache import TextCache
+from utils.layout import LayoutEngine, LayoutMetrics, row_rects
+from utils.colors import Pulse
+from utils.layers import LayeredScreen
+from utils.lod import HeatmapRenderer, LEVEL_CIRCLES, LEVEL_PIXELS, LEVEL_SECTORS, LEVELS, STATS
+from utils.viewport import Viewport, HouseIndex
+from utils.frame_timer import NULL_TIMER
+from utils.tracing import tracer, configure_from_env
+from utils.jsonextract import extract_json, is_json_object
+from utils.validate import validate_scenario, subset_dict, patch_values
 import asyncio
+import concurrent.futures
 import json
+import os
 import pygame
-import sys
 import traceback
-import threading
 import queue
 import math
-import time
-import random # <-- Añadido para posible jitter (opcional)
+import numpy as np
 
 # --- Clases ConsumptionModifier y Energy_manager (sin cambios lógicos internos) ---
 # ... (Código de las clases como en la versión anterior) ...
 class ConsumptionModifier:
-    def __init__(self, agent_name, ai_model):
+    def __init__(self, agent_name, ai_model, shard_size=None, max_concurrency=4, shard_retries=2, delta=False, **agent_options):
         self.name = agent_name
         self.ai_model = ai_model
-
-    async def modify_consumption(self, current_data_dict, modification_rules):
-        # ... (código existente sin cambios, asegurándose que devuelve None en error) ...
-        if not isinstance(current_data_dict, dict):
-            print(f"Error en modify_consumption: Se esperaba un diccionario, se recibió {type(current_data_dict)}")
-            return None
+        # Modo delta: el modelo sólo devuelve las casas cuyo valor cambia y se parchean localmente sobre los datos actuales
+        self.delta = delta
+        # Modo por shards: un prompt por sector (los sectores con más de shard_size casas se parten en trozos),
+        # como mucho max_concurrency peticiones simultáneas; cada shard fallido se reintenta shard_retries veces
+        self.shard_size = shard_size # None = un único prompt con todo el dataset
+        self.max_concurrency = max_concurrency
+        self.shard_retries = shard_retries
+        self.agent_options = agent_options # opciones extra para flowtask (hedge_model, hedge_delay, fallbacks...)
+
+    def _build_prompt(self, current_data_dict, modification_rules):
         current_json_string = json.dumps(current_data_dict, indent=4)
-        prompt = f"""
+        return f"""
         You are an AI assistant specialized in energy data manipulation.
         Your task is to modify the energy consumption values in the provided JSON data based on the following rules: '{modification_rules}'.
 
@@ -40,28 +61,177 @@ class ConsumptionModifier:
 
         Respond ONLY with the modified JSON data, without any introductory text, explanations, or markdown formatting like ```json ... ```.
         """
-        print(f"\n--- [Modifier] Enviando datos a {self.name} para modificación ---")
-        agent = flowtask(self.name, self.ai_model)
-        modified_data_string = await agent.add_instruction(prompt)
-        # Aumentar log en caso de sospecha de respuesta incompleta
-        print(f"\n--- [Modifier] Respuesta cruda de {self.name} (len: {len(modified_data_string)}):\n{modified_data_string[:500]}...")
+
+    def _build_delta_prompt(self, current_data_dict, modification_rules):
+        current_json_string = json.dumps(current_data_dict, separators=(",", ":"))
+        return f"""
+        You are an AI assistant specialized in energy data manipulation.
+        Your task is to modify the energy consumption values in the provided JSON data based on the following rules: '{modification_rules}'.
+
+        Here is the current energy consumption data:
+        {current_json_string}
+
+        Apply the modification rules to the consumption values for each house.
+        Ensure the final consumption values remain between 0.0 and 1.0 (inclusive).
+
+        Respond ONLY with the houses whose value CHANGES, using the same sector and house names, for example:
+        {{"Sector-A": {{"house-6": 0.4}}}}
+        Do not include houses that keep their value. If no house changes, respond with {{}}.
+        Do not add any introductory text, explanations, or markdown formatting like ```json ... ```.
+        """
+
+    def _apply_delta(self, current_data_dict, delta_dict):
+        """Parchea los cambios sobre una copia de los datos actuales. None si el delta trae casas desconocidas o valores fuera de [0, 1]."""
+        modified_data_dict = {sector: dict(houses) for sector, houses in current_data_dict.items() if isinstance(houses, dict)}
+        changed = 0
+        for sector, houses in delta_dict.items():
+            if not isinstance(houses, dict) or sector not in modified_data_dict:
+                print(f"--- [Modifier] Delta inválido: sector desconocido o mal formado ({sector}) ---")
+                return None
+            for house, value in houses.items():
+                if house not in modified_data_dict[sector]:
+                    print(f"--- [Modifier] Delta inválido: casa desconocida {sector}/{house} ---")
+                    return None
+                if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0.0 <= value <= 1.0:
+                    print(f"--- [Modifier] Delta inválido: valor fuera de rango para {sector}/{house}: {value!r} ---")
+                    return None
+                modified_data_dict[sector][house] = value
+                changed += 1
+        total = sum(len(houses) for houses in modified_data_dict.values())
+        print(f"--- [Modifier] Delta aplicado: {changed} de {total} casas cambiadas ---")
+        return modified_data_dict
+
+    async def stream_consumption(self, current_data_dict, modification_rules, parser):
+        """
+        Igual que modify_consumption pero en streaming: produce (sector, house, valor) en cuanto
+        cada valor llega completo. `parser` (IncrementalJSONParser) acumula el resultado completo.
+        El streaming siempre pide el dataset completo en un único prompt: los modos delta y por shards no aplican.
+        """
+        ignored = [mode for mode, active in (("delta", self.delta), ("shards", self.shard_size)) if active]
+        if ignored:
+            print(f"--- [Modifier] Streaming: se ignora el modo {' y '.join(ignored)} (un único prompt con todo el dataset) ---")
+        prompt = self._build_prompt(current_data_dict, modification_rules)
+        print(f"\n--- [Modifier] Enviando datos a {self.name} para modificación (streaming) ---")
+        cache = get_cache()
+        agent = flowtask(self.name, self.ai_model, cache=cache, **self.agent_options)
+        async for chunk in agent.stream(prompt):
+            for event in parser.feed(chunk):
+                yield event
+        if not parser.done:
+            self._discard(cache, agent, prompt) # JSON sin cerrar: no volver a servirlo desde la caché
+
+    async def modify_scenario(self, scenario, modification_rules):
+        """Modifica un Scenario con el LLM: devuelve un Scenario nuevo con los valores modificados, o None si falla."""
+        with tracer.span("modify", houses=len(scenario), delta=self.delta, sharded=bool(self.shard_size)) as span:
+            modified_data_dict = await self.modify_consumption(scenario.to_dict(decimals=2), modification_rules)
+            span.set(ok=isinstance(modified_data_dict, dict))
+        if not isinstance(modified_data_dict, dict):
+            return None
+        unknown = []
+        modified = scenario.values_from_dict(modified_data_dict, unknown)
+        if unknown:
+            # Casas o sectores inventados/renombrados por el modelo: se ignoran (la casa real queda sin valor y se valida después)
+            print(f"--- [Modifier] {len(unknown)} casas desconocidas en la respuesta (ignoradas), p.ej. {unknown[:3]} ---")
+            tracer.count("validation_unknown_houses_total", len(unknown))
+        return scenario.with_modified(modified)
+
+    async def modify_consumption(self, current_data_dict, modification_rules, use_cache=True):
+        """
+        Dict modificado por el LLM, o None si falla. use_cache=False pregunta siempre al modelo (re-peticiones de
+        reparación: el mismo prompt devolvería la misma respuesta inválida desde la caché).
+        """
+        if not isinstance(current_data_dict, dict):
+            print(f"Error en modify_consumption: Se esperaba un diccionario, se recibió {type(current_data_dict)}")
+            return None
+        if self.shard_size:
+            return await self._modify_sharded(current_data_dict, modification_rules, use_cache)
+        return await self._request_modification(current_data_dict, modification_rules, use_cache=use_cache)
+
+    def _split_shards(self, current_data_dict):
+        """Un shard por sector; los sectores grandes se parten en trozos de shard_size casas. Los sectores vacíos no generan petición."""
+        shards = []
+        for sector, houses in current_data_dict.items():
+            if not isinstance(houses, dict):
+                continue
+            items = list(houses.items())
+            for start in range(0, len(items), self.shard_size):
+                shards.append({sector: dict(items[start:start + self.shard_size])})
+        return shards
+
+    async def _modify_sharded(self, current_data_dict, modification_rules, use_cache=True):
+        shards = self._split_shards(current_data_dict)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        print(f"\n--- [Modifier] Modificación por shards: {len(shards)} shards, concurrencia máx. {self.max_concurrency} ---")
+
+        async def run_shard(number, shard):
+            for attempt in range(self.shard_retries + 1):
+                async with semaphore:
+                    result = await self._request_modification(shard, modification_rules, label=f"shard {number}", use_cache=use_cache)
+                if isinstance(result, dict):
+                    return result
+                print(f"--- [Modifier] Shard {number} falló (intento {attempt + 1}/{self.shard_retries + 1}) ---")
+            return None
+
+        results = await asyncio.gather(*(run_shard(number, shard) for number, shard in enumerate(shards, 1)))
+        failed = [number for number, result in enumerate(results, 1) if result is None]
+        if failed:
+            print(f"--- [Modifier] Shards sin respuesta válida tras los reintentos: {failed}. Devolviendo None.")
+            return None
+        # Unir los resultados respetando el orden original de sectores y casas (los sectores vacíos se conservan vacíos)
+        modified_data_dict = {sector: {} for sector, houses in current_data_dict.items() if isinstance(houses, dict)}
+        for result in results:
+            for sector, houses in result.items():
+                if isinstance(houses, dict):
+                    modified_data_dict.setdefault(sector, {}).update(houses)
+        return modified_data_dict
+
+    def _discard(self, cache, agent, prompt):
+        """Quita de la caché una respuesta rechazada, para que un reintento vuelva a preguntar al modelo."""
+        if cache is not None:
+            cache.discard(agent.answered_by or self.ai_model, prompt) # la clave es la del modelo que respondió
+
+    async def _request_modification(self, current_data_dict, modification_rules, label="dataset completo", use_cache=True):
+        if self.delta:
+            prompt = self._build_delta_prompt(current_data_dict, modification_rules)
+        else:
+            prompt = self._build_prompt(current_data_dict, modification_rules)
+        print(f"\n--- [Modifier] Enviando datos a {self.name} para modificación ({label}) ---")
+        # Mismos datos + mismas reglas => misma respuesta: se reutiliza desde la caché compartida
+        cache = get_cache() if use_cache else None
+        agent = flowtask(self.name, self.ai_model, cache=cache, **self.agent_options)
+        try:
+            with tracer.span("llm_request", agent=self.name, label=label, prompt_chars=len(prompt)):
+                modified_data_string = await agent.add_instruction(prompt)
+        except ProviderError as e:
+            # Ya se reintentó lo razonable (o el circuito está abierto): no bloquear más la regeneración
+            print(f"--- [Modifier] Error del proveedor: {e}. Devolviendo None.")
+            return None
         try:
-            modified_data_string = modified_data_string.strip()
-            if modified_data_string.startswith("```json"): modified_data_string = modified_data_string[7:]
-            if modified_data_string.endswith("```"): modified_data_string = modified_data_string[:-3]
-            modified_data_string = modified_data_string.strip()
-            if not modified_data_string.startswith("{") or not modified_data_string.endswith("}"):
-                 print(f"--- [Modifier] Error: Respuesta no parece ser un JSON válido (falta {{ o }}): {modified_data_string[:50]}...")
-                 return None
-            modified_data_dict = json.loads(modified_data_string)
-            print(f"\n--- [Modifier] Datos modificados por {self.name} (Parseados) ---")
+            # Tolera ```json, prosa alrededor y comas finales; de una respuesta truncada recupera los sectores completos
+            with tracer.span("parse", stage="modify", chars=len(modified_data_string)) as span:
+                modified_data_dict, complete = extract_json(modified_data_string)
+                span.set(complete=complete)
+            print(f"--- [Modifier] Datos modificados por {self.name} (parseados, {len(modified_data_string)} caracteres) ---")
+            if not complete:
+                self._discard(cache, agent, prompt) # no volver a servir la respuesta truncada en un reintento
+                tracer.count("json_salvaged_total", stage="modify")
+                if self.delta:
+                    # Un delta incompleto perdería cambios sin que se note: mejor reintentar
+                    print("--- [Modifier] Error: delta truncado. Devolviendo None.")
+                    return None
+                print(f"--- [Modifier] Respuesta truncada: se conservan {len(modified_data_dict)} sectores completos ---")
+            if self.delta:
+                modified_data_dict = self._apply_delta(current_data_dict, modified_data_dict) if isinstance(modified_data_dict, dict) else None
+                if modified_data_dict is None:
+                    self._discard(cache, agent, prompt)
             return modified_data_dict
         except json.JSONDecodeError as e:
             print(f"\n--- [Modifier] Error al decodificar JSON modificado por {self.name}: {e}")
-            print("--- [Modifier] Respuesta recibida que causó el error ---")
-            print(modified_data_string) # Imprimir toda la respuesta en caso de error JSON
+            print(f"--- [Modifier] Respuesta recibida que causó el error (len: {len(modified_data_string)}) ---")
+            print(modified_data_string[:500] + ('...' if len(modified_data_string) > 500 else ''))
             print("---------------------------------------------")
             print("--- [Modifier] Devolviendo None debido a error en modificación.")
+            self._discard(cache, agent, prompt)
             return None
         except Exception as e:
             print(f"\n--- [Modifier] Ocurrió un error inesperado durante la modificación: {e}")
@@ -72,9 +242,31 @@ class ConsumptionModifier:
 
 # --- Clase Energy_manager (Modificada para devolver ambos data sets) ---
 class Energy_manager:
-    def __init__(self, global_name):
+    def __init__(self, global_name, ai_model="gemini-2.0-flash", hedge_model=None, hedge_delay=2.0, fallback_models=(), streaming=False,
+                 modifier_mode="llm", data_source="llm", local_options=None, modifier_options=None,
+                 prefetch_depth=0, prefetch_token_budget=None, repair_rounds=1):
         self.name = global_name
-        self.modifier = ConsumptionModifier("Consumption Modifier Agent", "gemini-2.0-flash")
+        self.ai_model = ai_model
+        self.streaming = streaming # si True, los valores modificados se emiten casa a casa mientras llegan
+        # "llm": siempre el modelo | "rules": motor de reglas local (NumPy) | "auto": reglas si se pueden compilar, si no el LLM
+        self.modifier_mode = modifier_mode
+        self._compiled_rules = (None, None) # (texto de reglas, RuleEngine o None) para no recompilar en cada escenario
+        # Origen de los datos iniciales: "llm" (gen_data) | "local" (gen_cons.gen_arrays, opciones en local_options)
+        self.data_source = data_source
+        self.local_options = local_options or {}
+        # Hedging/fallback (opcional): p.ej. hedge_model="gemma-3-27b-it" recorta la latencia de cola del modelo principal
+        # validator: una respuesta sin objeto JSON cuenta como fallo (no gana el hedge ni se guarda en la caché)
+        self.agent_options = {"hedge_model": hedge_model, "hedge_delay": hedge_delay, "fallbacks": tuple(fallback_models),
+                              "validator": is_json_object}
+        # modifier_options: p.ej. {"shard_size": 50, "max_concurrency": 4} para modificar por shards en paralelo
+        self.modifier = ConsumptionModifier("Consumption Modifier Agent", ai_model, **(modifier_options or {}), **self.agent_options)
+        # Precarga especulativa (prefetch_depth > 0): next_scenario() saca escenarios ya generados en segundo plano.
+        # prefetch_token_budget limita los tokens estimados (respuestas del LLM) retenidos en el buffer.
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_token_budget = prefetch_token_budget
+        self._prefetch = None # (loop, PrefetchBuffer, texto de reglas con el que se generó)
+        # Validación tras el LLM: las casas sin valor o fuera de [0, 1] se vuelven a pedir solas hasta repair_rounds veces
+        self.repair_rounds = repair_rounds
         self.modification_rules = """Simulate a slight decrease (around - 0.1 and 0.6) system in consumption for all houses due to weather changes. Use this as the reference:
             < 0.3 its normal consumption, don't do anything
             >= 0.3 & <= 0.5 is starting to consume more than what it should, don't do anything
@@ -82,53 +274,135 @@ class Energy_manager:
             Ensure final values are between 0.0 and 1.0.
             """
 
-    async def generate_and_modify_data(self):
+    def rule_engine(self):
+        """RuleEngine compilado a partir de self.modification_rules, o None si son reglas libres."""
+        if self._compiled_rules[0] != self.modification_rules:
+            self._compiled_rules = (self.modification_rules, compile_rules(self.modification_rules))
+        return self._compiled_rules[1]
+
+    TOKENS_PER_VALUE = 6 # tokens aproximados de '"house-N": 0.xx,' en una respuesta JSON
+
+    def estimate_tokens(self, scenario):
+        """Tokens de salida del LLM (aprox.) que costó generar un escenario; 0 si todo fue local."""
+        llm_steps = int(self.data_source != "local")
+        if self.modifier_mode == "llm" or (self.modifier_mode == "auto" and self.rule_engine() is None):
+            llm_steps += 1
+        return len(scenario) * self.TOKENS_PER_VALUE * llm_steps
+
+    def prefetch_buffer(self):
+        """Buffer de precarga del event loop actual; se descarta si cambiaron las reglas de modificación."""
+        loop = asyncio.get_running_loop()
+        if self._prefetch is not None:
+            prefetch_loop, buffer, rules = self._prefetch
+            if prefetch_loop is loop and rules == self.modification_rules:
+                return buffer
+            if prefetch_loop is loop:
+                print("--- [Manager] Las reglas cambiaron: descartando escenarios precargados ---")
+                buffer.invalidate()
+        buffer = PrefetchBuffer(self.generate_and_modify_data, depth=self.prefetch_depth,
+                                token_budget=self.prefetch_token_budget, estimate_tokens=self.estimate_tokens)
+        self._prefetch = (loop, buffer, self.modification_rules)
+        return buffer
+
+    def prefetch_stats(self):
+        return self._prefetch[1].stats() if self._prefetch is not None else None
+
+    async def next_scenario(self, on_partial=None, progress=None):
+        """
+        Siguiente escenario para la visualización. Sin precarga equivale a generate_and_modify_data();
+        con prefetch_depth > 0 devuelve uno ya generado si lo hay y vuelve a llenar el buffer en segundo plano.
         """
-        Genera datos iniciales, los modifica y devuelve AMBOS: (initial_data, modified_data).
+        if not self.prefetch_depth:
+            return await self.generate_and_modify_data(on_partial, progress)
+        buffer = self.prefetch_buffer()
+        scenario = await buffer.get(lambda: self.generate_and_modify_data(on_partial, progress))
+        stats = buffer.stats()
+        print(f"--- [Manager] Prefetch: hits={stats['hits']} en curso={stats['inflight_hits']} misses={stats['misses']} "
+              f"listos={stats['ready']} precargando={stats['inflight']} ---")
+        return scenario
+
+    async def generate_and_modify_data(self, on_partial=None, progress=None):
+        """
+        Genera datos iniciales, los modifica y devuelve un Scenario con AMBOS (initial y modified).
         Devuelve None si ocurre un error en cualquier paso crítico.
+        Con streaming activo, `on_partial(StreamEvent)` recibe el escenario inicial y luego cada valor modificado según llega.
+        `progress(etapa)` (opcional) recibe un texto corto con la etapa en curso.
         """
+        with tracer.span("regeneration", source=self.data_source, modifier=self.modifier_mode, streaming=self.streaming) as span:
+            scenario = await self._generate_and_modify(on_partial, progress)
+            span.set(ok=scenario is not None)
+        tracer.count("regenerations_total", result="ok" if scenario is not None else "failed")
+        return scenario
+
+    async def _generate_and_modify(self, on_partial, progress):
         print("\n--- [Manager] Iniciando generación de nuevo escenario ---")
+        if progress is None:
+            progress = _no_progress
         initial_json_data = None
-        modified_json_data = None
         data_str = "N/A"
 
         try:
             # 1. Generar datos iniciales
-            data_str = await gen_data()
-            if not data_str or not isinstance(data_str, str):
-                 print("--- [Manager] Error: gen_data() no devolvió una cadena válida.")
-                 return None
-            print(f"--- [Manager] Raw data received (len: {len(data_str)}): {data_str[:100]}...")
-
-            # 2. Limpiar y parsear datos iniciales
-            data_str = data_str.strip()
-            if data_str.startswith("```json"): data_str = data_str[7:]
-            if data_str.endswith("```"): data_str = data_str[:-3]
-            data_str = data_str.strip()
-            if not data_str.startswith("{") or not data_str.endswith("}"):
-                 print(f"--- [Manager] Error: Datos iniciales no parecen JSON válido: {data_str[:50]}...")
-                 return None
-            initial_json_data = json.loads(data_str)
-            print("--- [Manager] Datos iniciales parseados ---")
+            progress("Generando datos iniciales...")
+            if self.data_source == "local":
+                # Generador local: arrays NumPy directamente al Scenario, sin red, parseo ni diccionarios
+                with tracer.span("generate", source="local"):
+                    scenario = Scenario.from_arrays(*gen_arrays(**self.local_options))
+                print(f"--- [Manager] Datos iniciales generados localmente ({len(scenario)} casas) ---")
+            else:
+                with tracer.span("generate", source="llm", model=self.ai_model):
+                    data_str = await gen_data(self.ai_model, **self.agent_options)
+                if not data_str or not isinstance(data_str, str):
+                     print("--- [Manager] Error: gen_data() no devolvió una cadena válida.")
+                     return None
+
+                # 2. Limpiar y parsear datos iniciales
+                with tracer.span("parse", stage="initial", chars=len(data_str)) as span:
+                    initial_json_data, complete = extract_json(data_str)
+                    if not isinstance(initial_json_data, dict):
+                        print("--- [Manager] Error: Datos iniciales parseados no son un diccionario.")
+                        return None
+                    scenario = Scenario.from_dict(initial_json_data)
+                    span.set(houses=len(scenario), complete=complete)
+                print(f"--- [Manager] Datos iniciales parseados ({len(scenario)} casas, {len(data_str)} caracteres) ---")
+                if not complete:
+                    # Mejor un escenario con los sectores que llegaron enteros que otra generación completa
+                    tracer.count("json_salvaged_total", stage="initial")
+                    print(f"--- [Manager] Respuesta truncada: se conservan {len(initial_json_data)} sectores completos ---")
+                if not len(scenario):
+                    print("--- [Manager] Error: Datos iniciales sin casas.")
+                    return None
 
             # 3. Modificar los datos
-            if isinstance(initial_json_data, dict):
-                 modified_json_data = await self.modifier.modify_consumption(
-                     initial_json_data, self.modification_rules
-                 )
-                 if modified_json_data:
-                     print("--- [Manager] Datos modificados exitosamente ---")
-                 else:
-                     # Si la modificación falla, no podemos devolver el par
-                     print("--- [Manager] Falló la modificación de datos.")
-                     return None
+            progress("Modificando consumos...")
+            engine = self.rule_engine() if self.modifier_mode != "llm" else None
+            if self.modifier_mode == "rules" and engine is None:
+                print("--- [Manager] Error: las reglas no se pueden compilar al motor local (modifier_mode='rules').")
+                return None
+            if engine is not None:
+                # Reglas de umbral: se aplican localmente sobre el array completo (sin ida y vuelta al LLM)
+                with tracer.span("modify", houses=len(scenario), engine="rules"):
+                    modified_scenario = scenario.with_modified(engine.apply_array(scenario.initial))
+            elif self.streaming and on_partial is not None:
+                modified_scenario = await self._stream_modification(scenario, on_partial)
             else:
-                print("--- [Manager] Error: Datos iniciales parseados no son un diccionario.")
+                modified_scenario = await self.modifier.modify_scenario(scenario, self.modification_rules)
+            if modified_scenario is None:
+                # Si la modificación falla, no podemos devolver el escenario
+                print("--- [Manager] Falló la modificación de datos.")
                 return None
+            if engine is None:
+                # La salida del LLM puede venir incompleta o fuera de rango: validar y parchear sólo lo inválido
+                progress("Validando consumos...")
+                modified_scenario = await self._validate_and_repair(modified_scenario)
+            print("--- [Manager] Datos modificados exitosamente ---")
 
-            # 4. Devolver AMBOS datasets si todo fue bien
-            return initial_json_data, modified_json_data
+            # 4. Devolver el escenario (inicial + modificado) si todo fue bien
+            return modified_scenario
 
+        except ProviderError as e:
+            print(f"\n--- [Manager] Error del proveedor al generar datos iniciales: {e}")
+            return None
         except json.JSONDecodeError as e:
             print(f"\n--- [Manager] Error al decodificar JSON INICIAL: {e}")
             print(f"--- [Manager] Datos recibidos (len: {len(data_str)}):")
@@ -141,36 +415,131 @@ class Energy_manager:
             return None
 
 
-# --- FUNCIÓN TARGET PARA EL HILO DE REGENERACIÓN (sin cambios) ---
-def _run_regeneration_async(manager, result_queue):
-    # ... (código existente sin cambios) ...
-    print("--- [Thread] Iniciando tarea asíncrona de regeneración... ---")
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        # generate_and_modify_data ahora devuelve una tupla (initial, modified) o None
-        result_tuple = loop.run_until_complete(manager.generate_and_modify_data())
-        loop.close()
-        print(f"--- [Thread] Tarea asíncrona completada. Resultado: {'Tupla de Datos' if result_tuple else 'None'} ---")
-        result_queue.put(result_tuple)
-    except Exception as e:
-        print(f"--- [Thread] Error en el hilo de regeneración: {e}")
-        traceback.print_exc()
-        result_queue.put(None)
-
-
-# --- FUNCIÓN DE INTERPOLACIÓN LINEAL (Lerp) ---
-def lerp(a, b, t):
-    """Interpola linealmente entre a y b usando t (0.0 a 1.0)."""
-    # Manejar casos donde a o b puedan ser None o no numéricos
-    if not isinstance(a, (int, float)): a = 0.0 # O algún valor por defecto
-    if not isinstance(b, (int, float)): b = a # Si b es inválido, no interpolar
-    t = max(0.0, min(1.0, t)) # Clamp t
-    return a + (b - a) * t
+    async def _validate_and_repair(self, scenario):
+        """
+        Comprueba el escenario modificado (casas sin valor, valores fuera de [0, 1]) y re-pide al modelo sólo esas casas.
+        Lo que siga fuera de rango tras repair_rounds intentos se recorta a [0, 1]; lo que siga faltando queda en NaN.
+        """
+        with tracer.span("validate", houses=len(scenario)) as span:
+            report = validate_scenario(scenario)
+            span.set(**report.summary())
+        for round_number in range(1, self.repair_rounds + 1):
+            if report.ok:
+                break
+            indices = report.indices()
+            print(f"--- [Manager] Validación: {report.summary()}. Re-pidiendo sólo {len(indices)} de {len(scenario)} casas "
+                  f"(intento {round_number}/{self.repair_rounds}) ---")
+            tracer.count("repair_requests_total")
+            with tracer.span("repair", houses=len(indices), round=round_number) as span:
+                # Sin caché: si una ronda deja las mismas casas inválidas, el prompt siguiente es idéntico
+                patch = await self.modifier.modify_consumption(subset_dict(scenario, indices), self.modification_rules, use_cache=False)
+                span.set(ok=isinstance(patch, dict))
+            if not isinstance(patch, dict):
+                break
+            scenario = scenario.with_modified(patch_values(scenario, indices, patch))
+            report = validate_scenario(scenario)
+            tracer.count("repaired_houses_total", len(indices) - int(report.invalid[indices].sum()))
+        if not report.ok:
+            summary = report.summary()
+            tracer.count("validation_failures_total", summary["missing"], kind="missing")
+            tracer.count("validation_failures_total", summary["out_of_range"], kind="out_of_range")
+            if summary["out_of_range"]:
+                scenario = scenario.with_modified(np.clip(scenario.modified, 0.0, 1.0))
+            print(f"--- [Manager] Validación sin reparar del todo: {summary} (fuera de rango recortado a [0, 1]) ---")
+        return scenario
+
+    async def simulate(self, scenario=None, ticks=None, **simulation_options):
+        """
+        Simulación temporal: generador asíncrono de un Scenario por tick (initial = consumo simulado, modified = tras las reglas).
+        La política se aplica en cada tick con el motor de reglas local (a miles de ticks por segundo no cabe una
+        llamada al LLM por tick), así que las reglas deben poder compilarse. Opciones: ver utils.simulation.Simulation.
+        """
+        engine = self.rule_engine()
+        if engine is None:
+            raise ValueError("Las reglas de modificación no se pueden compilar al motor local; la simulación necesita reglas de umbral.")
+        if scenario is None:
+            scenario = await self.next_scenario()
+            if scenario is None:
+                return
+        simulation = Simulation(scenario, policy=engine.apply_array, **simulation_options)
+        print(f"--- [Manager] Iniciando simulación: {len(scenario)} casas, {simulation.tick_hours} h por tick ---")
+        async for tick_scenario in simulation.run(ticks):
+            yield tick_scenario
+
+    async def _stream_modification(self, scenario, on_partial):
+        """Modificación en streaming: reenvía cada valor a on_partial y devuelve el Scenario completo (o None)."""
+        on_partial(StreamEvent("initial", data=scenario))
+        parser = IncrementalJSONParser()
+        try:
+            with tracer.span("modify", houses=len(scenario), streaming=True):
+                async for sector, house, value in self.modifier.stream_consumption(scenario.to_dict(decimals=2), self.modification_rules, parser):
+                    on_partial(StreamEvent("house", sector=sector, house=house, value=value))
+        except ProviderError as e:
+            print(f"--- [Manager] Error del proveedor durante el streaming: {e}")
+            return None
+        if not parser.done:
+            print("--- [Manager] Error: la respuesta en streaming terminó antes de cerrar el JSON (respuesta incompleta).")
+            return None
+        return scenario.with_modified(parser.data)
+
+
+def _no_progress(stage):
+    pass
+
+
+# --- Evento parcial de la regeneración en streaming (viaja por la misma cola que el resultado final) ---
+class StreamEvent:
+    def __init__(self, kind, data=None, sector=None, house=None, value=None):
+        # "initial": data = Scenario nuevo (sin valores modificados) | "house": valor modificado de una casa
+        # "progress": value = texto de la etapa en curso de la regeneración
+        self.kind = kind
+        self.data = data
+        self.sector = sector
+        self.house = house
+        self.value = value
+
+
+# --- ENVÍO DE LA REGENERACIÓN AL WORKER PERSISTENTE ---
+def _submit_regeneration(worker, manager, result_queue):
+    """
+    Encola una regeneración en el worker (un único loop y pool HTTP de larga vida) y devuelve su Future.
+    Por result_queue llegan los StreamEvent de progreso/parciales y, al terminar, el Scenario o None.
+    Si el trabajo se cancela porque otro lo reemplazó, no se publica nada.
+    """
+    def report_progress(stage):
+        result_queue.put(StreamEvent("progress", value=stage))
+
+    def on_done(future):
+        if future.cancelled():
+            print("--- [Worker] Regeneración cancelada (reemplazada por otra). ---")
+            return
+        error = future.exception()
+        result_scenario = None if error is not None else future.result()
+        print(f"--- [Worker] Regeneración completada. Resultado: {'Escenario' if result_scenario is not None else 'None'} ---")
+        tracer.start("queue_handoff", key=id(result_scenario)) # se cierra cuando la UI lo saca de la cola
+        result_queue.put(result_scenario)
+
+    future = worker.submit(manager.next_scenario, on_partial=result_queue.put, progress=report_progress)
+    future.add_done_callback(on_done)
+    return future
+
+
+def _present(value):
+    """None para NaN (valor ausente en el Scenario), el propio valor en otro caso."""
+    return None if value != value else value
 
 # --- FUNCIÓN DE VISUALIZACIÓN PYGAME MODIFICADA ---
-def visualize_data_pygame(initial_data_tuple, manager):
+def visualize_data_pygame(initial_scenario, manager, worker=None, headless=False, fps=60, scripted_events=None, frame_timer=None):
+    # headless: driver SDL "dummy" (superficie en memoria, sin ventana) para CI y benchmarks; fps=0 no limita los frames
+    # scripted_events(frame, time_ms) -> eventos extra por frame (repetir una sesión); frame_timer: tiempos por fase
+    if headless:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    timer = frame_timer or NULL_TIMER
     pygame.init()
+    # Worker persistente para las regeneraciones (si no se pasa uno, se crea y se cierra aquí)
+    owns_worker = worker is None
+    if owns_worker:
+        worker = RegenerationWorker()
 
     # --- Constantes ---
     INITIAL_SCREEN_WIDTH = 1200
@@ -203,25 +572,43 @@ def visualize_data_pygame(initial_data_tuple, manager):
     PULSE_FREQUENCY = 0.0035 # Ligeramente más rápido
     BRIGHTNESS_PULSE_AMPLITUDE = 0.35 # Un poco más pronunciado
     SIZE_PULSE_AMPLITUDE = 0.15 # Amplitud del pulso de tamaño (15%)
+    MAX_PULSE_RADIUS = int(BASE_HOUSE_RADIUS * (1 + SIZE_PULSE_AMPLITUDE)) + 1 # para las regiones que cambian cada frame
     ANIMATION_DURATION = 750 # Duración de la animación de transición (ms)
+    PANEL_GAP = 20 # separación entre los paneles inicial y modificado de los niveles "pixels" / "sectors"
+    STAT_NAMES = {"mean": "media", "max": "máximo", "p95": "p95"}
+    ZOOM_STEP = 1.25 # factor por paso de rueda (con Ctrl) o tecla +/-
+    PAN_STEP = 60 # píxeles por paso de rueda o flecha
+    LABEL_MIN_ZOOM = 0.75 # por debajo, las etiquetas no se leen: sólo títulos y círculos (y el tooltip al pasar el ratón)
+    HIGHLIGHT_COLOR = (255, 255, 255)
+    TOOLTIP_BACKGROUND = (60, 60, 60)
 
     # --- Estado ---
-    initial_display_data = None
-    modified_display_data = None # Estado *objetivo* actual
-    previous_modified_data = None # Estado *anterior* para la animación lerp
-    if isinstance(initial_data_tuple, tuple) and len(initial_data_tuple) == 2:
-        initial_display_data, modified_display_data = initial_data_tuple
+    # scenario.initial / scenario.modified (objetivo actual) / scenario.previous (estado anterior para la animación lerp)
+    scenario = None
+    if isinstance(initial_scenario, tuple) and len(initial_scenario) == 2:
+        initial_scenario = Scenario.from_dict(*initial_scenario) # compatibilidad con el formato (initial, modified)
+    if isinstance(initial_scenario, Scenario):
         # Al inicio, el estado anterior es igual al actual (sin animación inicial)
-        previous_modified_data = modified_display_data
+        scenario = initial_scenario
     else:
-        print("--- [Pygame] Error: Datos iniciales no son una tupla válida. ---")
+        print("--- [Pygame] Error: Datos iniciales no son un escenario válido. ---")
 
     is_loading = False
-    regeneration_thread = None
+    first_frame_pending = False # llegaron datos nuevos y aún no se presentó un frame con ellos
+    is_streaming = False # llegan valores parciales de la regeneración: mostrar casas en vez del overlay
+    regeneration_future = None # Future del trabajo en curso en el worker
+    loading_stage = None # último texto de progreso recibido
     result_queue = queue.Queue()
     last_error_message = None
     last_error_time = 0
     animation_start_time = None # Timestamp de cuándo empezó la última animación lerp
+    overlay_shown = False # el overlay de carga estaba visible en el frame anterior
+    lod_override = None # nivel de detalle forzado con la tecla L (None = automático según el número de casas)
+    sector_stat = STATS[0] # agregado de las baldosas de sector, se cambia con la tecla S
+    touched_houses = [] # casas con valores recibidos en streaming desde el último frame
+    hovered_house = None # casa bajo el ratón (índice plano), vía el índice espacial
+    selected_house = None # casa marcada con clic
+    dragging = False # arrastre con el botón derecho: desplaza la vista
 
     # --- Pantalla y Fuentes (SIN RESIZABLE explícito) ---
     screen_width, screen_height = INITIAL_SCREEN_WIDTH, INITIAL_SCREEN_HEIGHT
@@ -245,6 +632,46 @@ def visualize_data_pygame(initial_data_tuple, manager):
         font_status = pygame.font.Font(None, 28)
         font_legend = pygame.font.Font(None, 18)
 
+    # --- Caché de textos: en frames estables no se rasteriza ningún texto ---
+    text_cache = TextCache()
+    def render_text(font, text, color):
+        return text_cache.render(font, text, color)
+
+    # --- Layout precalculado: posiciones de todas las casas, recalculadas sólo con datos nuevos o al redimensionar ---
+    # Ancho de cada item calculado con BASE_HOUSE_RADIUS y un texto de ejemplo para un layout estable
+    example_text_width = font_house.size("house-XX: 0.00 / 0.00")[0]
+    item_pair_width = (BASE_HOUSE_RADIUS * 2) + PAIR_SPACING + (BASE_HOUSE_RADIUS * 2)
+    item_total_width = item_pair_width + TEXT_H_OFFSET + example_text_width + H_SPACING * 2
+    layout_engine = LayoutEngine(LayoutMetrics(
+        radius=BASE_HOUSE_RADIUS,
+        pair_spacing=PAIR_SPACING,
+        text_offset=TEXT_H_OFFSET,
+        item_width=item_total_width,
+        margin=MARGIN,
+        row_height=(BASE_HOUSE_RADIUS * 2) + V_SPACING * 2,
+        title_height=font_sector.size("Sector")[1],
+        title_gap=V_SPACING * 1.5,
+        empty_height=font_house.size("Error")[1],
+        empty_gap=V_SPACING,
+        sector_gap=SECTOR_V_SPACING,
+    ))
+
+    # --- Etiquetas de las casas (se rehacen sólo cuando cambian los datos) ---
+    house_labels = None
+    labels_scenario = None # escenario para el que se construyeron las etiquetas
+    def build_house_labels(scenario):
+        """Textos "house-N: inicial / modificado" de todas las casas; NaN (valor ausente) -> "N/A"."""
+        initial_values = scenario.initial.tolist()
+        target_values = scenario.modified.tolist()
+        labels = []
+        for i in range(len(scenario)):
+            initial_consumption = _present(initial_values[i])
+            target_modified_consumption = _present(target_values[i])
+            cons_text_initial = f"{initial_consumption:.2f}" if initial_consumption is not None else "N/A"
+            cons_text_modified_target = f"{target_modified_consumption:.2f}" if target_modified_consumption is not None else "N/A"
+            labels.append(f"{scenario.house_name(i)}: {cons_text_initial} / {cons_text_modified_target}")
+        return labels
+
 
     # --- Botón (posición dinámica) ---
     def get_button_rect(w, h):
@@ -256,39 +683,91 @@ def visualize_data_pygame(initial_data_tuple, manager):
         )
     button_rect = get_button_rect(screen_width, screen_height)
 
-    # --- Funciones de Color y Pulso (Modificada para devolver radio) ---
-    def get_color_for_consumption(value):
-        # ... (código existente sin cambios) ...
-        if not isinstance(value, (int, float)): return COLOR_INVALID
-        value = max(0.0, min(1.0, value))
-        if value <= 0.5:
-            ratio = value / 0.5
-            r = int(COLOR_LOW[0] * (1 - ratio) + COLOR_MEDIUM[0] * ratio)
-            g = int(COLOR_LOW[1] * (1 - ratio) + COLOR_MEDIUM[1] * ratio)
-            b = int(COLOR_LOW[2] * (1 - ratio) + COLOR_MEDIUM[2] * ratio)
-        else:
-            ratio = (value - 0.5) / 0.5
-            r = int(COLOR_MEDIUM[0] * (1 - ratio) + COLOR_HIGH[0] * ratio)
-            g = int(COLOR_MEDIUM[1] * (1 - ratio) + COLOR_HIGH[1] * ratio)
-            b = int(COLOR_MEDIUM[2] * (1 - ratio) + COLOR_HIGH[2] * ratio)
-        return (max(0, min(255, r)), max(0, min(255, g)), max(0, min(255, b)))
-
-
-    def get_pulsing_color_and_radius(base_color, time_ms, phase_offset=0):
-        """Calcula el color y radio pulsantes."""
-        if base_color == COLOR_INVALID:
-            return base_color, BASE_HOUSE_RADIUS # No pulsar colores/tamaños inválidos
-
-        # Factor de brillo (como antes, pero con constante)
-        brightness_factor = 1.0 + BRIGHTNESS_PULSE_AMPLITUDE * math.sin(time_ms * PULSE_FREQUENCY + phase_offset)
-        pulsed_color = tuple(max(0, min(255, int(c * brightness_factor))) for c in base_color)
-
-        # Factor de tamaño (nueva animación)
-        # Usar una frecuencia o fase ligeramente diferente para desincronizar
-        size_factor = 1.0 + SIZE_PULSE_AMPLITUDE * math.sin(time_ms * PULSE_FREQUENCY * 1.1 + phase_offset + math.pi / 3)
-        pulsed_radius = max(1, int(BASE_HOUSE_RADIUS * size_factor)) # Asegurar radio mínimo de 1
-
-        return pulsed_color, pulsed_radius
+    # --- Colores y pulsos: degradado precalculado (LUT) y una pasada NumPy por frame para todas las casas ---
+    pulse = Pulse(COLOR_LOW, COLOR_MEDIUM, COLOR_HIGH, COLOR_INVALID, radius=BASE_HOUSE_RADIUS, frequency=PULSE_FREQUENCY,
+                  brightness_amplitude=BRIGHTNESS_PULSE_AMPLITUDE, size_amplitude=SIZE_PULSE_AMPLITUDE)
+
+    # --- Capas: estática (fondo, leyenda, títulos, etiquetas), círculos por frame y overlay persistente ---
+    layers = LayeredScreen(screen)
+    static_layout = None # layout / etiquetas / estado con los que se pintó la capa estática
+    static_labels = None
+    static_waiting = None
+    static_level = None
+    static_stat = None
+
+    # --- Nivel de detalle: mapas de calor (píxel por casa o baldosa por sector) para escenarios grandes ---
+    heatmap = HeatmapRenderer(pulse, BACKGROUND_COLOR)
+    panel_title_height = font_sector.get_height() + V_SPACING
+    heatmap_scenario = None # escenario (y valores) con los que se pintaron los paneles por última vez
+    heatmap_dirty = True
+    def heatmap_area(w, h):
+        top = MARGIN + panel_title_height
+        return pygame.Rect(MARGIN, top, w - 2 * MARGIN, h - top - BUTTON_HEIGHT - 2 * BUTTON_MARGIN)
+
+    def paint_panel_titles(surface, scenario, level, stat):
+        modified_title = "Modificado" if level == LEVEL_PIXELS else f"Modificado ({STAT_NAMES[stat]} por sector)"
+        initial_title = "Consumo inicial" if level == LEVEL_PIXELS else f"Consumo inicial ({STAT_NAMES[stat]} por sector)"
+        for panel, title in zip(heatmap.panels, (initial_title, modified_title)):
+            surface.blit(render_text(font_sector, title, SECTOR_COLOR), (panel.x, panel.y - panel_title_height))
+        info = f"{len(scenario)} casas en {len(scenario.sectors)} sectores  [L] nivel: {level}  [S] agregado"
+        surface.blit(render_text(font_legend, info, TEXT_COLOR), (MARGIN, screen_height - BUTTON_MARGIN - BUTTON_HEIGHT // 2 - font_legend.get_height() // 2))
+
+    def draw_tile_names(scenario):
+        """Nombres de sector sobre las baldosas, sólo si caben (pocos sectores): se dibujan encima de los paneles."""
+        tiles = heatmap.sector_tiles(scenario)
+        if tiles.tile_h < font_house.get_height() + 4:
+            return
+        for panel in heatmap.panels:
+            for sector in range(tiles.shown):
+                name_surface = render_text(font_house, scenario.sectors[sector], BACKGROUND_COLOR)
+                x, y, w, _ = tiles.tile_rect(sector)
+                if name_surface.get_width() <= w - 4:
+                    screen.blit(name_surface, (panel.x + x + 2, panel.y + y + 2))
+
+    # --- Vista (pan/zoom) e índice espacial: cada frame sólo se tocan las casas visibles ---
+    viewport = Viewport(screen_width, screen_height)
+    house_grid = None # HouseIndex del layout actual
+    static_view = None # estado de la vista con el que se pintó la capa estática
+    title_height = font_sector.get_height()
+
+    def paint_static(surface, scenario, layout, labels, waiting, level=LEVEL_CIRCLES, stat=None, visible=()):
+        surface.fill(BACKGROUND_COLOR)
+        if scenario is None:
+            # ... (mensaje si los datos iniciales no son válidos, como antes) ...
+            status_msg = "Error inicial al cargar datos." if not waiting else "Esperando datos..."
+            status_surface = render_text(font_status, status_msg, COLOR_HIGH if not waiting else TEXT_COLOR)
+            surface.blit(status_surface, status_surface.get_rect(center=(screen_width // 2, screen_height // 2)))
+            return
+
+        # --- Leyenda (como antes) ---
+        legend_y = MARGIN // 2
+        legend_initial_text = render_text(font_legend, "Consumo Inicial /", TEXT_COLOR)
+        legend_modified_text = render_text(font_legend, "Modificado", TEXT_COLOR)
+        legend_x_start = screen_width - max(legend_initial_text.get_width(), legend_modified_text.get_width()) - MARGIN
+        surface.blit(legend_initial_text, (legend_x_start, legend_y))
+        surface.blit(legend_modified_text, (legend_x_start, legend_y + legend_initial_text.get_height() + 2))
+
+        if level != LEVEL_CIRCLES:
+            paint_panel_titles(surface, scenario, level, stat)
+            return
+
+        # Títulos, errores y etiquetas: sólo lo que cae dentro de la vista (coordenadas de mundo -> pantalla)
+        for sector_name, x, y in layout.sector_titles:
+            x, y = viewport.to_screen(x, y)
+            if -title_height < y < screen_height:
+                surface.blit(render_text(font_sector, sector_name, SECTOR_COLOR), (x, y))
+        for sector_name, x, y in layout.empty_sectors:
+            # Sector sin casas válidas
+            x, y = viewport.to_screen(x, y)
+            if -title_height < y < screen_height:
+                surface.blit(render_text(font_house, f"Error: Datos iniciales inválidos para {sector_name}", COLOR_HIGH), (x, y))
+
+        # Etiquetas (valor inicial y *target* modificado) desde la caché de superficies
+        if viewport.zoom >= LABEL_MIN_ZOOM:
+            _, _, center_y, text_x = layout.lists()
+            for house_index in visible:
+                text_surface = render_text(font_house, labels[house_index], TEXT_COLOR)
+                surface.blit(text_surface, text_surface.get_rect(midleft=viewport.to_screen(text_x[house_index], center_y[house_index])))
 
     # --- Bucle Principal ---
     running = True
@@ -297,7 +776,8 @@ def visualize_data_pygame(initial_data_tuple, manager):
     while running:
         time_ms = pygame.time.get_ticks()
         mouse_pos = pygame.mouse.get_pos()
-        delta_time = clock.tick(60) # Limita FPS y obtiene tiempo delta (no usado aquí, pero útil)
+        delta_time = clock.tick(fps) # Limita FPS (0 = sin límite) y obtiene tiempo delta (no usado aquí, pero útil)
+        timer.start_frame() # la espera del limitador no cuenta como coste del frame
 
         # --- Calcular Progreso de Animación Lerp ---
         animation_progress = 1.0 # Por defecto, animación completada
@@ -309,38 +789,67 @@ def visualize_data_pygame(initial_data_tuple, manager):
                 # Animación completada
                 animation_start_time = None
                 # Asegurarse que el estado 'previous' se actualice al final
-                previous_modified_data = modified_display_data
+                if scenario is not None:
+                    scenario.previous = scenario.modified
+                heatmap_dirty = True # último frame de la transición en los mapas de calor
 
 
-        # --- Comprobar resultado del hilo ---
-        if regeneration_thread and not regeneration_thread.is_alive():
+        # --- Comprobar resultado del trabajo en el worker ---
+        if regeneration_future and regeneration_future.done():
              is_loading = False
-             regeneration_thread = None
+             regeneration_future = None
 
         try:
-            new_data_tuple = result_queue.get_nowait()
-            if isinstance(new_data_tuple, tuple) and len(new_data_tuple) == 2:
-                new_initial, new_modified = new_data_tuple
-                # Iniciar animación: el estado actual se convierte en el 'previous'
-                previous_modified_data = modified_display_data
-                initial_display_data = new_initial
-                modified_display_data = new_modified # Este es el nuevo *objetivo*
-                animation_start_time = time_ms # Iniciar temporizador de animación
-                print("--- [Pygame] Nuevos datos recibidos. Iniciando animación de transición. ---")
-                last_error_message = None
-            elif new_data_tuple is None:
-                # ... (manejo de error como antes) ...
-                print("--- [Pygame] Fallo al regenerar datos (recibido None). La visualización no se actualizó. ---")
-                last_error_message = "Error al regenerar datos"
-                last_error_time = time_ms
+            # Vaciar la cola completa: en streaming pueden llegar muchos valores por frame
+            while True:
+                new_data = result_queue.get_nowait()
+                if isinstance(new_data, StreamEvent):
+                    if new_data.kind == "progress":
+                        loading_stage = new_data.value
+                    elif new_data.kind == "initial":
+                        # Empiezan a llegar datos nuevos: mostrar las casas ya, sin valores modificados aún (NaN)
+                        scenario = new_data.data
+                        animation_start_time = None
+                        is_streaming = True
+                        tracer.finish("click_to_data", key="ui", streaming=True)
+                        tracer.start("first_frame", key="ui", streaming=True)
+                        first_frame_pending = True
+                    elif new_data.kind == "house" and scenario is not None:
+                        house_index = scenario.index(new_data.sector, new_data.house)
+                        if house_index is not None:
+                            scenario.modified[house_index] = new_data.value if isinstance(new_data.value, (int, float)) else np.nan
+                            house_labels = None # cambió un valor modificado: rehacer etiquetas
+                            touched_houses.append(house_index)
+                elif isinstance(new_data, Scenario):
+                    tracer.finish("queue_handoff", key=id(new_data))
+                    if not is_streaming:
+                        tracer.finish("click_to_data", key="ui", streaming=False)
+                        tracer.start("first_frame", key="ui", streaming=False, houses=len(new_data))
+                        first_frame_pending = True
+                    # Iniciar animación: el objetivo actual (alineado casa a casa) se convierte en el 'previous'
+                    if scenario is not None:
+                        new_data.previous = new_data.values_from(scenario, "modified")
+                    scenario = new_data # Este es el nuevo *objetivo*
+                    animation_start_time = time_ms # Iniciar temporizador de animación
+                    print("--- [Pygame] Nuevos datos recibidos. Iniciando animación de transición. ---")
+                    last_error_message = None
+                    is_streaming = False
+                elif new_data is None:
+                    tracer.finish("queue_handoff", key=id(None))
+                    tracer.finish("click_to_data", key="ui", failed=True)
+                    # ... (manejo de error como antes) ...
+                    print("--- [Pygame] Fallo al regenerar datos (recibido None). La visualización no se actualizó. ---")
+                    last_error_message = "Error al regenerar datos"
+                    last_error_time = time_ms
+                    is_streaming = False
 
-            else:
-                 # ... (manejo de error como antes) ...
-                 print(f"--- [Pygame] Error: Se recibió un tipo inesperado de la cola: {type(new_data_tuple)} ---")
-                 last_error_message = "Error interno procesando datos"
-                 last_error_time = time_ms
+                else:
+                     # ... (manejo de error como antes) ...
+                     print(f"--- [Pygame] Error: Se recibió un tipo inesperado de la cola: {type(new_data)} ---")
+                     last_error_message = "Error interno procesando datos"
+                     last_error_time = time_ms
 
-            result_queue.task_done()
+                result_queue.task_done()
         except queue.Empty:
             pass
         except Exception as e:
@@ -351,7 +860,10 @@ def visualize_data_pygame(initial_data_tuple, manager):
 
 
         # --- Manejo de Eventos ---
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        if scripted_events is not None:
+            events += scripted_events(layers.frames, time_ms)
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
             # Manejo de Redimensionamiento (útil aunque no usemos RESIZABLE explícito)
@@ -359,174 +871,227 @@ def visualize_data_pygame(initial_data_tuple, manager):
                 screen_width, screen_height = event.w, event.h
                 # Recrear screen SÓLO si es necesario (puede causar parpadeo)
                 # screen = pygame.display.set_mode((screen_width, screen_height)) # Podría ser necesario si el contenido no se redibuja bien
-                button_rect = get_button_rect(screen_width, screen_height)
+                button_rect = get_button_rect(screen_width, screen_height) # el layout se recalcula solo al cambiar el ancho
+                viewport.resize(screen_width, screen_height)
+                layers.resize(screen)
                 print(f"--- [Pygame] Evento VIDEORESIZE detectado: {screen_width}x{screen_height} ---")
-            # ... (Manejo de Clic como antes) ...
-            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                if button_rect.collidepoint(mouse_pos) and not is_loading:
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_l:
+                # Ciclo automático -> circles -> pixels -> sectors -> automático
+                options = (None,) + LEVELS
+                lod_override = options[(options.index(lod_override) + 1) % len(options)]
+                print(f"--- [Pygame] Nivel de detalle: {lod_override or 'automático'} ---")
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_s:
+                sector_stat = STATS[(STATS.index(sector_stat) + 1) % len(STATS)]
+                heatmap_dirty = True
+                print(f"--- [Pygame] Agregado por sector: {sector_stat} ---")
+            # Vista: rueda = desplazar, Ctrl+rueda o +/- = zoom, flechas = desplazar, arrastre con botón derecho, Inicio = reset
+            elif event.type == pygame.MOUSEWHEEL:
+                if pygame.key.get_mods() & pygame.KMOD_CTRL:
+                    viewport.zoom_at(ZOOM_STEP ** event.y, *mouse_pos)
+                else:
+                    viewport.pan(event.x * PAN_STEP, event.y * PAN_STEP)
+            elif event.type == pygame.KEYDOWN and event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                viewport.zoom_at(ZOOM_STEP, screen_width / 2, screen_height / 2)
+            elif event.type == pygame.KEYDOWN and event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                viewport.zoom_at(1 / ZOOM_STEP, screen_width / 2, screen_height / 2)
+            elif event.type == pygame.KEYDOWN and event.key in (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN):
+                viewport.pan(PAN_STEP * ((event.key == pygame.K_LEFT) - (event.key == pygame.K_RIGHT)),
+                             PAN_STEP * ((event.key == pygame.K_UP) - (event.key == pygame.K_DOWN)))
+            elif event.type == pygame.KEYDOWN and event.key in (pygame.K_HOME, pygame.K_0):
+                viewport.reset()
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
+                dragging = True
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 3:
+                dragging = False
+            elif event.type == pygame.MOUSEMOTION and dragging:
+                viewport.pan(*event.rel)
+            # ... (Manejo de Clic como antes; la tecla R equivale al botón) ...
+            elif ((event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and button_rect.collidepoint(event.pos))
+                  or (event.type == pygame.KEYDOWN and event.key == pygame.K_r)):
+                if not is_loading:
                     print("--- [Pygame] Botón 'Regenerar' presionado! ---")
                     is_loading = True
+                    is_streaming = False
                     last_error_message = None
                     # Asegurarse que la animación actual se detenga si se regenera rápido
                     animation_start_time = None
-                    regeneration_thread = threading.Thread(
-                        target=_run_regeneration_async,
-                        args=(manager, result_queue),
-                        daemon=True
-                    )
-                    regeneration_thread.start()
-
-
-        # --- Dibujo ---
-        screen.fill(BACKGROUND_COLOR)
-
-        # Dibujar contenido solo si tenemos datos válidos
-        # Necesitamos initial, modified (target), y previous_modified
-        if isinstance(initial_display_data, dict) and \
-           isinstance(modified_display_data, dict) and \
-           isinstance(previous_modified_data, dict):
-
-            current_y = MARGIN
-            house_index = 0
-
-            # --- Leyenda (como antes) ---
-            legend_y = MARGIN // 2
-            legend_initial_text = font_legend.render("Consumo Inicial /", True, TEXT_COLOR)
-            legend_modified_text = font_legend.render("Modificado", True, TEXT_COLOR)
-            legend_x_start = screen_width - max(legend_initial_text.get_width(), legend_modified_text.get_width()) - MARGIN
-            screen.blit(legend_initial_text, (legend_x_start, legend_y))
-            screen.blit(legend_modified_text, (legend_x_start, legend_y + legend_initial_text.get_height() + 2))
-
-
-            for sector_name, initial_houses_dict in initial_display_data.items():
-                # ... (dibujar nombre de sector como antes) ...
-                sector_text_surface = font_sector.render(sector_name, True, SECTOR_COLOR)
-                screen.blit(sector_text_surface, (MARGIN, current_y))
-                current_y += sector_text_surface.get_height() + V_SPACING * 1.5
-
-
-                # Obtener diccionarios correspondientes del estado target y previous
-                target_modified_houses = modified_display_data.get(sector_name, {})
-                prev_modified_houses = previous_modified_data.get(sector_name, {})
-
-                if isinstance(initial_houses_dict, dict):
-                    current_x = MARGIN + BASE_HOUSE_RADIUS # Centro del primer círculo
-                    items_in_row = 0
-
-                    # Calcular ancho item usando BASE_HOUSE_RADIUS para layout estable
-                    example_text_width = font_house.render("house-XX: 0.00 / 0.00", True, TEXT_COLOR).get_width()
-                    item_pair_width = (BASE_HOUSE_RADIUS * 2) + PAIR_SPACING + (BASE_HOUSE_RADIUS * 2)
-                    item_total_width = item_pair_width + TEXT_H_OFFSET + example_text_width + H_SPACING * 2
-                    max_items_per_row = (screen_width - 2 * MARGIN) // item_total_width
-                    if max_items_per_row < 1: max_items_per_row = 1
-
-                    for house_name, initial_consumption in initial_houses_dict.items():
-                        # Obtener valores target y previous para la animación
-                        target_modified_consumption = target_modified_houses.get(house_name, None)
-                        prev_modified_consumption = prev_modified_houses.get(house_name, target_modified_consumption) # Fallback al target si no hay previous
-
-                        # --- Calcular valor interpolado para el segundo círculo ---
-                        interpolated_modified_consumption = lerp(
-                            prev_modified_consumption,
-                            target_modified_consumption,
-                            animation_progress
-                        )
-
-                        # Calcular posiciones (basadas en BASE_HOUSE_RADIUS para estabilidad)
-                        initial_circle_center_x = current_x
-                        modified_circle_center_x = current_x + BASE_HOUSE_RADIUS + PAIR_SPACING + BASE_HOUSE_RADIUS
-                        circle_center_y = current_y + BASE_HOUSE_RADIUS
-
-                        # Obtener colores base (inicial y el *interpolado* modificado)
-                        initial_base_color = get_color_for_consumption(initial_consumption)
-                        interpolated_modified_base_color = get_color_for_consumption(interpolated_modified_consumption)
-
-                        # Obtener colores y radios pulsantes
-                        initial_pulsed_color, initial_pulsed_radius = get_pulsing_color_and_radius(
-                            initial_base_color, time_ms, house_index * 0.5
-                        )
-                        modified_pulsed_color, modified_pulsed_radius = get_pulsing_color_and_radius(
-                            interpolated_modified_base_color, time_ms, house_index * 0.5 + math.pi / 4
-                        )
-
-                        # Dibujar círculos con radios pulsantes
-                        pygame.draw.circle(screen, initial_pulsed_color, (initial_circle_center_x, circle_center_y), initial_pulsed_radius)
-                        pygame.draw.circle(screen, modified_pulsed_color, (modified_circle_center_x, circle_center_y), modified_pulsed_radius)
-
-                        # Preparar y dibujar texto (mostrar valor inicial y *target* modificado)
-                        cons_text_initial = f"{initial_consumption:.2f}" if isinstance(initial_consumption, (int, float)) else "N/A"
-                        cons_text_modified_target = f"{target_modified_consumption:.2f}" if isinstance(target_modified_consumption, (int, float)) else "N/A"
-                        house_info = f"{house_name}: {cons_text_initial} / {cons_text_modified_target}"
-                        text_surface = font_house.render(house_info, True, TEXT_COLOR)
-                        # Posicionar texto a la derecha del par (usando BASE_HOUSE_RADIUS para pos fija)
-                        text_rect = text_surface.get_rect(midleft=(current_x + BASE_HOUSE_RADIUS + PAIR_SPACING + BASE_HOUSE_RADIUS + TEXT_H_OFFSET, circle_center_y))
-                        screen.blit(text_surface, text_rect)
-
-                        # ... (actualizar current_x, items_in_row, house_index como antes) ...
-                        current_x += item_total_width
-                        items_in_row += 1
-                        house_index += 1
-
-                        # Nueva fila
-                        if items_in_row >= max_items_per_row:
-                            current_x = MARGIN + BASE_HOUSE_RADIUS
-                            current_y += (BASE_HOUSE_RADIUS * 2) + V_SPACING * 2
-                            items_in_row = 0
-
-
-                    # ... (mover current_y si la fila no estaba llena, como antes) ...
-                    if items_in_row > 0:
-                        current_y += (BASE_HOUSE_RADIUS * 2) + V_SPACING * 2
-
-                else:
-                    # ... (manejo de error si initial_houses_dict no es dict) ...
-                    error_text = font_house.render(f"Error: Datos iniciales inválidos para {sector_name}", True, COLOR_HIGH)
-                    screen.blit(error_text, (MARGIN + 10, current_y))
-                    current_y += error_text.get_height() + V_SPACING
-
-
-                current_y += SECTOR_V_SPACING
-        else:
-            # ... (mensaje si los datos iniciales no son válidos, como antes) ...
-            status_msg = "Error inicial al cargar datos." if not initial_display_data else "Esperando datos..."
-            status_surface = font_status.render(status_msg, True, COLOR_HIGH if not initial_display_data else TEXT_COLOR)
-            status_rect = status_surface.get_rect(center=(screen_width // 2, screen_height // 2))
-            screen.blit(status_surface, status_rect)
-
+                    loading_stage = None
+                    tracer.start("click_to_data", key="ui")
+                    regeneration_future = _submit_regeneration(worker, manager, result_queue)
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and hovered_house is not None:
+                selected_house = None if selected_house == hovered_house else hovered_house
+                if selected_house is not None and house_labels is not None:
+                    print(f"--- [Pygame] Casa seleccionada: {house_labels[selected_house]} ---")
+
+
+        timer.mark("events")
+
+        # --- Dibujo por capas ---
+        # Nivel de detalle: círculos con etiqueta para pocas casas; mapas de calor (coste según píxeles) para muchas
+        layout = None
+        level = None
+        visible = None # casas visibles en la vista (índices planos ordenados)
+        hovered_house = None
+        if scenario is not None:
+            heatmap.set_area(heatmap_area(screen_width, screen_height), PANEL_GAP)
+            level = heatmap.choose_level(scenario, zoom=viewport.zoom, preferred=lod_override)
+        if level == LEVEL_CIRCLES:
+            if house_labels is None or labels_scenario is not scenario:
+                timer.mark("layout")
+                house_labels = build_house_labels(scenario)
+                labels_scenario = scenario
+                timer.mark("text")
+            layout = layout_engine.get(scenario, screen_width)
+            if house_grid is None or house_grid.layout is not layout:
+                house_grid = HouseIndex(layout, MAX_PULSE_RADIUS)
+                if selected_house is not None and selected_house >= len(layout):
+                    selected_house = None
+            viewport.clamp(layout.width, layout.height)
+            visible = house_grid.visible(*viewport.world_bounds())
+            hovered_house = house_grid.house_at(*viewport.to_world(*mouse_pos))
+        elif level is not None:
+            if touched_houses and heatmap_scenario is scenario:
+                heatmap.aggregates(scenario).update("modified", touched_houses) # sólo los sectores que cambiaron
+            if touched_houses or heatmap_scenario is not scenario:
+                heatmap_dirty = True
+        touched_houses.clear()
+        timer.mark("layout")
+
+        # Capa estática: se repinta sólo con datos/etiquetas nuevos o al redimensionar (fuerza un frame completo)
+        waiting = scenario is None and is_loading
+        if (layers.full_redraw or layout is not static_layout or house_labels is not static_labels or waiting != static_waiting
+                or level != static_level or (level == LEVEL_SECTORS and sector_stat != static_stat)
+                or (level == LEVEL_CIRCLES and viewport.state() != static_view)):
+            visible_list = visible.tolist() if visible is not None else ()
+            layers.repaint_static(lambda surface: paint_static(surface, scenario, layout, house_labels, waiting, level, sector_stat, visible_list))
+            static_layout, static_labels, static_waiting = layout, house_labels, waiting
+            static_level, static_stat, static_view = level, sector_stat, viewport.state()
+
+        # Overlay de carga: al aparecer o desaparecer cambia toda la pantalla
+        show_overlay = is_loading and not is_streaming and scenario is not None
+        if show_overlay != overlay_shown:
+            layers.full_redraw = True
+            overlay_shown = show_overlay
+        if show_overlay and level not in (None, LEVEL_CIRCLES):
+            layers.full_redraw = True # los paneles ocupan casi toda la pantalla: frame completo mientras dure la carga
+
+        # --- Mensaje de Estado/Error Temporal (se decide antes para incluir su región en las que cambian) ---
+        status_surface = None
+        status_rect_center_x = screen_width // 2 # Centrar mensajes de estado
+        if is_loading and is_streaming:
+             status_surface = render_text(font_status, "Recibiendo escenario...", TEXT_COLOR)
+             status_rect = status_surface.get_rect(midbottom=(status_rect_center_x, screen_height - BUTTON_MARGIN * 2 - BUTTON_HEIGHT))
+        elif show_overlay:
+             status_surface = render_text(font_status, loading_stage or "Cargando nuevo escenario...", TEXT_COLOR)
+             status_rect = status_surface.get_rect(center=(status_rect_center_x, screen_height // 2))
+        elif last_error_message and time_ms - last_error_time < 5000:
+             status_surface = render_text(font_status, last_error_message, COLOR_HIGH)
+             # Posicionar error cerca del botón pero centrado horizontalmente
+             status_rect = status_surface.get_rect(midbottom=(status_rect_center_x, screen_height - BUTTON_MARGIN * 2 - BUTTON_HEIGHT))
 
-        # --- Dibujar Botón y Mensaje de Estado/Error (como antes) ---
-        # ... (código existente para dibujar botón y mensajes de loading/error) ...
+        # Posiciones en pantalla de las casas visibles (el resto ni se colorea ni se dibuja)
+        current_regions = []
+        highlighted = []
+        if layout is not None:
+            initial_sx, center_sy = viewport.to_screen(layout.initial_x[visible], layout.center_y[visible])
+            modified_sx = (layout.modified_x[visible] - viewport.offset_x) * viewport.zoom
+            pulse_radius = int(math.ceil(MAX_PULSE_RADIUS * viewport.zoom))
+            ring_radius = pulse_radius + 2
+            # Regiones que cambian en este frame: filas de círculos visibles, anillos de resaltado, botón y mensaje de estado
+            current_regions = row_rects(initial_sx, modified_sx, center_sy, pulse_radius)
+            highlighted = [house for house in (hovered_house, selected_house) if house is not None]
+            for house in highlighted:
+                left, y = viewport.to_screen(layout.initial_x[house], layout.center_y[house])
+                right = (layout.modified_x[house] - viewport.offset_x) * viewport.zoom
+                current_regions.append(pygame.Rect(int(left) - ring_radius - 2, int(y) - ring_radius - 2,
+                                                   int(right - left) + 2 * ring_radius + 5, 2 * ring_radius + 5))
+        current_regions.append(button_rect)
+        if status_surface is not None:
+            current_regions.append(status_rect)
+        # Tooltip de la casa bajo el ratón
+        tooltip_surface = None
+        if hovered_house is not None:
+            sector_index = int(np.searchsorted(scenario.sector_offsets, hovered_house, side="right")) - 1
+            tooltip_surface = render_text(font_legend, f"{scenario.sectors[sector_index]} / {house_labels[hovered_house]}", TEXT_COLOR)
+            tooltip_rect = tooltip_surface.get_rect(topleft=(mouse_pos[0] + 14, mouse_pos[1] + 14)).inflate(8, 6)
+            tooltip_rect.clamp_ip(screen.get_rect())
+            current_regions.append(tooltip_rect)
+        timer.mark("text")
+
+        # Colores y radios pulsantes (inicial e *interpolado* modificado, desfasado pi/4) de las casas visibles
+        if layout is not None:
+            zoom = viewport.zoom
+            initial_colors, initial_radii = pulse.compute(scenario.initial[visible], time_ms, indices=visible, scale=zoom)
+            modified_colors, modified_radii = pulse.compute(scenario.interpolated(animation_progress, visible), time_ms, math.pi / 4,
+                                                            indices=visible, scale=zoom)
+            initial_colors, initial_radii = initial_colors.tolist(), initial_radii.tolist()
+            modified_colors, modified_radii = modified_colors.tolist(), modified_radii.tolist()
+            initial_x, modified_x, center_y = initial_sx.tolist(), modified_sx.tolist(), center_sy.tolist()
+        timer.mark("colour")
+
+        # Los paneles se vuelven a pintar sólo si cambian sus valores o si la capa estática los tapó (frame completo o
+        # una región restaurada encima, p.ej. el mensaje de estado); no entran en current_regions
+        full_frame = layers.full_redraw
+        regions = layers.begin(current_regions, merge=show_overlay)
+        render_heatmap = level not in (None, LEVEL_CIRCLES) and (
+            heatmap_dirty or animation_start_time is not None or full_frame
+            or any(panel.collidelist(regions) != -1 for panel in heatmap.panels))
+        if render_heatmap:
+            regions += heatmap.render(screen, scenario, level, animation_progress, sector_stat)
+            if level == LEVEL_SECTORS:
+                draw_tile_names(scenario)
+            heatmap_scenario = scenario
+            heatmap_dirty = False
+
+        # Capa dinámica: círculos pulsantes
+        if layout is not None:
+            # Pasada directa sobre las posiciones en pantalla (i = posición dentro de las casas visibles)
+            for i in range(len(visible)):
+                circle_center_y = center_y[i]
+                pygame.draw.circle(screen, initial_colors[i], (initial_x[i], circle_center_y), initial_radii[i])
+                pygame.draw.circle(screen, modified_colors[i], (modified_x[i], circle_center_y), modified_radii[i])
+
+            # Casa bajo el ratón y casa seleccionada: anillo alrededor de ambos círculos
+            for house in highlighted:
+                center = viewport.to_screen(layout.initial_x[house], layout.center_y[house])
+                pygame.draw.circle(screen, HIGHLIGHT_COLOR, center, ring_radius, 2)
+                pygame.draw.circle(screen, HIGHLIGHT_COLOR, ((layout.modified_x[house] - viewport.offset_x) * zoom, center[1]), ring_radius, 2)
+
+        # --- Dibujar Botón (como antes) ---
         button_active = not is_loading
         btn_color = BUTTON_DISABLED_COLOR
         if button_active:
             btn_color = BUTTON_HOVER_COLOR if button_rect.collidepoint(mouse_pos) else BUTTON_COLOR
         pygame.draw.rect(screen, btn_color, button_rect, border_radius=5)
         button_text = "Regenerar" if button_active else "Cargando..."
-        button_text_surface = font_button.render(button_text, True, BUTTON_TEXT_COLOR)
+        button_text_surface = render_text(font_button, button_text, BUTTON_TEXT_COLOR)
         button_text_rect = button_text_surface.get_rect(center=button_rect.center)
         screen.blit(button_text_surface, button_text_rect)
 
-        # --- Dibujar Mensaje de Estado/Error Temporal ---
-        status_rect_center_x = screen_width // 2 # Centrar mensajes de estado
-        if is_loading:
-             status_surface = font_status.render("Cargando nuevo escenario...", True, TEXT_COLOR)
-             status_rect = status_surface.get_rect(center=(status_rect_center_x, screen_height // 2))
-             overlay = pygame.Surface((screen_width, screen_height), pygame.SRCALPHA)
-             overlay.fill((0, 0, 0, 128))
-             screen.blit(overlay, (0, 0))
-             screen.blit(status_surface, status_rect)
-        elif last_error_message and time_ms - last_error_time < 5000:
-             status_surface = font_status.render(last_error_message, True, COLOR_HIGH)
-             # Posicionar error cerca del botón pero centrado horizontalmente
-             status_rect = status_surface.get_rect(midbottom=(status_rect_center_x, screen_height - BUTTON_MARGIN * 2 - BUTTON_HEIGHT))
-             screen.blit(status_surface, status_rect)
+        if tooltip_surface is not None:
+            pygame.draw.rect(screen, TOOLTIP_BACKGROUND, tooltip_rect, border_radius=3)
+            screen.blit(tooltip_surface, tooltip_surface.get_rect(center=tooltip_rect.center))
 
+        # Overlay persistente (sólo sobre las regiones que cambian, salvo en frames completos)
+        if show_overlay:
+            layers.apply_overlay(regions)
+        if status_surface is not None:
+            screen.blit(status_surface, status_rect)
 
-        # --- Actualizar Pantalla ---
-        pygame.display.flip()
+        timer.mark("draw")
+
+        # --- Actualizar Pantalla: sólo las regiones que cambiaron ---
+        layers.present(regions, current_regions)
+        if first_frame_pending:
+            tracer.finish("first_frame", key="ui") # datos nuevos ya en pantalla
+            first_frame_pending = False
+        timer.mark("flip")
+        timer.end_frame()
 
     # --- Salir ---
     pygame.quit()
+    if owns_worker:
+        worker.shutdown()
     print("--- Visualización Pygame cerrada ---")
 
 
@@ -534,33 +1099,32 @@ def visualize_data_pygame(initial_data_tuple, manager):
 if __name__ == "__main__":
     # ... (código existente para iniciar, cargar datos iniciales y llamar a visualize_data_pygame) ...
     print("--- Iniciando Simulador de Energía ---")
-    ema = Energy_manager("Energy Manager Principal")
+    configure_from_env() # TRACE_JSONL=fichero / METRICS_PORT=puerto activan trazas y métricas
+    # PREFETCH_DEPTH=N: mientras se anima un escenario ya se generan los N siguientes y "Regenerar" responde al instante.
+    # Desactivado por defecto: cada escenario precargado son peticiones al LLM que quizá nunca se muestren.
+    ema = Energy_manager("Energy Manager Principal", prefetch_depth=int(os.environ.get("PREFETCH_DEPTH", "0")))
+
+    # Un único worker (loop + pool HTTP) para la carga inicial y todas las regeneraciones
+    worker = RegenerationWorker()
 
     print("--- Generando escenario inicial (puede tardar)... ---")
-    initial_data_queue = queue.Queue()
-    initial_load_thread = threading.Thread(
-        target=_run_regeneration_async,
-        args=(ema, initial_data_queue),
-        daemon=True
-    )
-    initial_load_thread.start()
-    initial_load_thread.join(timeout=90) # Aumentar timeout por si acaso
-
-    initial_data_result_tuple = None
+    initial_scenario_result = None
     try:
-        initial_data_result_tuple = initial_data_queue.get_nowait()
-    except queue.Empty:
+        initial_scenario_result = worker.submit(ema.next_scenario).result(timeout=90) # Aumentar timeout por si acaso
+    except concurrent.futures.TimeoutError:
         print("--- ERROR FATAL: Timeout o fallo al generar escenario inicial. ---")
+        worker.cancel_current()
     except Exception as e:
         print(f"--- ERROR FATAL: Excepción al obtener datos iniciales: {e} ---")
 
-    # Validar que obtuvimos una tupla válida
-    if isinstance(initial_data_result_tuple, tuple) and len(initial_data_result_tuple) == 2:
+    # Validar que obtuvimos un escenario válido
+    if isinstance(initial_scenario_result, Scenario):
         print("--- Escenario inicial generado (Inicial y Modificado). Iniciando visualización Pygame ---")
-        visualize_data_pygame(initial_data_result_tuple, ema)
+        visualize_data_pygame(initial_scenario_result, ema, worker)
     else:
-        print("--- ERROR FATAL: No se pudo generar la tupla de datos inicial. Abortando visualización. ---")
+        print("--- ERROR FATAL: No se pudo generar el escenario inicial. Abortando visualización. ---")
         # Opcional: Iniciar Pygame con mensaje de error permanente
         # visualize_data_pygame(None, ema)
 
+    worker.shutdown()
     print("--- Simulador de Energía Finalizado ---")
@@ -1,9 +1,9 @@
-import requests
 import asyncio
-import aiohttp
-import json
-import os
 from dotenv import load_dotenv
+from .pool import get_pool
+from .providers import resolve_provider
+from .resilience import ProviderError, RetryPolicy, call_with_retry, get_breaker
+from .tracing import tracer
 
 load_dotenv(dotenv_path="config.env")
 
@@ -46,17 +46,72 @@ class instructions:
         return self.instruction
         
 
+class HedgeStats:
+    """Contadores globales de hedging/fallback (cuántas veces ganó el modelo de respaldo)."""
+
+    def __init__(self):
+        self.requests = 0
+        self.hedges_fired = 0 # el primario tardó más que hedge_delay y se lanzó el segundo modelo
+        self.primary_wins = 0
+        self.hedge_wins = 0
+        self.fallbacks_used = 0 # respuestas obtenidas de la lista de fallback
+        self.failures = 0
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "hedges_fired": self.hedges_fired,
+            "primary_wins": self.primary_wins,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": self.hedge_wins / self.hedges_fired if self.hedges_fired else 0.0,
+            "fallbacks_used": self.fallbacks_used,
+            "failures": self.failures,
+        }
+
+
+hedge_stats = HedgeStats()
+
+
 class flowtask:
-    def __init__(self, agentname, aimodel):
+    def __init__(self, agentname, aimodel, pool=None, cache=None, retry=None,
+                 hedge_model=None, hedge_delay=2.0, fallbacks=(), validator=None):
         self.agentname = agentname # #nombre del agente especializado para un conjunto de tareas específico
         self.aimodel = aimodel
-        self.apikey = os.environ.get("GOOGLE_API_KEY") #Google Api
-        if not self.apikey:
-            raise ValueError("GOOGLE_API_KEY no está definida. Asegúrate de que la variable de entorno esté configurada correctamente.")
-        self.urltorequest = f"https://generativelanguage.googleapis.com/v1beta/models/{self.aimodel}:generateContent"
+        self.pool = pool or get_pool() # pool de conexiones compartido entre llamadas e instancias
+        self.cache = cache # ResponseCache opcional: (modelo, prompt) idénticos no se vuelven a pagar
+        self.provider = resolve_provider(aimodel) # adaptador resuelto una sola vez (URL, cabeceras y modelo precalculados)
+        self.urltorequest = self.provider.url
+        self.retry = retry or RetryPolicy() # backoff con jitter ante 429/5xx
+        self.breaker = get_breaker(self.provider.name) # circuit breaker compartido por proveedor
+        # Hedging: si el primario no respondió en hedge_delay segundos se lanza la misma instrucción a hedge_model
+        self.hedge = self._route(hedge_model) if hedge_model else None
+        self.hedge_delay = hedge_delay
+        self.fallbacks = [self._route(model) for model in fallbacks] # en orden, si todo lo anterior falla
+        self.validator = validator # validator(texto) -> bool; las respuestas que no pasen cuentan como fallo
+        self.answered_by = None # modelo que dio la última respuesta (clave con la que quedó en la caché)
         self.countinstructions = 0
         self.storeinstructions = {}
 
+    def _models(self):
+        """Modelos que pueden responder, en orden de preferencia (primario, hedge, fallbacks)."""
+        routes = [(self.provider, self.breaker)] + ([self.hedge] if self.hedge else []) + self.fallbacks
+        return [provider.aimodel for provider, _ in routes]
+
+    def _cached(self, input_text):
+        """Respuesta en caché de cualquiera de los modelos de este agente (None si no hay); una sola consulta contada."""
+        model, cached = self.cache.get_first(self._models(), input_text)
+        if cached is not None:
+            self.answered_by = model
+        return cached
+
+    def _session(self, provider):
+        """Sesión HTTP del pool, sólo para los proveedores que hablan HTTP (el stub local no abre ninguna)."""
+        return self.pool.session() if provider.needs_session else None
+
+    def _route(self, aimodel):
+        provider = resolve_provider(aimodel)
+        return provider, get_breaker(provider.name)
+
     async def add_instruction(self, instruction):
         self.countinstructions += 1 
         self.storeinstructions[self.countinstructions] = instruction 
@@ -64,215 +119,126 @@ class flowtask:
         return await self.request(instruction)
         
     async def request(self, input_text):
-        input_data = {
-            "contents": [{
-                "parts": [{
-                    "text": input_text
-                }]
-            }]
-        }
-
-        if not self.apikey:
-            raise ValueError("GOOGLE_API_KEY no está definida")
-
-        headers = {
-            "Content-Type": "application/json",
-            "x-goog-api-key": self.apikey
-        }
-
-        # Google Models
-        if self.aimodel == "gemini-2.0-flash" or self.aimodel == "gemma-3-27b-it" or self.aimodel == "gemini-2.5-pro-exp-03-25":
-            # print("Usando Google Model")
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.urltorequest, headers=headers, json=input_data) as response:
-                    if response.status == 200:
-                        output_data = await response.json()
-                        output_text = output_data["candidates"][0]["content"]["parts"][0]["text"]
-                        return output_text
-                    else:
-                        print(f"Error: {response.status}")
-                        print(await response.text())
-                        return await response.text(), response.status
-                    
-        # Qwen Model
-        elif(self.aimodel == "qwen1"):
-           # print("Usando Qwen Model")
-            openrouter_url = "https://openrouter.ai/api/v1/chat/completions"
-            openrouter_api_key = os.environ.get("OPENROUTER_API_KEY")
-            qwen_model = os.environ.get("QWEN_MODEL")
-
-            if not openrouter_api_key:
-                raise ValueError("OPENROUTER_API_KEY no está definida")
-            if not qwen_model:
-                raise ValueError("QWEN_MODEL no está definida")
-
-            openrouter_headers = {
-                "Authorization": f"Bearer {openrouter_api_key}",
-                "Content-Type": "application/json"
-            }
-            openrouter_data = json.dumps({
-                "model": qwen_model,
-                "messages": [
-                {
-                    "role": "user",
-                    "content": input_text
-                }
-                ],
-            })
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(openrouter_url, headers=openrouter_headers, data=openrouter_data) as response:
-                    if response.status == 200:
-                        output_data = await response.json()
-                        output_text = output_data["choices"][0]["message"]["content"]
-                        return output_text
-                    else:
-                        print(f"Error: {response.status}")
-                        print(await response.text())
-                        return await response.text(), response.status
-                    
-        # DeepSeek R1 Model
-        elif(self.aimodel == "deepseek-r1"):
-            # print("Usando DeepSeek R1 Model")
-            openrouter_url = "https://openrouter.ai/api/v1/chat/completions"
-            openrouter_api_key = os.environ.get("OPENROUTER_API_KEY")
-            deepseek_r1_model = os.environ.get("DEEPSEEK_R1_MODEL")
-
-            if not openrouter_api_key:
-                raise ValueError("OPENROUTER_API_KEY no está definida")
-            if not deepseek_r1_model:
-                raise ValueError("DEEPSEEK_R1_MODEL no está definida")
-            
-            openrouter_headers = {
-                    "Authorization": f"Bearer {openrouter_api_key}",
-                    "Content-Type": "application/json"
-                }
-            openrouter_data = json.dumps({
-                    "model": deepseek_r1_model,
-                    "messages": [
-                    {
-                        "role": "user",
-                        "content": input_text
-                    }
-                    ],
-                })
-            async with aiohttp.ClientSession() as session:
-                async with session.post(openrouter_url, headers=openrouter_headers, data=openrouter_data) as response:
-                    if response.status == 200:
-                        output_data = await response.json()
-                        output_text = output_data["choices"][0]["message"]["content"]
-                        return output_text
-                    else:
-                        print(f"Error: {response.status}")
-                        print(await response.text())
-                        return await response.text(), response.status
-                    
-        # DeepSeek R1 Zero Model (Aprendizaje autónomo)
-        elif(self.aimodel == "deepseek-r1-zero"):
-            # print("Usando DeepSeek R1 Zero Model (También pensamiento profundo, pero con aprendizaje autónomo)")
-            
-            openrouter_url = "https://openrouter.ai/api/v1/chat/completions"
-            openrouter_api_key = os.environ.get("OPENROUTER_API_KEY")
-            deepseek_r1_zero_model = os.environ.get("DEEPSEEK_R1_ZERO_MODEL")
-
-            if not openrouter_api_key:
-                raise ValueError("OPENROUTER_API_KEY no está definida")
-            if not deepseek_r1_zero_model:
-                raise ValueError("DEEPSEEK_R1_ZERO_MODEL no está definida")
-            
-            openrouter_headers = {
-                    "Authorization": f"Bearer {openrouter_api_key}",
-                    "Content-Type": "application/json"
-                }
-            openrouter_data = json.dumps({
-                    "model": deepseek_r1_zero_model,
-                    "messages": [
-                    {
-                        "role": "user",
-                        "content": input_text
-                    }
-                    ],
-                })
-            async with aiohttp.ClientSession() as session:
-                async with session.post(openrouter_url, headers=openrouter_headers, data=openrouter_data) as response:
-                    if response.status == 200:
-                        output_data = await response.json()
-                        output_text = output_data["choices"][0]["message"]["content"]
-                        return output_text
-                    else:
-                        print(f"Error: {response.status}")
-                        print(await response.text())
-                        return await response.text(), response.status
-                    
-        # DeepSeek Chat V3 0324 Model (Sin pensamiento profundo)
-        elif(self.aimodel == "deepseek-cv3"):
-            # print("Usando Chat V3 0324 Model (Sin pensamiento profundo)")
-            openrouter_url = "https://openrouter.ai/api/v1/chat/completions"
-            openrouter_api_key = os.environ.get("OPENROUTER_API_KEY")
-            deepseek_cv3_model = os.environ.get("DEEPSEEK_CV3_MODEL")
-
-            if not openrouter_api_key:
-                raise ValueError("OPENROUTER_API_KEY no está definida")
-            if not deepseek_cv3_model:
-                raise ValueError("DEEPSEEK_CV3_MODEL no está definida")
-            
-            openrouter_headers = {
-                    "Authorization": f"Bearer {openrouter_api_key}",
-                    "Content-Type": "application/json"
-                }
-            openrouter_data = json.dumps({
-                    "model": deepseek_cv3_model,
-                    "messages": [
-                    {
-                        "role": "user",
-                        "content": input_text
-                    }
-                    ],
-                })
-            async with aiohttp.ClientSession() as session:
-                async with session.post(openrouter_url, headers=openrouter_headers, data=openrouter_data) as response:
-                    if response.status == 200:
-                        output_data = await response.json()
-                        output_text = output_data["choices"][0]["message"]["content"]
-                        return output_text
-                    else:
-                        print(f"Error: {response.status}")
-                        print(await response.text())
-                        return await response.text(), response.status
-                    
-        #  Quasar Alpha (1 M de tokens) Model
-        elif(self.aimodel == "quasar-alpha"):
-            # print("Usando Quasar Alpha Model")
-            openrouter_url = "https://openrouter.ai/api/v1/chat/completions"
-            openrouter_api_key = os.environ.get("OPENROUTER_API_KEY")
-            quasarmodel = os.environ.get("QUASAR_ALPHA_MODEL")
-
-            if not openrouter_api_key:
-                raise ValueError("OPENROUTER_API_KEY no está definida")
-            if not quasarmodel:
-                raise ValueError("QUASAR_ALPHA_MODEL no está definido")
-            
-            openrouter_headers = {
-                    "Authorization": f"Bearer {openrouter_api_key}",
-                    "Content-Type": "application/json"
-                }
-            openrouter_data = json.dumps({
-                    "model": quasarmodel,
-                    "messages": [
-                    {
-                        "role": "user",
-                        "content": input_text
-                    }
-                    ],
-                })
-            async with aiohttp.ClientSession() as session:
-                async with session.post(openrouter_url, headers=openrouter_headers, data=openrouter_data) as response:
-                    if response.status == 200:
-                        output_data = await response.json()
-                        print(output_data)
-                        output_text = output_data["choices"][0]["message"]["content"]
-                        return output_text
-                    else:
-                        print(f"Error: {response.status}")
-                        print(await response.text())
-                        return await response.text(), response.status
+        if self.cache is not None:
+            cached = self._cached(input_text)
+            tracer.count("cache_lookups_total", result="miss" if cached is None else "hit")
+            if cached is not None:
+                return cached
+        hedge_stats.requests += 1
+        # Lanza ProviderError (o CircuitOpenError) si ningún modelo da una respuesta válida
+        try:
+            if self.hedge is None:
+                model, output_text = await self._send((self.provider, self.breaker), input_text)
+            else:
+                model, output_text = await self._hedged(input_text)
+        except ProviderError as e:
+            model, output_text = await self._fallback(input_text, e)
+        # Bajo el modelo que respondió: una respuesta del hedge o de un fallback no se hace pasar por la del primario
+        self.answered_by = model
+        if self.cache is not None:
+            self.cache.put(model, input_text, output_text)
+        return output_text
+
+    async def stream(self, input_text):
+        """Generador asíncrono de fragmentos de la respuesta del modelo principal (sin hedging ni fallbacks).
+
+        Sólo se reintenta si el fallo ocurre antes del primer fragmento (y dentro de retry.max_total segundos de
+        espera); una vez emitido texto, el error se propaga. La respuesta se guarda en la caché sólo si el stream
+        terminó limpio y pasa el validador.
+        """
+        self.answered_by = self.aimodel
+        if self.cache is not None:
+            cached = self.cache.get(self.aimodel, input_text)
+            tracer.count("cache_lookups_total", result="miss" if cached is None else "hit")
+            if cached is not None:
+                yield cached
+                return
+        chunks = []
+        attempt = 0
+        waited = 0.0
+        while True:
+            self.breaker.before_call()
+            try:
+                async for chunk in self.provider.stream(self._session(self.provider), input_text):
+                    chunks.append(chunk)
+                    yield chunk
+            except ProviderError as e:
+                if e.retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success() # el proveedor respondió: no cuenta como caída (y cierra la prueba half-open)
+                attempt += 1
+                if chunks or not e.retryable or attempt >= self.retry.max_attempts or self.breaker.state == "open":
+                    raise
+                delay = self.retry.delay(attempt - 1, e.retry_after)
+                if waited + delay > self.retry.max_total:
+                    raise # esperar más excedería el presupuesto: fallar ya
+                await asyncio.sleep(delay)
+                waited += delay
+                continue
+            break
+        self.breaker.record_success()
+        # Aquí el proveedor ya confirmó el fin del stream (si se corta, stream() lanza ProviderError y no se llega)
+        output_text = "".join(chunks)
+        if self.cache is not None and (self.validator is None or self.validator(output_text)):
+            self.cache.put(self.aimodel, input_text, output_text)
+
+    async def _send(self, route, input_text):
+        provider, breaker = route
+
+        async def call():
+            output_text = await provider.send(self._session(provider), input_text)
+            if self.validator is not None and not self.validator(output_text):
+                error = ProviderError("respuesta descartada por el validador", body=output_text[:500], provider=provider.name)
+                error.retryable = False
+                raise error
+            return output_text
+
+        return provider.aimodel, await call_with_retry(call, breaker, self.retry)
+
+    async def _hedged(self, input_text):
+        primary = asyncio.ensure_future(self._send((self.provider, self.breaker), input_text))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+            if primary in done and primary.exception() is None:
+                hedge_stats.primary_wins += 1
+                return primary.result()
+            # El primario tarda (o ya falló): lanzar el mismo texto al modelo de respaldo
+            hedge_stats.hedges_fired += 1
+            tracer.count("hedges_fired_total", provider=self.hedge[0].name)
+            hedge = asyncio.ensure_future(self._send(self.hedge, input_text))
+            tasks.add(hedge)
+            pending = tasks - done
+            last_error = primary.exception() if primary in done else None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            hedge_stats.hedge_wins += 1
+                        else:
+                            hedge_stats.primary_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel() # cancelar la petición perdedora
+                elif not task.cancelled():
+                    task.exception() # marcar el error del perdedor como consumido
+
+    async def _fallback(self, input_text, error):
+        for route in self.fallbacks:
+            print(f"--- [flowtask] {error}. Probando modelo de fallback {route[0].aimodel} ---")
+            try:
+                answer = await self._send(route, input_text)
+            except ProviderError as e:
+                error = e
+                continue
+            hedge_stats.fallbacks_used += 1
+            tracer.count("fallbacks_used_total", provider=route[0].name)
+            return answer
+        hedge_stats.failures += 1
+        raise error
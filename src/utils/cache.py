@@ -0,0 +1,145 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+### Caché de respuestas del LLM direccionada por contenido: clave = sha256(modelo + prompt).
+# Nivel 1: LRU en memoria (OrderedDict). Nivel 2 (opcional): fichero sqlite persistente.
+# Ambos niveles expiran por TTL y se recortan por tamaño.
+
+
+def cache_key(aimodel, prompt):
+    return hashlib.sha256(f"{aimodel}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256, ttl=3600, path=None, max_disk_entries=5000):
+        self.max_entries = max_entries # tamaño máximo del LRU en memoria
+        self.ttl = ttl # segundos de vida de cada respuesta (None = sin expiración)
+        self.path = path # fichero sqlite para el nivel en disco (None = sólo memoria)
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict() # clave -> (timestamp, respuesta)
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, created REAL)")
+            self._db.commit()
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, aimodel, prompt):
+        return self.get_first((aimodel,), prompt)[1]
+
+    def get_first(self, aimodels, prompt):
+        """
+        (modelo, respuesta) del primero de `aimodels` que tenga guardada una respuesta a `prompt`, o (None, None).
+        Cuenta como una sola consulta (un acierto o un fallo) aunque pruebe varios modelos.
+        """
+        now = time.time()
+        with self._lock:
+            for aimodel in aimodels:
+                response = self._lookup(cache_key(aimodel, prompt), now)
+                if response is not None:
+                    self.hits += 1
+                    return aimodel, response
+            self.misses += 1
+            return None, None
+
+    def _lookup(self, key, now):
+        """Respuesta guardada bajo `key` (memoria y luego disco) o None, sin tocar los contadores de aciertos/fallos."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            if not self._expired(entry[0], now):
+                self._memory.move_to_end(key)
+                return entry[1]
+            del self._memory[key]
+        if self._db is not None:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                if not self._expired(row[1], now):
+                    self._store_memory(key, row[1], row[0])
+                    self.disk_hits += 1
+                    return row[0]
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+        return None
+
+    def put(self, aimodel, prompt, response):
+        key = cache_key(aimodel, prompt)
+        now = time.time()
+        with self._lock:
+            self._store_memory(key, now, response)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)", (key, response, now))
+                self._evict_disk(now)
+                self._db.commit()
+
+    def _store_memory(self, key, created, response):
+        self._memory[key] = (created, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False) # el menos usado recientemente
+
+    def _evict_disk(self, now):
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY created DESC LIMIT ?)",
+            (self.max_disk_entries,),
+        )
+
+    def discard(self, aimodel, prompt):
+        """Elimina una respuesta (p.ej. una que resultó no ser JSON válido) para que no se vuelva a servir."""
+        key = cache_key(aimodel, prompt)
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._memory),
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+_default_cache = None
+
+
+def get_cache():
+    """Caché compartida por defecto (sólo memoria). Usar configure_cache(path=...) para persistirla en disco."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
+
+
+def configure_cache(**kwargs):
+    global _default_cache
+    if _default_cache is not None:
+        _default_cache.close()
+    _default_cache = ResponseCache(**kwargs)
+    return _default_cache
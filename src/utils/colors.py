@@ -0,0 +1,76 @@
+import math
+import numpy as np
+
+### Colores y pulsos del visualizador calculados para todas las casas en una pasada NumPy por frame.
+# El degradado verde -> amarillo -> rojo se precalcula en una tabla (LUT) de 256 colores; el brillo y el
+# tamaño pulsan con una fase distinta para cada casa (índice * phase_step), como en el bucle original.
+
+
+def gradient_lut(low, medium, high, size=256):
+    """Tabla (size, 3) uint8: low en 0.0, medium en 0.5 y high en 1.0, interpolando linealmente en cada mitad."""
+    value = np.linspace(0.0, 1.0, size)[:, None]
+    low, medium, high = (np.array(color, dtype=np.float64) for color in (low, medium, high))
+    first = low + (medium - low) * (value / 0.5)
+    second = medium + (high - medium) * ((value - 0.5) / 0.5)
+    lut = np.where(value <= 0.5, first, second)
+    return np.clip(lut.astype(np.int64), 0, 255).astype(np.uint8) # int() trunca, como get_color_for_consumption
+
+
+class Pulse:
+    def __init__(self, low, medium, high, invalid, radius, frequency, brightness_amplitude, size_amplitude,
+                 phase_step=0.5, lut_size=256):
+        self.lut = gradient_lut(low, medium, high, lut_size)
+        self.invalid = np.array(invalid, dtype=np.uint8) # color de valores ausentes (NaN): sin pulso
+        self.radius = radius # radio base
+        self.frequency = frequency
+        self.brightness_amplitude = brightness_amplitude
+        self.size_amplitude = size_amplitude
+        self.phase_step = phase_step # desfase entre casas consecutivas
+        self._phases = np.zeros(0, dtype=np.float32)
+
+    def phases(self, count):
+        if len(self._phases) != count:
+            self._phases = np.arange(count, dtype=np.float32) * np.float32(self.phase_step)
+        return self._phases
+
+    def base_colors(self, values):
+        """Color del degradado para cada valor (array (n, 3) uint8); los NaN quedan con el color inválido."""
+        values = np.asarray(values, dtype=np.float32)
+        index = np.nan_to_num(values, nan=0.0)
+        np.clip(index, 0.0, 1.0, out=index)
+        index *= np.float32(len(self.lut) - 1)
+        index += np.float32(0.5)
+        colors = self.lut[index.astype(np.intp)]
+        colors[np.isnan(values)] = self.invalid
+        return colors
+
+    def compute(self, values, time_ms, phase=0.0, indices=None, scale=1.0):
+        """
+        Colores (n, 3) uint8 y radios (n,) int32 pulsantes para todas las casas en el instante `time_ms`.
+        `phase` desplaza la fase de todo el conjunto (p.ej. para desincronizar el círculo inicial del modificado).
+        Con `indices`, `values` son sólo esas casas (las visibles) y cada una conserva su fase; `scale` es el zoom.
+        """
+        values = np.asarray(values, dtype=np.float32)
+        invalid = np.isnan(values)
+        if indices is None:
+            phases = self.phases(len(values))
+        else:
+            phases = np.asarray(indices).astype(np.float32) * np.float32(self.phase_step)
+
+        # Fase global reducida a [0, 2*pi) en float64 antes de pasar a float32 (precisión con time_ms grandes)
+        brightness = np.sin(phases + np.float32((time_ms * self.frequency + phase) % (2 * math.pi)))
+        brightness *= np.float32(self.brightness_amplitude)
+        brightness += np.float32(1.0)
+        colors = self.base_colors(values) * brightness[:, None]
+        np.clip(colors, 0, 255, out=colors)
+        colors = colors.astype(np.uint8)
+
+        size = np.sin(phases + np.float32((time_ms * self.frequency * 1.1 + phase + math.pi / 3) % (2 * math.pi)))
+        size *= np.float32(self.size_amplitude)
+        size += np.float32(1.0)
+        size *= np.float32(self.radius * scale)
+        radii = np.maximum(size.astype(np.int32), 1) # radio mínimo de 1
+
+        colors[invalid] = self.invalid
+        radii[invalid] = max(int(self.radius * scale), 1)
+        return colors, radii
@@ -0,0 +1,68 @@
+import time
+import numpy as np
+
+### Tiempos por frame del visualizador, desglosados por fase.
+# visualize_data_pygame llama a mark(fase) al terminar cada fase; el tiempo desde la marca anterior se suma a esa
+# fase del frame actual. Los tiempos se guardan en un array NumPy preasignado (sin listas que crezcan por frame)
+# y summary() da p50/p95/p99 del frame completo y de cada fase.
+
+PHASES = ("events", "layout", "text", "colour", "draw", "flip")
+
+
+class FrameTimer:
+    def __init__(self, max_frames=100000, phases=PHASES, clock=time.perf_counter):
+        self.phases = phases
+        self._column = {name: i for i, name in enumerate(phases)}
+        self._times = np.zeros((max_frames, len(phases)), dtype=np.float64) # segundos
+        self._clock = clock
+        self._last = None
+        self.frames = 0 # frames terminados
+
+    def start_frame(self):
+        self._last = self._clock()
+
+    def mark(self, phase):
+        """Cierra la fase `phase`: le suma el tiempo transcurrido desde la marca anterior."""
+        now = self._clock()
+        if self.frames < len(self._times):
+            self._times[self.frames, self._column[phase]] += now - self._last
+        self._last = now
+
+    def end_frame(self):
+        self.frames += 1
+
+    def times(self):
+        """Array (frames, fases) en milisegundos."""
+        return self._times[:min(self.frames, len(self._times))] * 1000.0
+
+    def summary(self, percentiles=(50, 95, 99)):
+        """{"frame": {"p50": ms, ...}, "events": {...}, ...}; los frames más allá de max_frames no se guardan."""
+        times = self.times()
+        if not len(times):
+            return {}
+        result = {"frame": _percentiles(times.sum(axis=1), percentiles)}
+        for name, column in self._column.items():
+            result[name] = _percentiles(times[:, column], percentiles)
+        return result
+
+
+def _percentiles(values, percentiles):
+    stats = {f"p{p}": float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))}
+    stats["mean"] = float(np.mean(values))
+    return stats
+
+
+class NullFrameTimer:
+    """Sustituto sin coste cuando no se mide (visualize_data_pygame sin frame_timer)."""
+
+    def start_frame(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+NULL_TIMER = NullFrameTimer()
@@ -1,10 +1,12 @@
+import numpy as np
 from .agent import flowtask
 
 # si el consumo de los usuarios se acerca a 0 significa menos consumo, si se acerca a uno es más consumo
 
 
-async def gen_data(): # Generate data for energy management
-    agente = flowtask("json-energy", "gemini-2.0-flash")
+async def gen_data(ai_model="gemini-2.0-flash", **agent_options): # Generate data for energy management
+    # agent_options se pasa a flowtask (hedge_model, hedge_delay, fallbacks...)
+    agente = flowtask("json-energy", ai_model, **agent_options)
     response = await agente.add_instruction("""
         You are a professional JSON data generator, specializing in creating random datasets related to energy consumption. Using the format provided below, generate a JSON structure that records sectors (only A-B-C) and houses (1-10) along with their respective energy consumption levels. Values close to 0 indicate low consumption, while values close to 1 indicate high consumption. Follow this exact format modyfing values as you please:
                                 
@@ -45,3 +47,75 @@ async def gen_data(): # Generate data for energy management
         """)
     
     return response
+
+
+### Generador sintético local (NumPy, con semilla): alternativa a gen_data sin LLM ni red y a cualquier escala.
+
+def sector_names(count):
+    """Sector-A ... Sector-Z, Sector-AA, Sector-AB ... (como columnas de una hoja de cálculo)."""
+    names = []
+    for i in range(count):
+        label = ""
+        i += 1
+        while i:
+            i, rest = divmod(i - 1, 26)
+            label = chr(65 + rest) + label
+        names.append(f"Sector-{label}")
+    return names
+
+
+def diurnal_profile(hour):
+    """Carga media (0-1) según la hora del día: valle nocturno, pico de mañana (~8h) y pico de tarde (~19h)."""
+    morning = np.exp(-0.5 * ((hour - 8.0) / 1.5) ** 2)
+    evening = np.exp(-0.5 * ((hour - 19.5) / 2.0) ** 2)
+    return 0.15 + 0.3 * morning + 0.5 * evening
+
+
+def gen_arrays(sectors=3, houses_per_sector=(6, 10), distribution="beta", seed=None, hour=None,
+               alpha=2.0, beta=5.0, high_share=0.3):
+    """
+    Genera los consumos como arrays: (nombres de sector, casas por sector, valores float32 contiguos).
+    `houses_per_sector` es un entero o un rango (min, max) por sector.
+    distribution: "uniform" | "beta" (alpha, beta) | "bimodal" (high_share = fracción de casas de alto consumo)
+                  | "diurnal" (perfil horario a la hora `hour`, 0-24)
+    """
+    rng = np.random.default_rng(seed)
+    names = sector_names(sectors)
+    if isinstance(houses_per_sector, int):
+        counts = np.full(sectors, houses_per_sector, dtype=np.int64)
+    else:
+        counts = rng.integers(houses_per_sector[0], houses_per_sector[1] + 1, size=sectors)
+    total = int(counts.sum())
+
+    if distribution == "uniform":
+        values = rng.random(total, dtype=np.float32)
+    elif distribution == "beta":
+        values = rng.beta(alpha, beta, size=total).astype(np.float32)
+    elif distribution == "bimodal":
+        high = rng.random(total) < high_share
+        values = np.where(high, rng.beta(8.0, 2.0, size=total), rng.beta(2.0, 8.0, size=total)).astype(np.float32)
+    elif distribution == "diurnal":
+        if hour is None:
+            hour = rng.uniform(0, 24)
+        # cada casa escala el perfil horario y cada sector tiene un desplazamiento propio
+        sector_offset = np.repeat(rng.normal(0.0, 0.05, size=sectors), counts)
+        house_scale = rng.lognormal(0.0, 0.35, size=total)
+        values = (diurnal_profile(hour) * house_scale + sector_offset + rng.normal(0.0, 0.05, size=total)).astype(np.float32)
+    else:
+        raise ValueError(f"Distribución desconocida: {distribution}")
+    np.clip(values, 0.0, 1.0, out=values)
+    return names, counts, values
+
+
+def gen_data_local(decimals=2, **options):
+    """Mismo formato que la respuesta de gen_data ya parseada: {"Sector-A": {"house-1": 0.05, ...}, ...}."""
+    names, counts, values = gen_arrays(**options)
+    values = np.round(values.astype(np.float64), decimals).tolist()
+    house_names = [f"house-{i}" for i in range(1, int(counts.max(initial=0)) + 1)] # compartidos entre sectores
+    data = {}
+    start = 0
+    for name, count in zip(names, counts.tolist()):
+        data[name] = dict(zip(house_names[:count], values[start:start + count]))
+        start += count
+    return data
+
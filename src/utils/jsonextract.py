@@ -0,0 +1,95 @@
+import json
+import re
+
+try:
+    import orjson # opcional: parseo varias veces más rápido que json
+except ImportError:
+    orjson = None
+
+### Extracción tolerante del objeto JSON de una respuesta del modelo.
+# El modelo a veces envuelve el JSON en ```json ... ``` o en prosa, deja comas finales (el propio ejemplo del prompt
+# de gen_data las tiene) o corta la respuesta a medias. extract_json() localiza el objeto desde la primera "{":
+#   1. camino rápido: un único loads() entre la primera "{" y la última "}" (la respuesta bien formada de siempre);
+#   2. si falla, una sola pasada por tokens (cadenas completas y caracteres estructurales, con regex) que cierra el
+#      objeto en su "}" correspondiente, quita las comas finales y, si la respuesta está truncada, se queda con los
+#      sectores completos (objetos cerrados en el primer nivel).
+
+_TOKENS = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\],]') # cadenas completas (con escapes) y estructura
+
+
+def loads(text):
+    """json.loads con orjson si está instalado. Lanza json.JSONDecodeError en ambos casos."""
+    if orjson is not None:
+        return orjson.loads(text) # orjson.JSONDecodeError hereda de json.JSONDecodeError
+    return json.loads(text)
+
+
+def extract_json(text):
+    """
+    Devuelve (datos, completo). completo=False si la respuesta estaba truncada y `datos` sólo trae los miembros
+    de primer nivel (sectores) que llegaron cerrados. Lanza json.JSONDecodeError si no hay nada recuperable.
+    """
+    start = text.find("{")
+    if start == -1:
+        raise json.JSONDecodeError("la respuesta no contiene un objeto JSON", text, 0)
+    end = text.rfind("}")
+    if end > start:
+        try:
+            return loads(text[start:end + 1]), True
+        except json.JSONDecodeError:
+            pass
+    return _repair(text, start)
+
+
+def is_json_object(text):
+    """Validador por defecto de flowtask: True si extract_json recupera un objeto JSON de la respuesta."""
+    try:
+        data, _ = extract_json(text)
+    except json.JSONDecodeError:
+        return False
+    return isinstance(data, dict)
+
+
+def _repair(text, start):
+    depth = 0
+    cuts = [] # posiciones de las comas finales a eliminar
+    last_comma = None # fin de la última "," vista (para detectar "..., }")
+    member_end = None # fin del último miembro de primer nivel cerrado (sector completo)
+    close = None
+    for match in _TOKENS.finditer(text, start):
+        token = match.group()
+        if token == ",":
+            last_comma = match
+            continue
+        if token in "}]":
+            if last_comma is not None and not text[last_comma.end():match.start()].strip():
+                cuts.append(last_comma.start())
+            depth -= 1
+            if depth == 1:
+                member_end = match.end()
+            elif depth == 0:
+                close = match.end()
+                break
+        elif token in "{[":
+            depth += 1
+        last_comma = None
+    if close is not None:
+        return loads(_without(text, start, close, cuts)), True
+    if member_end is None:
+        raise json.JSONDecodeError("respuesta truncada sin ningún sector completo", text, start)
+    # Truncada: cerrar el objeto raíz tras el último sector completo
+    salvaged = _without(text, start, member_end, [cut for cut in cuts if cut < member_end]) + "}"
+    return loads(salvaged), False
+
+
+def _without(text, start, end, cuts):
+    """text[start:end] sin los caracteres en las posiciones `cuts` (comas finales)."""
+    if not cuts:
+        return text[start:end]
+    pieces = []
+    position = start
+    for cut in cuts:
+        pieces.append(text[position:cut])
+        position = cut + 1
+    pieces.append(text[position:end])
+    return "".join(pieces)
@@ -0,0 +1,111 @@
+import json
+import re
+
+### Parser JSON incremental para respuestas en streaming con la forma
+# {"Sector-X": {"house-N": valor, ...}, ...}
+# Se alimenta con fragmentos de texto y emite (sector, house, valor) en cuanto cada valor está completo,
+# sin esperar al final del documento.
+
+_LITERAL = re.compile(r"[-+.0-9A-Za-z]+") # números y true/false/null
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self._buf = ""
+        self._path = [] # claves de los objetos abiertos (path[0] = sector)
+        self._key = None # última clave leída en el nivel actual
+        self._expect_key = False
+        self.depth = 0
+        self.started = False # se encontró la primera "{" (se ignora prosa o ```json previos)
+        self.done = False # se cerró el objeto raíz
+        self.data = {} # resultado acumulado hasta ahora
+
+    def feed(self, chunk):
+        """Procesa un fragmento y devuelve la lista de (sector, house, valor) completados en él."""
+        events = []
+        buf = self._buf + chunk
+        pos = 0
+        size = len(buf)
+        while pos < size and not self.done:
+            c = buf[pos]
+            if not self.started:
+                if c == "{":
+                    self.started = True
+                    self.depth = 1
+                    self._expect_key = True
+                pos += 1
+            elif c in _WHITESPACE:
+                pos += 1
+            elif c == "{":
+                self._path.append(self._key)
+                if self.depth == 1 and self._key is not None:
+                    self.data.setdefault(self._key, {})
+                self.depth += 1
+                self._key = None
+                self._expect_key = True
+                pos += 1
+            elif c == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.done = True
+                else:
+                    self._path.pop()
+                self._key = None
+                pos += 1
+            elif c == ",":
+                self._key = None
+                self._expect_key = True
+                pos += 1
+            elif c == ":":
+                self._expect_key = False
+                pos += 1
+            elif c == '"':
+                end = _string_end(buf, pos + 1)
+                if end == -1:
+                    break # cadena incompleta: esperar al siguiente fragmento
+                text = json.loads(buf[pos:end + 1])
+                pos = end + 1
+                if self._expect_key:
+                    self._key = text
+                else:
+                    self._value(text, events)
+            else:
+                match = _LITERAL.match(buf, pos)
+                if match is None:
+                    pos += 1 # carácter inesperado: ignorarlo
+                    continue
+                if match.end() == size:
+                    break # el número puede continuar en el siguiente fragmento
+                token = match.group()
+                pos = match.end()
+                try:
+                    self._value(json.loads(token), events)
+                except json.JSONDecodeError:
+                    self._value(None, events)
+        self._buf = buf[pos:]
+        return events
+
+    def _value(self, value, events):
+        if self.depth == 2 and self._key is not None:
+            sector = self._path[0]
+            self.data.setdefault(sector, {})[self._key] = value
+            events.append((sector, self._key, value))
+        self._key = None
+
+
+def _string_end(buf, start):
+    """Índice de la comilla de cierre (respetando escapes) o -1 si la cadena aún no terminó."""
+    pos = start
+    while True:
+        pos = buf.find('"', pos)
+        if pos == -1:
+            return -1
+        backslashes = 0
+        back = pos - 1
+        while back >= start and buf[back] == "\\":
+            backslashes += 1
+            back -= 1
+        if backslashes % 2 == 0:
+            return pos
+        pos += 1
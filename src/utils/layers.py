@@ -0,0 +1,72 @@
+import pygame
+
+### Render por capas con rectángulos sucios para el visualizador pygame.
+#   - capa estática (Surface propia): fondo, leyenda, títulos de sector y etiquetas; se repinta sólo cuando cambian
+#   - capa dinámica: los círculos pulsantes, que se dibujan cada frame directamente en la pantalla
+#   - overlay de carga: una única Surface semitransparente que se reutiliza (se recrea sólo al cambiar el tamaño)
+# Cada frame se restaura la capa estática bajo las regiones que cambian y se actualizan sólo esas regiones con
+# display.update(rects); el frame completo (flip) sólo se pinta cuando cambia la capa estática o el overlay.
+
+
+class LayeredScreen:
+    def __init__(self, screen, overlay_color=(0, 0, 0, 128)):
+        self.screen = screen
+        self.overlay_color = overlay_color
+        self.static = pygame.Surface(screen.get_size())
+        self.overlay = None
+        self.full_redraw = True # el próximo frame se pinta y presenta entero
+        self._previous = [] # regiones del frame anterior: hay que restaurarlas aunque ahora no se dibuje nada en ellas
+        self.frames = 0
+        self.full_frames = 0
+
+    def resize(self, screen):
+        self.screen = screen
+        if self.static.get_size() != screen.get_size():
+            self.static = pygame.Surface(screen.get_size())
+        self.full_redraw = True
+
+    def repaint_static(self, paint):
+        """Vuelve a pintar la capa estática con `paint(surface)` y fuerza un frame completo."""
+        paint(self.static)
+        self.full_redraw = True
+
+    def overlay_surface(self):
+        if self.overlay is None or self.overlay.get_size() != self.screen.get_size():
+            self.overlay = pygame.Surface(self.screen.get_size(), pygame.SRCALPHA)
+            self.overlay.fill(self.overlay_color)
+        return self.overlay
+
+    def begin(self, rects, merge=False):
+        """
+        Restaura la capa estática bajo `rects` y bajo las regiones del frame anterior; devuelve las regiones a actualizar.
+        merge=True las une en un solo rectángulo: necesario si luego se aplica el overlay semitransparente, que no
+        debe caer dos veces sobre el mismo píxel donde dos regiones se solapan.
+        """
+        if self.full_redraw:
+            self.screen.blit(self.static, (0, 0))
+            return list(rects)
+        regions = list(rects) + self._previous
+        if merge and regions:
+            regions = [pygame.Rect(regions[0]).unionall(regions[1:])]
+        for rect in regions:
+            self.screen.blit(self.static, rect, rect)
+        return regions
+
+    def apply_overlay(self, regions):
+        overlay = self.overlay_surface()
+        if self.full_redraw:
+            self.screen.blit(overlay, (0, 0))
+        else:
+            for rect in regions:
+                self.screen.blit(overlay, rect, rect)
+
+    def present(self, regions, current):
+        """Presenta el frame. `current` son las regiones de este frame (se restaurarán en el siguiente)."""
+        if self.full_redraw:
+            pygame.display.flip()
+            self.full_frames += 1
+        else:
+            pygame.display.update(regions)
+        self._previous = list(current)
+        self.full_redraw = False
+        self.frames += 1
@@ -0,0 +1,125 @@
+import numpy as np
+
+### Layout precalculado del visualizador: escenario + ancho de pantalla -> arrays planos de coordenadas.
+# Las posiciones sólo dependen de la estructura del escenario (sectores y casas) y del ancho, así que se
+# calculan una vez (vectorizado, sin bucle por casa) y se reutilizan en cada frame hasta que cambian los
+# datos o llega un VIDEORESIZE.
+
+
+class LayoutMetrics:
+    """Medidas fijas del layout en píxeles (las mismas constantes que usa visualize_data_pygame)."""
+
+    def __init__(self, radius, pair_spacing, text_offset, item_width, margin, row_height,
+                 title_height, title_gap, empty_height, empty_gap, sector_gap):
+        self.radius = radius # radio base de los círculos
+        self.pair_spacing = pair_spacing # separación entre el círculo inicial y el modificado
+        self.text_offset = text_offset # separación entre el par de círculos y la etiqueta
+        self.item_width = item_width # ancho total de cada casa (par de círculos + etiqueta + márgenes)
+        self.margin = margin
+        self.row_height = row_height # alto de cada fila de casas
+        self.title_height = title_height # alto del título de sector
+        self.title_gap = title_gap # espacio entre el título y la primera fila
+        self.empty_height = empty_height # alto del mensaje de sector sin casas
+        self.empty_gap = empty_gap
+        self.sector_gap = sector_gap # espacio entre sectores
+
+    def items_per_row(self, width):
+        return max(1, (width - 2 * self.margin) // self.item_width)
+
+
+class Layout:
+    """Coordenadas de todas las casas (arrays planos alineados con el Scenario) y de los títulos de sector."""
+
+    def __init__(self, width, items_per_row, initial_x, modified_x, center_y, text_x, sector_titles, empty_sectors, height):
+        self.width = width
+        self.items_per_row = items_per_row
+        self.initial_x = initial_x # centro x del círculo del valor inicial
+        self.modified_x = modified_x # centro x del círculo del valor modificado
+        self.center_y = center_y # centro y de ambos círculos (y de la etiqueta)
+        self.text_x = text_x # borde izquierdo de la etiqueta
+        self.sector_titles = sector_titles # [(nombre, x, y)]
+        self.empty_sectors = empty_sectors # [(nombre, x, y)] sectores sin casas (mensaje de error)
+        self.height = height # alto total del contenido
+        self._lists = None
+
+    def __len__(self):
+        return len(self.center_y)
+
+    def lists(self):
+        """(initial_x, modified_x, center_y, text_x) como listas de Python (acceso por índice rápido en el bucle de dibujo)."""
+        if self._lists is None:
+            self._lists = (self.initial_x.tolist(), self.modified_x.tolist(), self.center_y.tolist(), self.text_x.tolist())
+        return self._lists
+
+
+def row_rects(initial_x, modified_x, center_y, max_radius):
+    """
+    Un rectángulo por fila de casas consecutivas (misma center_y), con `max_radius` de margen alrededor de los círculos:
+    las regiones que cambian en cada frame. Recibe coordenadas de pantalla (ya transformadas por el Viewport).
+    """
+    if not len(center_y):
+        return []
+    # Las casas de una fila son consecutivas: una fila empieza donde cambia center_y
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(center_y)) + 1))
+    ends = np.concatenate((starts[1:], [len(center_y)])) - 1
+    left = np.floor(initial_x[starts]).astype(np.int64) - max_radius - 1
+    right = np.ceil(modified_x[ends]).astype(np.int64) + max_radius + 1
+    top = np.floor(center_y[starts]).astype(np.int64) - max_radius - 1
+    size = 2 * max_radius + 3
+    return [(x, y, w, size) for x, y, w in zip(left.tolist(), top.tolist(), (right - left).tolist())]
+
+
+def compute_layout(scenario, width, metrics):
+    m = metrics
+    per_row = m.items_per_row(width)
+    counts = np.diff(scenario.sector_offsets)
+    rows = (counts + per_row - 1) // per_row
+
+    # Alto de cada sector y su posición vertical (suma acumulada), igual que el recorrido del bucle de dibujo
+    body = np.where(counts > 0, rows * m.row_height, m.empty_height + m.empty_gap)
+    sector_height = m.title_height + m.title_gap + body + m.sector_gap
+    sector_y = m.margin + np.concatenate(([0.0], np.cumsum(sector_height, dtype=np.float64)[:-1]))
+    houses_y = sector_y + m.title_height + m.title_gap
+
+    # Posición de cada casa dentro de su sector (columna/fila), sin bucle en Python
+    sector_of_house = np.repeat(np.arange(len(counts)), counts)
+    local = np.arange(int(counts.sum())) - np.repeat(scenario.sector_offsets[:-1], counts)
+    column = local % per_row
+    row = local // per_row
+    initial_x = m.margin + m.radius + column * m.item_width
+    modified_x = initial_x + 2 * m.radius + m.pair_spacing
+    center_y = houses_y[sector_of_house] + row * m.row_height + m.radius
+    text_x = modified_x + m.text_offset
+
+    sector_y_list = sector_y.tolist()
+    houses_y_list = houses_y.tolist()
+    sector_titles = [(name, m.margin, sector_y_list[s]) for s, name in enumerate(scenario.sectors)]
+    empty_sectors = [(name, m.margin + 10, houses_y_list[s]) for s, name in enumerate(scenario.sectors) if counts[s] == 0]
+    height = float(sector_y[-1] + sector_height[-1]) if len(counts) else float(m.margin)
+    return Layout(width, per_row, initial_x, modified_x, center_y, text_x, sector_titles, empty_sectors, height)
+
+
+class LayoutEngine:
+    """Caché del layout: se recalcula sólo si cambia la estructura del escenario o el ancho de pantalla."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._scenario = None
+        self._layout = None
+        self.computations = 0
+
+    def get(self, scenario, width):
+        if self._layout is not None and self._layout.width == width:
+            if scenario is self._scenario:
+                return self._layout
+            if scenario.same_layout(self._scenario):
+                self._scenario = scenario # datos nuevos con la misma estructura: las posiciones no cambian
+                return self._layout
+        self._layout = compute_layout(scenario, width, self.metrics)
+        self._scenario = scenario
+        self.computations += 1
+        return self._layout
+
+    def invalidate(self):
+        self._scenario = None
+        self._layout = None
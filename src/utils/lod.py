@@ -0,0 +1,285 @@
+import numpy as np
+import pygame
+
+### Nivel de detalle (LOD) del visualizador para escenarios grandes.
+#   - "circles": el par de círculos pulsantes con etiqueta por casa (render original, hasta unos cientos de casas)
+#   - "pixels": un píxel (o celda de pocos píxeles) por casa, volcado desde un array NumPy con pygame.surfarray
+#   - "sectors": una baldosa por sector coloreada con un agregado (media / máximo / p95)
+# En los dos últimos niveles el coste por frame depende de los píxeles del panel, no del número de casas:
+# el mapa píxel -> casa (o sector) se calcula una vez por estructura y tamaño, y cada frame es un único gather.
+# "pixels" sólo se usa si cada casa tiene su celda (casas <= píxeles); con más casas que píxeles se pasa a "sectors",
+# donde el color sale de los agregados precalculados de las baldosas visibles. El panel inicial es estático: se
+# pinta una vez por escenario y en los frames siguientes sólo se vuelca su superficie.
+
+LEVEL_CIRCLES = "circles"
+LEVEL_PIXELS = "pixels"
+LEVEL_SECTORS = "sectors"
+LEVELS = (LEVEL_CIRCLES, LEVEL_PIXELS, LEVEL_SECTORS)
+STATS = ("mean", "max", "p95")
+CIRCLE_MAX_HOUSES = 400 # casas visibles (a zoom 1) a partir de las cuales se deja de dibujar círculos
+
+
+# --- Agregados por sector ---
+
+def sector_stats(values, offsets):
+    """Media, máximo y p95 (interpolación lineal, como np.percentile) de cada sector ignorando NaN; NaN si no hay valores."""
+    values = np.asarray(values, dtype=np.float32)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    sectors = len(counts)
+    valid = ~np.isnan(values)
+    sector_of_house = np.repeat(np.arange(sectors), counts)
+    valid_count = np.bincount(sector_of_house, weights=valid, minlength=sectors)
+    total = np.bincount(sector_of_house, weights=np.where(valid, values, 0.0), minlength=sectors)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / valid_count
+
+    if not len(values):
+        empty = np.full(sectors, np.nan, dtype=np.float32)
+        return {"mean": empty, "max": empty.copy(), "p95": empty.copy()}
+
+    # Orden dentro de cada sector (NaN al final): el máximo y el p95 salen por índice
+    ordered = np.where(valid, values, np.inf)
+    ordered = ordered[np.lexsort((ordered, sector_of_house))]
+    has_values = valid_count > 0
+    starts = offsets[:-1]
+    valid_count = valid_count.astype(np.int64)
+    last_index = len(ordered) - 1
+    maximum = ordered[np.minimum(starts + np.maximum(valid_count - 1, 0), last_index)]
+    position = 0.95 * np.maximum(valid_count - 1, 0)
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    low_value = ordered[np.minimum(starts + low, last_index)]
+    high_value = ordered[np.minimum(starts + high, last_index)]
+    with np.errstate(invalid="ignore"): # sectores sin valores: inf - inf, se descarta abajo
+        p95 = low_value + (high_value - low_value) * (position - low)
+    return {
+        "mean": mean.astype(np.float32),
+        "max": np.where(has_values, maximum, np.nan).astype(np.float32),
+        "p95": np.where(has_values, p95, np.nan).astype(np.float32),
+    }
+
+
+class SectorAggregates:
+    """Agregados por sector de un Scenario, calculados una vez por array y actualizados sólo en los sectores que cambian."""
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self._stats = {} # nombre del array ("initial", "modified", "previous") -> (array, estadísticas)
+
+    def stats(self, which):
+        values = getattr(self.scenario, which)
+        cached = self._stats.get(which)
+        if cached is None or cached[0] is not values:
+            cached = (values, sector_stats(values, self.scenario.sector_offsets))
+            self._stats[which] = cached
+        return cached[1]
+
+    def update(self, which, house_indices):
+        """Recalcula sólo los sectores de las casas indicadas (p.ej. valores que llegan en streaming)."""
+        cached = self._stats.get(which)
+        if cached is None or cached[0] is not getattr(self.scenario, which):
+            return # se calculará completo la próxima vez
+        offsets = self.scenario.sector_offsets
+        sectors = np.unique(np.searchsorted(offsets, np.asarray(house_indices), side="right") - 1)
+        values = cached[0]
+        for s in sectors.tolist():
+            start, end = int(offsets[s]), int(offsets[s + 1])
+            partial = sector_stats(values[start:end], [0, end - start])
+            for name in STATS:
+                cached[1][name][s] = partial[name][0]
+
+    def interpolated(self, stat, t):
+        """Agregado de los valores modificados durante la animación previous -> modified (interpolación de los agregados)."""
+        target = self.stats("modified")[stat]
+        if t >= 1.0 or self.scenario.previous is self.scenario.modified:
+            return target
+        previous = self.stats("previous")[stat]
+        previous = np.where(np.isnan(previous), target, previous)
+        return previous + (target - previous) * np.float32(t)
+
+
+# --- Mapas píxel -> elemento ---
+
+def _cell_map(cols, rows, cell, element_index, element_col, element_row, width, height, background):
+    """Mapa (width, height) con el índice del elemento en cada píxel; celdas de cell x cell con 1 px de separación si caben."""
+    small = np.full((cols, rows), background, dtype=np.int32)
+    small[element_col, element_row] = element_index
+    return _scale_map(small, cell, cell, width, height, background)
+
+
+def _scale_map(small, cell_w, cell_h, width, height, background):
+    """Escala un mapa (cols, rows) a celdas de cell_w x cell_h píxeles dentro de un mapa (width, height)."""
+    x = np.arange(min(width, small.shape[0] * cell_w))
+    y = np.arange(min(height, small.shape[1] * cell_h))
+    full = small[np.ix_(x // cell_w, y // cell_h)]
+    if min(cell_w, cell_h) >= 3:
+        # última columna/fila de cada celda: separación entre celdas
+        full[(x % cell_w) == cell_w - 1, :] = background
+        full[:, (y % cell_h) == cell_h - 1] = background
+    result = np.full((width, height), background, dtype=np.int32)
+    result[:full.shape[0], :full.shape[1]] = full
+    return result
+
+
+class PixelGrid:
+    """
+    Una celda por casa. Cada sector empieza en una fila nueva si así caben; si no (muchos sectores pequeños), las casas
+    se colocan seguidas y la celda es la mayor que permita verlas todas. `fits` es False si ni a 1 px caben todas.
+    """
+
+    def __init__(self, counts, width, height, max_cell=16):
+        self.width = width
+        self.height = height
+        self.fits = False
+        self.cell = 0
+        self.sector_rows = False # True si cada sector empieza en una fila nueva
+        self.map = None
+        counts = np.asarray(counts, dtype=np.int64)
+        total = int(counts.sum())
+        if width < 1 or height < 1 or total > width * height:
+            return
+        for cell in range(max_cell, 0, -1):
+            cols = width // cell
+            if cols < 1:
+                continue
+            sector_rows = (counts + cols - 1) // cols
+            if int(sector_rows.sum()) * cell <= height:
+                self.sector_rows = True
+            elif (total + cols - 1) // cols * cell > height:
+                continue
+            self.fits = True
+            self.cell = cell
+            break
+        if not self.fits:
+            return
+        local = np.arange(total)
+        if self.sector_rows:
+            local = local - np.repeat(np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+            row_start = np.repeat(np.concatenate(([0], np.cumsum(sector_rows)[:-1])), counts)
+            rows = int(sector_rows.sum())
+        else:
+            row_start = 0
+            rows = (total + cols - 1) // cols
+        self.map = _cell_map(cols, rows, self.cell, np.arange(total, dtype=np.int32), local % cols, row_start + local // cols,
+                             width, height, background=total)
+
+
+class SectorTiles:
+    """
+    Una baldosa por sector en una rejilla que ocupa el panel (si hay más sectores que píxeles se muestran los primeros).
+    En `map`, el índice `shown` es el fondo: sólo hacen falta colores para las baldosas visibles.
+    """
+
+    def __init__(self, sector_count, width, height):
+        self.width = width
+        self.height = height
+        self.count = sector_count
+        cols = max(1, int(np.ceil(np.sqrt(sector_count * width / max(height, 1)))))
+        cols = min(cols, max(width, 1))
+        rows = max(1, int(np.ceil(sector_count / cols)))
+        self.tile_w = max(1, width // cols)
+        self.tile_h = max(1, height // rows)
+        rows = min(rows, max(height, 1))
+        self.cols = cols
+        self.shown = min(sector_count, cols * rows)
+        index = np.full(cols * rows, self.shown, dtype=np.int32)
+        index[:self.shown] = np.arange(self.shown, dtype=np.int32)
+        self.map = _scale_map(index.reshape(rows, cols).T, self.tile_w, self.tile_h, width, height, background=self.shown)
+
+    def tile_rect(self, sector):
+        """(x, y, ancho, alto) de la baldosa de un sector, relativo al panel."""
+        return ((sector % self.cols) * self.tile_w, (sector // self.cols) * self.tile_h, self.tile_w, self.tile_h)
+
+
+class HeatmapRenderer:
+    """Dibuja los niveles "pixels" y "sectors" en dos paneles (inicial | modificado) con surfarray."""
+
+    def __init__(self, pulse, background):
+        self.pulse = pulse # se reutiliza su LUT de colores (Pulse.base_colors)
+        self.background = np.array(background, dtype=np.uint8)
+        self.panels = [] # [Rect inicial, Rect modificado]
+        self._surfaces = {} # (panel, tamaño) -> Surface reutilizada
+        self._initial_key = None # (valores iniciales, nivel, agregado, mapa) con los que se pintó el panel inicial
+        self._grid = None # (sector_offsets, tamaño, PixelGrid)
+        self._tiles = None
+        self._aggregates = None
+
+    def set_area(self, rect, gap=20):
+        rect = pygame.Rect(rect)
+        half = max(1, (rect.width - gap) // 2)
+        panels = [pygame.Rect(rect.x, rect.y, half, rect.height), pygame.Rect(rect.x + half + gap, rect.y, half, rect.height)]
+        if panels != self.panels:
+            self.panels = panels
+            self._grid = self._tiles = None
+        return self.panels
+
+    def _panel_size(self):
+        return self.panels[0].size
+
+    def pixel_grid(self, scenario):
+        if self._grid is None or not (self._grid[0] is scenario.sector_offsets or np.array_equal(self._grid[0], scenario.sector_offsets)):
+            self._grid = (scenario.sector_offsets, PixelGrid(np.diff(scenario.sector_offsets), *self._panel_size()))
+        return self._grid[1]
+
+    def choose_level(self, scenario, zoom=1.0, preferred=None):
+        """
+        Nivel según el número de casas y el zoom (acercarse permite círculos con más casas).
+        `preferred` fuerza un nivel; "pixels" cae a "sectors" si las casas no caben en el panel.
+        """
+        level = preferred
+        if level is None:
+            level = LEVEL_CIRCLES if len(scenario) / (zoom * zoom) <= CIRCLE_MAX_HOUSES else LEVEL_PIXELS
+        if level == LEVEL_PIXELS and not self.pixel_grid(scenario).fits:
+            level = LEVEL_SECTORS
+        return level
+
+    def sector_tiles(self, scenario):
+        if self._tiles is None or self._tiles.count != len(scenario.sectors):
+            self._tiles = SectorTiles(len(scenario.sectors), *self._panel_size())
+        return self._tiles
+
+    def aggregates(self, scenario):
+        if self._aggregates is None or self._aggregates.scenario is not scenario:
+            self._aggregates = SectorAggregates(scenario)
+        return self._aggregates
+
+    def _panel_surface(self, index, panel):
+        surface = self._surfaces.get((index, panel.size))
+        if surface is None:
+            surface = self._surfaces[(index, panel.size)] = pygame.Surface(panel.size)
+        return surface
+
+    def _paint(self, surface, element_map, colors):
+        palette = np.vstack((colors, self.background[None, :])) # último índice = fondo
+        pygame.surfarray.blit_array(surface, palette[element_map])
+
+    def render(self, screen, scenario, level, t, stat="mean"):
+        """Dibuja ambos paneles; devuelve los rectángulos de pantalla actualizados."""
+        initial_panel, modified_panel = self.panels
+        initial_surface = self._panel_surface(0, initial_panel)
+        modified_surface = self._panel_surface(1, modified_panel)
+        if level == LEVEL_PIXELS:
+            element_map = self.pixel_grid(scenario).map
+            key = (scenario.initial, level, None, element_map)
+            if not self._same_initial(key):
+                self._paint(initial_surface, element_map, self.pulse.base_colors(scenario.initial))
+            self._paint(modified_surface, element_map, self.pulse.base_colors(scenario.interpolated(t)))
+        else:
+            tiles = self.sector_tiles(scenario)
+            aggregates = self.aggregates(scenario)
+            element_map = tiles.map
+            key = (scenario.initial, level, stat, element_map)
+            if not self._same_initial(key):
+                self._paint(initial_surface, element_map, self.pulse.base_colors(aggregates.stats("initial")[stat][:tiles.shown]))
+            self._paint(modified_surface, element_map, self.pulse.base_colors(aggregates.interpolated(stat, t)[:tiles.shown]))
+        self._initial_key = key
+        screen.blit(initial_surface, initial_panel.topleft)
+        screen.blit(modified_surface, modified_panel.topleft)
+        return list(self.panels)
+
+    def _same_initial(self, key):
+        """True si el panel inicial ya está pintado con estos valores, nivel, agregado y mapa (no hay que repintarlo)."""
+        cached = self._initial_key
+        return (cached is not None and cached[0] is key[0] and cached[3] is key[3]
+                and cached[1:3] == key[1:3])
@@ -0,0 +1,256 @@
+import argparse
+import asyncio
+import json
+import numpy as np
+from aiohttp import web
+from .gen_cons import gen_arrays
+from .scenario import Scenario
+
+### Servidor LLM local de pruebas: sustituye a Gemini y a OpenRouter sin claves, red ni cuotas.
+# Habla ambos formatos: Gemini models/{modelo}:generateContent y :streamGenerateContent (SSE), y OpenRouter
+# chat/completions (con y sin "stream"). La latencia, la tasa de errores y el tamaño de las respuestas son
+# configurables (MockProfile) para medir el pipeline completo de forma reproducible. Los proveedores lo usan a
+# través de GEMINI_BASE_URL / OPENROUTER_BASE_URL (ver MockLLMServer.env()).
+#
+#   python -m utils.mock_server --port 8080 --latency lognormal:400:0.5 --error-rate 0.02 --sectors 50 --houses 20
+
+
+class Latency:
+    """Distribución de latencia: "fixed:MS", "uniform:MIN_MS:MAX_MS" o "lognormal:MEDIANA_MS:SIGMA"."""
+
+    def __init__(self, spec="fixed:0"):
+        kind, *args = str(spec).split(":")
+        self.kind = kind
+        self.args = [float(a) for a in args]
+        if kind not in ("fixed", "uniform", "lognormal") or len(self.args) != {"fixed": 1, "uniform": 2, "lognormal": 2}[kind]:
+            raise ValueError(f"Latencia no válida: {spec!r} (fixed:MS | uniform:MIN:MAX | lognormal:MEDIANA:SIGMA)")
+        self.spec = spec
+
+    def sample(self, rng):
+        """Segundos."""
+        if self.kind == "fixed":
+            ms = self.args[0]
+        elif self.kind == "uniform":
+            ms = rng.uniform(*self.args)
+        else:
+            ms = self.args[0] * float(np.exp(rng.normal(0.0, self.args[1])))
+        return ms / 1000.0
+
+
+class MockProfile:
+    """Comportamiento del servidor: latencia, errores y forma/tamaño de las respuestas."""
+
+    def __init__(self, latency="fixed:0", error_rate=0.0, rate_limit_rate=0.0, retry_after=1, sectors=3, houses_per_sector=10,
+                 chars_per_second=None, fence_rate=0.0, truncate_rate=0.0, stream_chunk=64, seed=None):
+        self.latency = latency if isinstance(latency, Latency) else Latency(latency) # hasta el primer byte
+        self.error_rate = error_rate # fracción de peticiones con 500
+        self.rate_limit_rate = rate_limit_rate # fracción con 429 + Retry-After
+        self.retry_after = retry_after # segundos
+        self.sectors = sectors # tamaño de los datasets generados (prompts sin JSON, como gen_data)
+        self.houses_per_sector = houses_per_sector
+        self.chars_per_second = chars_per_second # velocidad de "generación" (None = instantánea)
+        self.fence_rate = fence_rate # fracción de respuestas envueltas en ```json ... ```
+        self.truncate_rate = truncate_rate # fracción de respuestas cortadas (JSON incompleto)
+        self.stream_chunk = stream_chunk # caracteres por evento SSE
+        self.rng = np.random.default_rng(seed)
+
+    def respond(self, prompt):
+        """Texto de la respuesta: modifica el JSON del prompt o, si no trae datos, genera un dataset nuevo."""
+        data = _prompt_json(prompt)
+        if data is None:
+            names, counts, values = gen_arrays(sectors=self.sectors, houses_per_sector=self.houses_per_sector,
+                                               seed=int(self.rng.integers(2 ** 31)))
+            text = json.dumps(Scenario.from_arrays(names, counts, values).to_dict(decimals=2), indent=4)
+        else:
+            text = json.dumps(_modify(data, delta="whose value CHANGES" in prompt), indent=4)
+        if self.rng.random() < self.fence_rate:
+            text = f"```json\n{text}\n```"
+        if self.rng.random() < self.truncate_rate:
+            text = text[:int(len(text) * self.rng.uniform(0.3, 0.95))]
+        return text
+
+
+def _prompt_json(prompt):
+    """
+    Primer objeto {sector: {casa: valor}} del prompt (los datos a modificar), o None si no hay: la plantilla de
+    gen_data (con "{{") no es JSON válido como un todo, aunque lo sean sus trozos {casa: valor}.
+    """
+    decoder = json.JSONDecoder()
+    start = prompt.find("{")
+    while start != -1:
+        try:
+            data, _ = decoder.raw_decode(prompt, start)
+            if isinstance(data, dict) and data and all(isinstance(houses, dict) for houses in data.values()):
+                return data
+        except json.JSONDecodeError:
+            pass
+        start = prompt.find("{", start + 1)
+    return None
+
+
+def _modify(data, delta=False):
+    """Regla fija y determinista: los consumos >= 0.5 bajan 0.3. En modo delta sólo se devuelven las casas que cambian."""
+    result = {}
+    for sector, houses in data.items():
+        if not isinstance(houses, dict):
+            continue
+        changed = {}
+        for house, value in houses.items():
+            new_value = round(max(0.0, value - 0.3), 2) if isinstance(value, (int, float)) and value >= 0.5 else value
+            if not delta or new_value != value:
+                changed[house] = new_value
+        if changed or not delta:
+            result[sector] = changed
+    return result
+
+
+class MockLLMServer:
+    def __init__(self, profile=None, host="127.0.0.1", port=0):
+        self.profile = profile or MockProfile()
+        self.host = host
+        self.port = port # 0 = puerto libre elegido por el sistema
+        self._runner = None
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "rate_limited": 0, "bytes": 0}
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def env(self):
+        """Variables de entorno que apuntan los proveedores a este servidor."""
+        return {"GEMINI_BASE_URL": f"{self.url}/gemini/v1beta", "OPENROUTER_BASE_URL": f"{self.url}/openrouter/api/v1"}
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/gemini/v1beta/models/{action}", self._gemini)
+        app.router.add_post("/openrouter/api/v1/chat/completions", self._openrouter)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    # --- Manejo común: latencia, errores inyectados y tiempo de "generación" ---
+
+    async def _answer(self, request, prompt, stream, event, done_events=()):
+        self.stats["requests"] += 1
+        profile = self.profile
+        await asyncio.sleep(profile.latency.sample(profile.rng))
+        roll = profile.rng.random()
+        if roll < profile.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            return web.json_response({"error": {"code": 429, "message": "rate limited (mock)"}}, status=429,
+                                     headers={"Retry-After": str(profile.retry_after)})
+        if roll < profile.rate_limit_rate + profile.error_rate:
+            self.stats["errors"] += 1
+            return web.json_response({"error": {"code": 500, "message": "internal error (mock)"}}, status=500)
+
+        text = profile.respond(prompt)
+        generation_time = len(text) / profile.chars_per_second if profile.chars_per_second else 0.0
+        if not stream:
+            await asyncio.sleep(generation_time)
+            body = json.dumps(event(text, final=True)).encode()
+            self.stats["bytes"] += len(body)
+            return web.Response(body=body, content_type="application/json")
+
+        self.stats["streams"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        chunks = [text[i:i + profile.stream_chunk] for i in range(0, len(text), profile.stream_chunk)] or [""]
+        pause = generation_time / len(chunks)
+        for chunk in chunks:
+            if pause:
+                await asyncio.sleep(pause)
+            line = f"data: {json.dumps(event(chunk, final=False))}\n\n".encode()
+            self.stats["bytes"] += len(line)
+            await response.write(line)
+        for extra in done_events:
+            await response.write(extra)
+        await response.write_eof()
+        return response
+
+    async def _gemini(self, request):
+        model, _, method = request.match_info["action"].partition(":")
+        if method not in ("generateContent", "streamGenerateContent"):
+            return web.json_response({"error": {"code": 404, "message": f"unknown method {method!r}"}}, status=404)
+        body = await request.json()
+        prompt = "".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+
+        def event(text, final):
+            candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+            response = {"candidates": [candidate], "modelVersion": model}
+            if final:
+                candidate["finishReason"] = "STOP"
+                prompt_tokens, completion_tokens = _tokens(prompt), _tokens(text)
+                response["usageMetadata"] = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens,
+                                             "totalTokenCount": prompt_tokens + completion_tokens}
+            return response
+
+        finish = f"data: {json.dumps({'candidates': [{'finishReason': 'STOP', 'index': 0}]})}\n\n".encode()
+        return await self._answer(request, prompt, method == "streamGenerateContent", event, done_events=(finish,))
+
+    async def _openrouter(self, request):
+        body = await request.json()
+        prompt = "".join(str(message.get("content", "")) for message in body.get("messages", []))
+        model = body.get("model", "mock")
+
+        def event(text, final):
+            if body.get("stream"):
+                return {"model": model, "choices": [{"index": 0, "delta": {"role": "assistant", "content": text}}]}
+            prompt_tokens, completion_tokens = _tokens(prompt), _tokens(text)
+            return {"model": model, "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens}}
+
+        return await self._answer(request, prompt, bool(body.get("stream")), event, done_events=(b"data: [DONE]\n\n",))
+
+
+def _tokens(text):
+    """Recuento de tokens aproximado (~4 caracteres por token) para los campos de uso de las respuestas."""
+    return max(1, len(text) // 4)
+
+
+async def _serve(server):
+    await server.start()
+    print(f"--- [MockLLM] Escuchando en {server.url} ---")
+    for name, value in server.env().items():
+        print(f"export {name}={value}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor LLM local (formatos Gemini y OpenRouter) para pruebas y benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", default="fixed:0", help="fixed:MS | uniform:MIN:MAX | lognormal:MEDIANA:SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--sectors", type=int, default=3)
+    parser.add_argument("--houses", type=int, default=10, help="casas por sector de los datasets generados")
+    parser.add_argument("--chars-per-second", type=float, default=None)
+    parser.add_argument("--fence-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    profile = MockProfile(latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                          sectors=args.sectors, houses_per_sector=args.houses, chars_per_second=args.chars_per_second,
+                          fence_rate=args.fence_rate, truncate_rate=args.truncate_rate, seed=args.seed)
+    try:
+        asyncio.run(_serve(MockLLMServer(profile, args.host, args.port)))
+    except KeyboardInterrupt:
+        pass
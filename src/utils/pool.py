@@ -0,0 +1,71 @@
+import asyncio
+import weakref
+import aiohttp
+
+### Pool de conexiones HTTP compartido por todas las instancias de flowtask.
+# Una aiohttp.ClientSession queda ligada al event loop donde se crea, así que el
+# pool guarda una sesión por loop y la reutiliza en todas las llamadas de ese loop
+# (TCP + TLS + DNS se pagan una sola vez por host).
+
+
+class SessionPool:
+    def __init__(self, limit=100, limit_per_host=10, keepalive_timeout=30, ttl_dns_cache=300, timeout=120):
+        self.limit = limit # conexiones totales abiertas como máximo
+        self.limit_per_host = limit_per_host # conexiones simultáneas por host (Gemini, OpenRouter...)
+        self.keepalive_timeout = keepalive_timeout # segundos que una conexión ociosa se mantiene viva
+        self.ttl_dns_cache = ttl_dns_cache # segundos que se cachea la resolución DNS
+        self.timeout = timeout # timeout total por petición (segundos)
+        self._sessions = weakref.WeakKeyDictionary() # loop -> ClientSession
+
+    def _new_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.ttl_dns_cache,
+            use_dns_cache=True,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    def session(self):
+        """Devuelve la sesión del event loop actual, creándola si no existe o si se cerró."""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = self._new_session()
+            self._sessions[loop] = session
+        return session
+
+    async def close(self):
+        """Cierra la sesión del event loop actual (llamar antes de cerrar el loop)."""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+
+_default_pool = None
+
+
+def get_pool():
+    """Pool compartido por defecto (se crea la primera vez que se pide)."""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = SessionPool()
+    return _default_pool
+
+
+def configure_pool(**kwargs):
+    """Reemplaza el pool por defecto con otros límites. Las sesiones ya abiertas del pool anterior no se cierran aquí."""
+    global _default_pool
+    _default_pool = SessionPool(**kwargs)
+    return _default_pool
+
+
+async def close_pool():
+    """Hook de cierre: libera las conexiones del pool por defecto en el loop actual."""
+    if _default_pool is not None:
+        await _default_pool.close()
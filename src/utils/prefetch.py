@@ -0,0 +1,99 @@
+import asyncio
+from collections import deque
+
+### Buffer de precarga especulativa: mantiene los próximos N escenarios ya generados en segundo plano.
+# Un clic en "Regenerar" saca uno listo al instante (hit) y dispara la recarga del buffer.
+# Vive en el event loop del worker de regeneración; no es thread-safe.
+
+
+class PrefetchBuffer:
+    def __init__(self, produce, depth=2, token_budget=None, estimate_tokens=None):
+        self.produce = produce # corrutina sin argumentos que devuelve un escenario o None
+        self.depth = depth # escenarios listos + en curso como máximo
+        self.token_budget = token_budget # tokens estimados retenidos en el buffer como máximo (None = sin límite)
+        self.estimate_tokens = estimate_tokens or (lambda item: 0)
+        self._ready = deque() # (item, tokens)
+        self._inflight = deque() # tareas de precarga en curso, en orden de lanzamiento
+        self._last_tokens = 0 # tamaño estimado del último escenario (para reservar presupuesto a las tareas en curso)
+        self.hits = 0 # escenario ya listo en el buffer
+        self.inflight_hits = 0 # había una precarga en curso: se espera a ella en lugar de empezar de cero
+        self.misses = 0
+        self.discarded = 0 # escenarios tirados por invalidate() o fallidos
+
+    async def get(self, produce_now=None):
+        """Siguiente escenario: del buffer si hay uno listo, si no de la precarga en curso o de `produce_now()`."""
+        item = None
+        if self._ready:
+            item, _ = self._ready.popleft()
+            self.hits += 1
+        else:
+            while self._inflight and item is None:
+                task = self._inflight.popleft()
+                try:
+                    # shield: si cancelan al que espera (trabajo reemplazado) la precarga sigue valiendo
+                    item = await asyncio.shield(task)
+                except asyncio.CancelledError:
+                    if not task.cancelled():
+                        self._inflight.appendleft(task) # devolverla al buffer para el próximo get()
+                        if task.done():
+                            self._on_done(task)
+                        raise
+                except Exception:
+                    item = None
+                if item is None:
+                    self.discarded += 1
+                else:
+                    self.inflight_hits += 1
+            if item is None:
+                self.misses += 1
+                item = await (produce_now or self.produce)()
+                if item is not None:
+                    self._last_tokens = self.estimate_tokens(item)
+        self.refill()
+        return item
+
+    def reserved_tokens(self):
+        return sum(tokens for _, tokens in self._ready) + len(self._inflight) * self._last_tokens
+
+    def refill(self):
+        """Lanza precargas hasta llenar la profundidad configurada sin pasar del presupuesto de tokens."""
+        while len(self._ready) + len(self._inflight) < self.depth:
+            if self.token_budget is not None and self.reserved_tokens() + self._last_tokens > self.token_budget:
+                break
+            task = asyncio.ensure_future(self.produce())
+            task.add_done_callback(self._on_done)
+            self._inflight.append(task)
+
+    def _on_done(self, task):
+        if task not in self._inflight:
+            return # ya la consumió get() o la canceló invalidate()
+        self._inflight.remove(task)
+        item = None if task.cancelled() or task.exception() is not None else task.result()
+        if item is None:
+            self.discarded += 1 # no se recarga en bucle tras un fallo: el próximo get() lo volverá a intentar
+            return
+        tokens = self.estimate_tokens(item)
+        self._last_tokens = tokens
+        self._ready.append((item, tokens))
+
+    def invalidate(self):
+        """Descarta los escenarios listos y cancela las precargas (p.ej. porque cambiaron las reglas)."""
+        self.discarded += len(self._ready) + len(self._inflight)
+        self._ready.clear()
+        inflight = list(self._inflight)
+        self._inflight.clear()
+        for task in inflight:
+            task.cancel()
+
+    def stats(self):
+        total = self.hits + self.inflight_hits + self.misses
+        return {
+            "hits": self.hits,
+            "inflight_hits": self.inflight_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "ready": len(self._ready),
+            "inflight": len(self._inflight),
+            "reserved_tokens": self.reserved_tokens(),
+            "discarded": self.discarded,
+        }
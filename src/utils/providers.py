@@ -0,0 +1,334 @@
+import asyncio
+import json
+import os
+import aiohttp
+from .resilience import ProviderError, parse_retry_after
+from .tracing import tracer, BYTES_BUCKETS, TOKENS_BUCKETS
+from .jsonextract import loads
+
+### Registro de proveedores: nombre de modelo -> adaptador.
+# Cada adaptador resuelve una sola vez (al crear el flowtask) la URL, las cabeceras y el
+# modelo real, de modo que en cada petición sólo queda construir el cuerpo y parsear la respuesta.
+
+# URLs base; GEMINI_BASE_URL / OPENROUTER_BASE_URL (variables de entorno) las sustituyen, p.ej. por el servidor
+# local de utils.mock_server. Con una URL base propia no se exigen claves de API (ni el id real del modelo).
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+
+def base_url(env_name, default):
+    """URL base del proveedor (la de la variable de entorno `env_name` si está definida) y si es la oficial."""
+    url = os.environ.get(env_name, "").rstrip("/")
+    return (url, False) if url else (default, True)
+
+
+class Provider:
+    """Adaptador base. Las subclases definen url, headers, build_payload() y parse()."""
+    name = "base"
+    needs_session = True # send()/stream() usan la aiohttp.ClientSession del pool
+
+    def __init__(self, aimodel):
+        self.aimodel = aimodel
+        self.url = None
+        self.stream_url = None
+        self.headers = {}
+
+    def build_payload(self, input_text, stream=False):
+        raise NotImplementedError
+
+    def parse(self, output_data):
+        raise NotImplementedError
+
+    def parse_delta(self, event):
+        """Texto de un evento SSE del modo streaming ("" si el evento no trae texto)."""
+        raise NotImplementedError
+
+    def finish_reason(self, event):
+        """Motivo de fin que trae un evento SSE (None si no trae ninguno)."""
+        return None
+
+    def usage(self, output_data):
+        """(tokens del prompt, tokens generados) según la respuesta, o None si el proveedor no los informa."""
+        return None
+
+    def _record_usage(self, output_data):
+        try:
+            usage = self.usage(output_data)
+        except (KeyError, TypeError, AttributeError):
+            usage = None
+        if usage is None:
+            return
+        prompt_tokens, completion_tokens = usage
+        tracer.count("llm_tokens_total", prompt_tokens, provider=self.name, kind="prompt")
+        tracer.count("llm_tokens_total", completion_tokens, provider=self.name, kind="completion")
+        tracer.observe("llm_completion_tokens", completion_tokens, TOKENS_BUCKETS, provider=self.name)
+
+    async def _status_error(self, response):
+        return ProviderError(
+            "respuesta no válida",
+            status=response.status,
+            body=await response.text(),
+            provider=self.name,
+            retry_after=parse_retry_after(response.headers.get("Retry-After")),
+        )
+
+    async def send(self, session, input_text):
+        """Devuelve el texto generado o lanza ProviderError."""
+        with tracer.span("http", provider=self.name, model=self.aimodel) as span:
+            status = "network_error"
+            try:
+                async with session.post(self.url, headers=self.headers, data=self.build_payload(input_text)) as response:
+                    status = response.status
+                    if response.status != 200:
+                        raise await self._status_error(response)
+                    body = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise ProviderError(f"error de red: {e!r}", provider=self.name) from e
+            finally:
+                tracer.count("llm_requests_total", provider=self.name, status=status)
+            try:
+                output_data = loads(body)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                # Cuerpo cortado o página de error de un proxy con estado 200: fallo transitorio, se reintenta
+                raise ProviderError(f"respuesta no es JSON: {e}", body=body[:500].decode("utf-8", "replace"), provider=self.name) from e
+            if tracer.enabled:
+                span.set(status=status, bytes=len(body))
+                tracer.observe("llm_response_bytes", len(body), BYTES_BUCKETS, provider=self.name)
+                self._record_usage(output_data)
+        try:
+            return self.parse(output_data)
+        except (KeyError, IndexError, TypeError) as e:
+            # p.ej. respuesta bloqueada por filtros de seguridad (sin "candidates")
+            error = ProviderError(f"respuesta con formato inesperado: {e!r}", body=json.dumps(output_data)[:500], provider=self.name)
+            error.retryable = False
+            raise error from e
+
+    async def stream(self, session, input_text):
+        """Generador asíncrono de fragmentos de texto a medida que el proveedor los emite (SSE).
+
+        Si la conexión se cierra sin un fin limpio ("[DONE]" o un finish_reason de parada) lanza ProviderError al
+        final: la respuesta está cortada y no debe tratarse (ni guardarse en la caché) como completa.
+        """
+        with tracer.span("http_stream", provider=self.name, model=self.aimodel) as span:
+            status = "network_error"
+            chars = 0
+            finish = None
+            try:
+                async with session.post(self.stream_url, headers=self.headers, data=self.build_payload(input_text, stream=True)) as response:
+                    status = response.status
+                    if response.status != 200:
+                        raise await self._status_error(response)
+                    async for event in _sse_events(response):
+                        if event is DONE:
+                            finish = finish or "done"
+                            break
+                        finish = self.finish_reason(event) or finish
+                        text = self.parse_delta(event)
+                        if text:
+                            if not chars and tracer.enabled:
+                                tracer.observe("llm_first_chunk_seconds", span.elapsed(), provider=self.name)
+                            chars += len(text)
+                            yield text
+                        elif tracer.enabled:
+                            self._record_usage(event) # el último evento suele traer el recuento de tokens
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise ProviderError(f"error de red durante el streaming: {e!r}", provider=self.name) from e
+            finally:
+                tracer.count("llm_requests_total", provider=self.name, status=status, stream="true")
+                span.set(status=status, chars=chars, finish=finish)
+            if finish not in CLEAN_FINISH:
+                error = ProviderError(f"streaming sin fin limpio (finish_reason={finish})", provider=self.name)
+                error.retryable = finish is None # conexión cortada; "length"/"MAX_TOKENS" se repetiría igual
+                raise error
+
+
+DONE = object() # marca "[DONE]" de _sse_events
+CLEAN_FINISH = ("done", "stop", "STOP") # "[DONE]" (OpenRouter) o finish_reason/finishReason de parada normal
+
+
+async def _sse_events(response):
+    """Eventos JSON de un cuerpo Server-Sent Events ("data: {...}" por línea); DONE si llega "[DONE]"."""
+    async for raw_line in response.content:
+        line = raw_line.decode("utf-8").strip()
+        if not line.startswith("data:"):
+            continue # líneas vacías y comentarios (": OPENROUTER PROCESSING")
+        data = line[5:].strip()
+        if data == "[DONE]":
+            yield DONE
+            return
+        try:
+            yield json.loads(data)
+        except json.JSONDecodeError:
+            continue
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+
+    def __init__(self, aimodel):
+        super().__init__(aimodel)
+        base, official = base_url("GEMINI_BASE_URL", GEMINI_BASE_URL)
+        apikey = os.environ.get("GOOGLE_API_KEY") #Google Api
+        if not apikey:
+            if official:
+                raise ValueError("GOOGLE_API_KEY no está definida. Asegúrate de que la variable de entorno esté configurada correctamente.")
+            apikey = "local"
+        self.url = f"{base}/models/{aimodel}:generateContent"
+        self.stream_url = f"{base}/models/{aimodel}:streamGenerateContent?alt=sse"
+        self.headers = {
+            "Content-Type": "application/json",
+            "x-goog-api-key": apikey
+        }
+
+    def build_payload(self, input_text, stream=False):
+        # el streaming de Gemini usa otra URL (streamGenerateContent), el cuerpo es el mismo
+        return json.dumps({
+            "contents": [{
+                "parts": [{
+                    "text": input_text
+                }]
+            }]
+        })
+
+    def parse(self, output_data):
+        return output_data["candidates"][0]["content"]["parts"][0]["text"]
+
+    def usage(self, output_data):
+        metadata = output_data.get("usageMetadata")
+        if not metadata:
+            return None
+        return metadata.get("promptTokenCount", 0), metadata.get("candidatesTokenCount", 0)
+
+    def parse_delta(self, event):
+        try:
+            return self.parse(event)
+        except (KeyError, IndexError, TypeError):
+            return "" # p.ej. el último evento sólo trae finishReason/usageMetadata
+
+    def finish_reason(self, event):
+        try:
+            return event["candidates"][0].get("finishReason")
+        except (KeyError, IndexError, TypeError, AttributeError):
+            return None
+
+
+class OpenRouterProvider(Provider):
+    """Modelos servidos por OpenRouter (formato chat-completions). El id real del modelo se lee de una variable de entorno."""
+    name = "openrouter"
+
+    def __init__(self, aimodel, model_env):
+        super().__init__(aimodel)
+        base, official = base_url("OPENROUTER_BASE_URL", OPENROUTER_BASE_URL)
+        apikey = os.environ.get("OPENROUTER_API_KEY")
+        model = os.environ.get(model_env)
+        if not apikey:
+            if official:
+                raise ValueError("OPENROUTER_API_KEY no está definida")
+            apikey = "local"
+        if not model:
+            if official:
+                raise ValueError(f"{model_env} no está definida")
+            model = aimodel
+        self.model = model
+        self.url = f"{base}/chat/completions"
+        self.stream_url = self.url
+        self.headers = {
+            "Authorization": f"Bearer {apikey}",
+            "Content-Type": "application/json"
+        }
+
+    def build_payload(self, input_text, stream=False):
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": input_text
+                }
+            ],
+        }
+        if stream:
+            payload["stream"] = True
+        return json.dumps(payload)
+
+    def parse(self, output_data):
+        return output_data["choices"][0]["message"]["content"]
+
+    def usage(self, output_data):
+        usage = output_data.get("usage")
+        if not usage:
+            return None
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+    def parse_delta(self, event):
+        try:
+            return event["choices"][0]["delta"].get("content") or ""
+        except (KeyError, IndexError, TypeError, AttributeError):
+            return ""
+
+    def finish_reason(self, event):
+        try:
+            return event["choices"][0].get("finish_reason")
+        except (KeyError, IndexError, TypeError, AttributeError):
+            return None
+
+
+class LocalStubProvider(Provider):
+    """Proveedor local sin red, para pruebas y ejecuciones offline.
+
+    `responder(input_text) -> str` genera la respuesta. Por defecto devuelve el primer
+    objeto JSON que aparezca en el prompt (es decir, "modifica" sin cambiar nada).
+    """
+    name = "local"
+    needs_session = False # sin red: flowtask no crea sesión HTTP para este proveedor
+
+    def __init__(self, aimodel, responder=None):
+        super().__init__(aimodel)
+        self.url = "local://" + aimodel
+        self.responder = responder or _echo_json
+
+    async def send(self, session, input_text):
+        return self.responder(input_text)
+
+    async def stream(self, session, input_text, chunk_size=64):
+        output_text = self.responder(input_text)
+        for start in range(0, len(output_text), chunk_size):
+            yield output_text[start:start + chunk_size]
+            await asyncio.sleep(0)
+
+
+def _echo_json(input_text):
+    start = input_text.find("{")
+    end = input_text.rfind("}")
+    if start == -1 or end < start:
+        return "{}"
+    return input_text[start:end + 1]
+
+
+# nombre de modelo -> fábrica(aimodel) que devuelve el adaptador
+PROVIDERS = {
+    # GOOGLE
+    "gemini-2.0-flash": GeminiProvider,
+    "gemma-3-27b-it": GeminiProvider,
+    "gemini-2.5-pro-exp-03-25": GeminiProvider,
+    # OPENROUTER
+    "qwen1": lambda aimodel: OpenRouterProvider(aimodel, "QWEN_MODEL"),
+    "deepseek-r1": lambda aimodel: OpenRouterProvider(aimodel, "DEEPSEEK_R1_MODEL"),
+    "deepseek-r1-zero": lambda aimodel: OpenRouterProvider(aimodel, "DEEPSEEK_R1_ZERO_MODEL"),
+    "deepseek-cv3": lambda aimodel: OpenRouterProvider(aimodel, "DEEPSEEK_CV3_MODEL"),
+    "quasar-alpha": lambda aimodel: OpenRouterProvider(aimodel, "QUASAR_ALPHA_MODEL"),
+    # LOCAL
+    "local-stub": LocalStubProvider,
+}
+
+
+def register_provider(aimodel, factory):
+    """Añade (o reemplaza) el adaptador usado para `aimodel`. `factory(aimodel)` devuelve un Provider."""
+    PROVIDERS[aimodel] = factory
+
+
+def resolve_provider(aimodel):
+    factory = PROVIDERS.get(aimodel)
+    if factory is None:
+        raise ValueError(f"Modelo no soportado: {aimodel}. Modelos registrados: {', '.join(PROVIDERS)}")
+    return factory(aimodel)
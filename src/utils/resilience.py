@@ -0,0 +1,147 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from .tracing import tracer
+
+### Capa de resiliencia para las llamadas a proveedores:
+# reintentos con backoff exponencial + jitter (429/5xx/errores de red), respeto de Retry-After
+# y un circuit breaker por proveedor que falla rápido mientras el proveedor está caído.
+
+
+class ProviderError(Exception):
+    """Error tipado de una llamada a un proveedor (sustituye a la antigua tupla (texto, status))."""
+
+    def __init__(self, message, status=None, body=None, provider=None, retry_after=None):
+        super().__init__(message)
+        self.status = status # código HTTP (None si falló la red o el parseo)
+        self.body = body # cuerpo de la respuesta de error, si lo hay
+        self.provider = provider
+        self.retry_after = retry_after # segundos pedidos por el servidor, si los indicó
+        self.retryable = status is None or status == 429 or status >= 500
+
+    def __str__(self):
+        status = f" (HTTP {self.status})" if self.status is not None else ""
+        return f"[{self.provider}] {self.args[0]}{status}"
+
+
+class CircuitOpenError(ProviderError):
+    """El circuit breaker del proveedor está abierto: no se hace la petición."""
+
+    def __init__(self, provider, retry_in):
+        super().__init__(f"circuito abierto, reintentar en {retry_in:.1f}s", provider=provider, retry_after=retry_in)
+        self.retryable = False
+
+
+def parse_retry_after(value):
+    """Convierte una cabecera Retry-After (segundos o fecha HTTP) en segundos. None si no es válida."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    closed -> open tras `failure_threshold` fallos seguidos; tras `reset_timeout` deja pasar una única petición de
+    prueba (half-open): mientras está en curso, las demás llamadas (shards, hedge, prefetch) se rechazan.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None # inicio de la petición de prueba en curso (half-open)
+        self.state = "closed"
+
+    def before_call(self):
+        now = time.monotonic()
+        if self.state == "open":
+            elapsed = now - self.opened_at
+            if elapsed < self.reset_timeout:
+                raise CircuitOpenError(self.name, self.reset_timeout - elapsed)
+            self.state = "half-open"
+            self.probe_started = None
+        if self.state == "half-open":
+            # Si la prueba nunca informó (p.ej. el perdedor cancelado de un hedge), se admite otra tras reset_timeout
+            if self.probe_started is not None and now - self.probe_started < self.reset_timeout:
+                raise CircuitOpenError(self.name, self.reset_timeout - (now - self.probe_started))
+            self.probe_started = now
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+        self.state = "closed"
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_started = None
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"--- [Breaker] Circuito abierto para {self.name} ({self.failures} fallos seguidos) ---")
+                tracer.count("breaker_opened_total", provider=self.name)
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=8.0, max_total=15.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay # espera máxima entre dos intentos
+        self.max_total = max_total # presupuesto total de espera: no bloquear la regeneración decenas de segundos
+
+    def delay(self, attempt, retry_after=None):
+        # "full jitter": uniforme entre 0 y base * 2^intento
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            backoff = max(backoff, retry_after)
+        return backoff
+
+
+_breakers = {}
+
+
+def get_breaker(name):
+    """Circuit breaker compartido para un proveedor (todas las instancias de flowtask lo comparten)."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+async def call_with_retry(call, breaker, policy):
+    """Ejecuta `call()` (corrutina) con reintentos según `policy` y bajo el `breaker` dado."""
+    waited = 0.0
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = await call()
+        except ProviderError as e:
+            if e.retryable:
+                breaker.record_failure()
+            else:
+                breaker.record_success() # el proveedor respondió: no cuenta como caída
+            attempt += 1
+            if not e.retryable or attempt >= policy.max_attempts or breaker.state == "open":
+                raise
+            delay = policy.delay(attempt - 1, e.retry_after)
+            if waited + delay > policy.max_total:
+                raise # esperar más excedería el presupuesto: fallar ya
+            print(f"--- [Retry] {e}. Reintento {attempt}/{policy.max_attempts - 1} en {delay:.2f}s ---")
+            tracer.count("llm_retries_total", provider=breaker.name, status=e.status or "network_error")
+            await asyncio.sleep(delay)
+            waited += delay
+        else:
+            breaker.record_success()
+            return result
@@ -0,0 +1,151 @@
+import re
+import numpy as np
+
+### Motor de reglas local y vectorizado: alternativa determinista al modificador LLM.
+# Compila políticas de umbral del tipo
+#     ">= 0.5 is not normal, subtract 0.1 - 0.6"
+#     "< 0.3 its normal consumption, don't do anything"
+#     "Ensure final values are between 0.0 and 1.0."
+# a operaciones NumPy sobre todo el dataset. Las reglas libres (que no encajan en ese
+# formato) se siguen mandando al LLM: basta una línea que el motor no pueda expresar por completo
+# (porcentajes, nombres de sector, verbos desconocidos, instrucciones sin umbral) para devolver None.
+
+_COMPARISON = re.compile(r"(<=|>=|<|>)\s*(\d*\.?\d+)")
+_ADJUST = re.compile(
+    r"\b(subtract|decrease|reduce|lower|add|increase|raise)\b(?:\s+by)?\s*(\d*\.?\d+)(?:\s*(?:-|to|and)\s*(\d*\.?\d+))?",
+    re.IGNORECASE,
+)
+_NO_CHANGE = re.compile(r"don'?t do anything|do nothing|leave (?:it|them)?\s*(?:alone|unchanged)|no change|unchanged", re.IGNORECASE)
+_CLAMP = re.compile(r"between\s*(\d*\.?\d+)\s*and\s*(\d*\.?\d+)", re.IGNORECASE)
+_NEGATIVE = {"subtract", "decrease", "reduce", "lower"}
+# Lo que el motor no sabe aplicar: porcentajes, reglas por sector y acciones que no son sumar/restar un delta
+_UNSUPPORTED = re.compile(
+    r"%|\bpercent|\bsector|\b(?:set|double|doubled|triple|tripled|multiply|multiplied|divide|divided|halve|halved|"
+    r"zero|times|scale|scaled|replace|swap|if|unless|except|only|regardless)\b",
+    re.IGNORECASE,
+)
+
+
+class ThresholdRule:
+    """Si el valor cumple las comparaciones, se le suma un delta uniforme en [delta_min, delta_max]."""
+
+    def __init__(self, comparisons, delta_min=0.0, delta_max=0.0):
+        self.comparisons = comparisons # lista de (operador, umbral), p.ej. [(">=", 0.3), ("<=", 0.5)]
+        self.delta_min = delta_min
+        self.delta_max = delta_max
+
+    def mask(self, values):
+        mask = np.ones(values.shape, dtype=bool)
+        for op, threshold in self.comparisons:
+            if op == "<":
+                mask &= values < threshold
+            elif op == "<=":
+                mask &= values <= threshold
+            elif op == ">":
+                mask &= values > threshold
+            else:
+                mask &= values >= threshold
+        return mask
+
+    def __repr__(self):
+        cond = " & ".join(f"{op} {threshold}" for op, threshold in self.comparisons)
+        return f"ThresholdRule({cond} -> [{self.delta_min:+}, {self.delta_max:+}])"
+
+
+class RuleEngine:
+    """
+    Aplica una lista de ThresholdRule a un array de consumos en una sola pasada.
+    Si varias reglas cubren el mismo valor gana la última (en el texto de las reglas de
+    Energy_manager, 0.5 cae en "<= 0.5 no hacer nada" y en ">= 0.5 restar": se resta).
+    """
+
+    def __init__(self, rules, clamp=(0.0, 1.0), seed=None, decimals=2):
+        self.rules = rules
+        self.clamp = clamp
+        self.decimals = decimals # redondeo del resultado (como las respuestas del LLM); None = sin redondeo
+        self.rng = np.random.default_rng(seed)
+
+    def apply_array(self, values):
+        """Devuelve un array float32 nuevo con las reglas aplicadas (los NaN se mantienen como NaN)."""
+        values = np.asarray(values, dtype=np.float32)
+        low = np.zeros(values.shape, dtype=np.float32)
+        high = np.zeros(values.shape, dtype=np.float32)
+        selected = np.empty(values.shape, dtype=np.float32)
+        for rule in self.rules:
+            # low += (delta - low) * mask: la última regla que cubre el valor gana, sin asignación con máscara (lenta)
+            np.copyto(selected, rule.mask(values))
+            low += (np.float32(rule.delta_min) - low) * selected
+            high += (np.float32(rule.delta_max) - high) * selected
+        result = self.rng.random(values.shape, dtype=np.float32)
+        high -= low
+        result *= high
+        result += low
+        result += values
+        if self.clamp is not None:
+            np.clip(result, self.clamp[0], self.clamp[1], out=result)
+        if self.decimals is not None:
+            np.round(result, self.decimals, out=result)
+        return result
+
+    def apply(self, data_dict):
+        """Versión para el formato {"Sector-X": {"house-N": valor}}: devuelve un diccionario nuevo con la misma estructura."""
+        keys = []
+        values = []
+        for sector, houses in data_dict.items():
+            if not isinstance(houses, dict):
+                continue
+            for house, value in houses.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    keys.append((sector, house))
+                    values.append(value)
+        modified = self.apply_array(np.array(values, dtype=np.float32)).astype(np.float64)
+        if self.decimals is not None:
+            modified = np.round(modified, self.decimals) # evitar 0.20000000298 al pasar de float32 a float
+        modified = modified.tolist()
+        result = {sector: dict(houses) if isinstance(houses, dict) else houses for sector, houses in data_dict.items()}
+        for (sector, house), value in zip(keys, modified):
+            result[sector][house] = value
+        return result
+
+
+def compile_rules(text, seed=None):
+    """
+    Intenta compilar un texto de reglas de umbral a un RuleEngine.
+    Devuelve None (regla libre -> usar el LLM) si alguna línea no se puede expresar por completo: acciones no
+    reconocidas, porcentajes, nombres de sector o líneas sin umbral que no sean el rango final ("Ensure final
+    values are between ...") ni una introducción que acabe en ":" ("Use this as the reference:").
+    """
+    rules = []
+    clamp = (0.0, 1.0)
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if _UNSUPPORTED.search(line):
+            return None
+        comparisons = [(op, float(threshold)) for op, threshold in _COMPARISON.findall(line)]
+        if not comparisons:
+            clamp_match = _CLAMP.search(line)
+            if clamp_match and re.search(r"final|ensure|clamp|remain|keep", line, re.IGNORECASE):
+                clamp = (float(clamp_match.group(1)), float(clamp_match.group(2)))
+            elif not line.endswith(":"):
+                return None # instrucción sin umbral: el motor no sabe a qué casas aplicarla
+            continue
+        adjustments = _ADJUST.findall(line)
+        if len(adjustments) > 1 or (adjustments and _NO_CHANGE.search(line)):
+            return None # acciones combinadas o contradictorias en la misma línea
+        adjust = _ADJUST.search(line)
+        if adjust:
+            first = float(adjust.group(2))
+            second = float(adjust.group(3)) if adjust.group(3) else first
+            low, high = sorted((first, second))
+            if adjust.group(1).lower() in _NEGATIVE:
+                low, high = -high, -low
+            rules.append(ThresholdRule(comparisons, low, high))
+        elif _NO_CHANGE.search(line):
+            rules.append(ThresholdRule(comparisons))
+        else:
+            return None
+    if not rules:
+        return None
+    return RuleEngine(rules, clamp=clamp, seed=seed)
@@ -0,0 +1,185 @@
+import json
+import sys
+import numpy as np
+
+### Representación columnar de un escenario de consumo.
+# En lugar de {"Sector-A": {"house-1": 0.05, ...}} se guardan:
+#   - los nombres de sector y de casa internados una sola vez (house_names es una tabla compartida),
+#   - sector_offsets: las casas del sector s ocupan [offsets[s], offsets[s + 1]),
+#   - house_ids: índice de cada casa en house_names,
+#   - initial / modified / previous: arrays float32 contiguos (NaN = valor ausente o no numérico).
+
+
+class Scenario:
+    def __init__(self, sectors, sector_offsets, house_names, house_ids, initial, modified=None, previous=None):
+        self.sectors = [sys.intern(name) for name in sectors]
+        self.sector_offsets = np.asarray(sector_offsets, dtype=np.int64)
+        self.house_names = house_names
+        self.house_ids = np.asarray(house_ids, dtype=np.int32)
+        self.initial = np.asarray(initial, dtype=np.float32)
+        self.modified = self._empty() if modified is None else np.asarray(modified, dtype=np.float32)
+        self.previous = self.modified if previous is None else np.asarray(previous, dtype=np.float32)
+        self._lookup = None # {sector: {house: índice}}, se construye la primera vez que se usa index()
+
+    def _empty(self):
+        return np.full(len(self.initial), np.nan, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.initial)
+
+    # --- Construcción ---
+
+    @classmethod
+    def from_dict(cls, initial_dict, modified_dict=None):
+        """Desde el formato de diccionario actual. Las casas de `modified_dict` se alinean con las de `initial_dict`."""
+        sectors = []
+        offsets = [0]
+        house_names = []
+        name_index = {}
+        house_ids = []
+        values = []
+        for sector, houses in initial_dict.items():
+            sectors.append(sector)
+            if isinstance(houses, dict):
+                for house, value in houses.items():
+                    house_id = name_index.get(house)
+                    if house_id is None:
+                        house_id = name_index[house] = len(house_names)
+                        house_names.append(sys.intern(house))
+                    house_ids.append(house_id)
+                    values.append(_as_float(value))
+            offsets.append(len(values))
+        scenario = cls(sectors, offsets, house_names, house_ids, np.array(values, dtype=np.float32))
+        if modified_dict is not None:
+            scenario.modified = scenario.previous = scenario.values_from_dict(modified_dict)
+        return scenario
+
+    @classmethod
+    def from_arrays(cls, sectors, counts, values):
+        """Desde la salida de gen_cons.gen_arrays: casas "house-1".."house-N" en cada sector."""
+        counts = np.asarray(counts, dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        house_names = [sys.intern(f"house-{i}") for i in range(1, int(counts.max(initial=0)) + 1)]
+        # house_ids = 0..count-1 dentro de cada sector, sin bucle en Python
+        house_ids = np.arange(int(offsets[-1]), dtype=np.int64) - np.repeat(offsets[:-1], counts)
+        return cls(sectors, offsets, house_names, house_ids, values)
+
+    @classmethod
+    def from_json(cls, initial_json, modified_json=None):
+        return cls.from_dict(json.loads(initial_json), json.loads(modified_json) if modified_json else None)
+
+    def with_modified(self, modified):
+        """Nuevo Scenario con la misma estructura y valores iniciales (compartidos) y otros valores modificados (array o dict)."""
+        if isinstance(modified, dict):
+            modified = self.values_from_dict(modified)
+        return self.with_values(self.initial, modified)
+
+    def with_values(self, initial, modified=None):
+        """Nuevo Scenario con la misma estructura (compartida, sin copias) y otros arrays initial/modified."""
+        scenario = Scenario.__new__(Scenario)
+        scenario.sectors = self.sectors
+        scenario.sector_offsets = self.sector_offsets
+        scenario.house_names = self.house_names
+        scenario.house_ids = self.house_ids
+        scenario.initial = np.asarray(initial, dtype=np.float32)
+        scenario.modified = scenario.previous = scenario._empty() if modified is None else np.asarray(modified, dtype=np.float32)
+        scenario._lookup = self._lookup
+        return scenario
+
+    # --- Acceso ---
+
+    def sector_slice(self, sector_index):
+        return slice(int(self.sector_offsets[sector_index]), int(self.sector_offsets[sector_index + 1]))
+
+    def house_name(self, index):
+        return self.house_names[self.house_ids[index]]
+
+    def index(self, sector, house):
+        """Índice plano de (sector, casa) en O(1), o None si no existe."""
+        if self._lookup is None:
+            self._lookup = {}
+            for s, sector_name in enumerate(self.sectors):
+                start, end = int(self.sector_offsets[s]), int(self.sector_offsets[s + 1])
+                ids = self.house_ids[start:end].tolist()
+                self._lookup[sector_name] = {self.house_names[house_id]: start + i for i, house_id in enumerate(ids)}
+        return self._lookup.get(sector, {}).get(house)
+
+    def same_layout(self, other):
+        return other is not None and (other is self or (
+            self.sectors == other.sectors
+            and np.array_equal(self.sector_offsets, other.sector_offsets)
+            and self.house_names == other.house_names
+            and np.array_equal(self.house_ids, other.house_ids)))
+
+    def values_from_dict(self, data_dict, unknown=None):
+        """
+        Array alineado con las casas de este escenario a partir de un dict; NaN donde falte la casa.
+        Si se pasa la lista `unknown`, se le añaden los (sector, casa) del dict que no existen en el escenario.
+        """
+        values = self._empty()
+        for sector, houses in data_dict.items():
+            if not isinstance(houses, dict):
+                if unknown is not None:
+                    unknown.append((sector, None))
+                continue
+            for house, value in houses.items():
+                i = self.index(sector, house)
+                if i is not None:
+                    values[i] = _as_float(value)
+                elif unknown is not None:
+                    unknown.append((sector, house))
+        return values
+
+    def values_from(self, other, which="modified"):
+        """Valores `which` de otro Scenario alineados con las casas de éste (copia directa si la estructura coincide)."""
+        source = getattr(other, which)
+        if self.same_layout(other):
+            return source.copy()
+        values = self._empty()
+        for s, sector in enumerate(self.sectors):
+            for i in range(int(self.sector_offsets[s]), int(self.sector_offsets[s + 1])):
+                j = other.index(sector, self.house_name(i))
+                if j is not None:
+                    values[i] = source[j]
+        return values
+
+    def interpolated(self, t, indices=None):
+        """
+        previous -> modified interpolado linealmente (t de 0.0 a 1.0); si falta el previo se usa el objetivo.
+        `indices` limita el cálculo a esas casas (p.ej. sólo las visibles en pantalla).
+        """
+        t = max(0.0, min(1.0, t))
+        modified = self.modified if indices is None else self.modified[indices]
+        if t >= 1.0 or self.previous is self.modified:
+            return modified
+        previous = self.previous if indices is None else self.previous[indices]
+        previous = np.where(np.isnan(previous), modified, previous)
+        return previous + (modified - previous) * np.float32(t)
+
+    # --- Exportación ---
+
+    def to_dict(self, which="initial", decimals=None):
+        """Formato {"Sector-X": {"house-N": valor}} (se omiten las casas con NaN)."""
+        values = getattr(self, which).astype(np.float64)
+        if decimals is not None:
+            values = np.round(values, decimals)
+        present = ~np.isnan(values)
+        values = values.tolist()
+        present = present.tolist()
+        house_ids = self.house_ids.tolist()
+        result = {}
+        for s, sector in enumerate(self.sectors):
+            houses = result[sector] = {}
+            for i in range(int(self.sector_offsets[s]), int(self.sector_offsets[s + 1])):
+                if present[i]:
+                    houses[self.house_names[house_ids[i]]] = values[i]
+        return result
+
+    def to_json(self, which="initial", decimals=None, indent=None):
+        return json.dumps(self.to_dict(which, decimals), indent=indent)
+
+
+def _as_float(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return np.nan
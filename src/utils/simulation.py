@@ -0,0 +1,121 @@
+import asyncio
+import math
+import numpy as np
+from .gen_cons import diurnal_profile
+
+### Simulación temporal: en lugar de una foto estática por llamada, el consumo avanza tick a tick.
+# Cada casa parte de su valor inicial y evoluciona con:
+#   - carga diurna: el valor se escala con el perfil horario relativo a la hora de inicio,
+#   - deriva: nivel propio de cada casa (proceso con reversión a la media, tipo Ornstein-Uhlenbeck),
+#   - clima: anomalía compartida por sector (mismo tipo de proceso, más lenta),
+#   - ruido: variación independiente en cada tick.
+# La política de modificación (p.ej. RuleEngine.apply_array) se aplica en cada tick sobre el array completo.
+
+class Dynamics:
+    """Parámetros de la dinámica. Las escalas temporales están en horas simuladas."""
+
+    def __init__(self, diurnal=0.6, drift=0.05, drift_reversion=0.5, weather=0.08, weather_reversion=0.1, noise=0.01,
+                 clamp=(0.0, 1.0)):
+        self.diurnal = diurnal # peso del perfil horario (0 = sin ciclo diario, 1 = el valor sigue el perfil por completo)
+        self.drift = drift # volatilidad (por hora) del nivel propio de cada casa
+        self.drift_reversion = drift_reversion # velocidad de vuelta del nivel propio a 0 (1/horas)
+        self.weather = weather # volatilidad (por hora) de la anomalía climática de cada sector
+        self.weather_reversion = weather_reversion
+        self.noise = noise # desviación del ruido independiente por tick
+        self.clamp = clamp
+
+
+class Simulation:
+    def __init__(self, scenario, dynamics=None, policy=None, tick_hours=0.25, start_hour=0.0, tick_rate=None, seed=None, copy=True):
+        """
+        scenario: Scenario de partida (sus valores `initial` son el consumo a la hora `start_hour`).
+        policy: callable array -> array modificado (p.ej. RuleEngine.apply_array); None = sin modificación.
+        tick_rate: ticks por segundo reales (None = tan rápido como se pueda).
+        copy: si False, los escenarios emitidos comparten los buffers de la simulación (se sobrescriben en el siguiente tick).
+        """
+        self.scenario = scenario
+        self.dynamics = dynamics or Dynamics()
+        self.policy = policy
+        self.tick_hours = tick_hours
+        self.start_hour = start_hour
+        self.tick_rate = tick_rate
+        self.copy = copy
+        self.rng = np.random.default_rng(seed)
+        self.tick = 0
+        self.hour = start_hour
+
+        size = len(scenario)
+        self._counts = np.diff(scenario.sector_offsets)
+        self._base = scenario.initial.copy()
+        # Normales del tick: se generan en el sitio sobre este buffer (sin reservar memoria), nuevas e independientes
+        # en cada uso. Leer ventanas de una tabla precalculada era algo más rápido, pero daba ruido correlacionado
+        # entre casas y ticks que se repetía periódicamente.
+        self._normals = np.empty(size, dtype=np.float32)
+        self._start_profile = diurnal_profile(start_hour % 24.0)
+        self._level = np.zeros(size, dtype=np.float32) # deriva propia de cada casa
+        self._weather = np.zeros(len(self._counts), dtype=np.float32) # anomalía climática por sector
+        self.values = np.empty(size, dtype=np.float32) # consumo del tick actual
+        self._scratch = np.empty(size, dtype=np.float32)
+
+    def step(self):
+        """Avanza un tick en el sitio y devuelve el array de consumos resultante."""
+        d = self.dynamics
+        dt = self.tick_hours
+        sqrt_dt = math.sqrt(dt)
+        self.tick += 1
+        self.hour = self.start_hour + self.tick * dt
+        rng = self.rng
+        values = self.values
+        scratch = self._scratch
+
+        # Carga diurna: factor escalar respecto a la hora de inicio
+        factor = 1.0 - d.diurnal + d.diurnal * diurnal_profile(self.hour % 24.0) / self._start_profile
+        np.multiply(self._base, np.float32(factor), out=values)
+
+        # Deriva por casa: level <- level * (1 - k*dt) + sigma * sqrt(dt) * N(0, 1)
+        if d.drift:
+            np.multiply(self._draw_normals(), np.float32(d.drift * sqrt_dt), out=scratch)
+            self._level *= np.float32(1.0 - d.drift_reversion * dt)
+            self._level += scratch
+            values += self._level
+
+        # Clima por sector (pocos valores: se calcula en el array pequeño y se reparte a las casas)
+        if d.weather:
+            self._weather *= np.float32(1.0 - d.weather_reversion * dt)
+            self._weather += (rng.standard_normal(len(self._weather)) * (d.weather * sqrt_dt)).astype(np.float32)
+            values += np.repeat(self._weather, self._counts)
+
+        if d.noise:
+            np.multiply(self._draw_normals(), np.float32(d.noise), out=scratch)
+            values += scratch
+
+        if d.clamp is not None:
+            np.clip(values, d.clamp[0], d.clamp[1], out=values)
+        return values
+
+    def _draw_normals(self):
+        """Rellena el buffer de normales con valores N(0, 1) nuevos y lo devuelve."""
+        return self.rng.standard_normal(dtype=np.float32, out=self._normals)
+
+    def snapshot(self):
+        """Scenario del tick actual (initial = consumo simulado, modified = consumo tras la política)."""
+        values = self.values.copy() if self.copy else self.values
+        modified = self.policy(values) if self.policy is not None else None
+        return self.scenario.with_values(values, modified)
+
+    async def run(self, ticks=None):
+        """Generador asíncrono: un Scenario por tick (`ticks` = None para simular sin fin)."""
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.tick_rate if self.tick_rate else None
+        next_time = loop.time()
+        count = 0
+        while ticks is None or count < ticks:
+            self.step()
+            yield self.snapshot()
+            count += 1
+            if interval is None:
+                await asyncio.sleep(0) # ceder el loop a otras tareas sin frenar la simulación
+            else:
+                # plazos absolutos: los retrasos de un tick no se acumulan
+                next_time += interval
+                await asyncio.sleep(max(0.0, next_time - loop.time()))
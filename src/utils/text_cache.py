@@ -0,0 +1,39 @@
+from collections import OrderedDict
+
+### Caché de superficies de texto ya rasterizadas para el visualizador pygame.
+# Renderizar texto con una fuente es lo más caro de un frame con muchas casas; los textos apenas
+# cambian entre frames, así que se guardan por (fuente, texto, color) con expulsión LRU.
+
+
+class TextCache:
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._surfaces = OrderedDict() # (fuente, texto, color, antialias) -> Surface
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, color, antialias)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.max_entries:
+            self._surfaces.popitem(last=False) # el menos usado recientemente
+        return surface
+
+    def clear(self):
+        self._surfaces.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._surfaces),
+        }
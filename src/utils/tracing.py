@@ -0,0 +1,312 @@
+import atexit
+import bisect
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+### Trazas y métricas del pipeline agente -> manager -> UI.
+# Spans (with tracer.span("http", provider=...)) para cada etapa: petición HTTP, parseo, modificación, paso por la
+# cola hacia la UI y primer frame mostrado. Contadores e histogramas (latencia, tokens, bytes, aciertos de caché).
+# Exportadores: endpoint local en formato de texto Prometheus (GET /metrics) y/o fichero JSONL (un span por línea).
+# Desactivado por defecto: cada llamada se reduce a comprobar `enabled` y span() devuelve un objeto nulo compartido.
+#
+#   configure_tracing(jsonl_path="trazas.jsonl", metrics_port=9464)   # o TRACE_JSONL / METRICS_PORT con configure_from_env()
+
+PREFIX = "energy_"
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+TOKENS_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536, 262144)
+
+_current_span = contextvars.ContextVar("current_span", default=None) # span abierto en esta tarea/hilo
+_span_ids = itertools.count(1)
+
+
+class Histogram:
+    """Histograma acumulativo de buckets fijos (como los de Prometheus)."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        return list(itertools.accumulate(self.counts))
+
+
+class Span:
+    __slots__ = ("tracer", "name", "attrs", "id", "parent", "trace", "start", "_token")
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.id = next(_span_ids)
+        parent = _current_span.get()
+        self.parent = parent.id if parent is not None else None
+        self.trace = parent.trace if parent is not None else self.id # id del span raíz
+        self.start = None
+        self._token = None
+
+    def set(self, **attrs):
+        """Añade atributos conocidos sólo al final (estado HTTP, bytes, casas...)."""
+        self.attrs.update(attrs)
+
+    def elapsed(self):
+        """Segundos desde que se abrió el span."""
+        return time.perf_counter() - self.start
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            pass # cerrado desde otro contexto (p.ej. un generador asíncrono finalizado por el recolector)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._finish_span(self, duration)
+        return False
+
+
+class _NullSpan:
+    """Span de la instrumentación desactivada: no mide ni guarda nada."""
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def elapsed(self):
+        return 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._counters = {} # (nombre, etiquetas) -> valor
+        self._histograms = {} # (nombre, etiquetas) -> Histogram
+        self._open = {} # (nombre, clave) -> (inicio, atributos): intervalos que empiezan y acaban en sitios (o hilos) distintos
+        self._exporters = []
+
+    # --- Spans ---
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attrs)
+
+    def start(self, name, key=None, **attrs):
+        """Abre un intervalo que se cierra con finish(name, key), p.ej. desde otro hilo (paso por la cola hacia la UI)."""
+        if self.enabled:
+            with self._lock:
+                self._open[(name, key)] = (time.perf_counter(), attrs)
+
+    def finish(self, name, key=None, **attrs):
+        """Cierra el intervalo abierto con start(); devuelve su duración en segundos (None si no estaba abierto)."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            opened = self._open.pop((name, key), None)
+        if opened is None:
+            return None
+        start, start_attrs = opened
+        span = Span(self, name, {**start_attrs, **attrs})
+        span.start = start
+        duration = time.perf_counter() - start
+        self._finish_span(span, duration)
+        return duration
+
+    def _finish_span(self, span, duration):
+        with self._lock:
+            self._histogram("span_seconds", (("span", span.name),), SECONDS_BUCKETS).observe(duration)
+        if self._exporters:
+            record = {"span": span.name, "id": span.id, "parent": span.parent, "trace": span.trace,
+                      "ts": time.time() - duration, "duration_ms": round(duration * 1000.0, 3), **span.attrs}
+            for exporter in self._exporters:
+                exporter.write(record)
+
+    # --- Métricas ---
+
+    def count(self, name, value=1, **labels):
+        if self.enabled:
+            key = (name, tuple(sorted(labels.items())))
+            with self._lock:
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        if self.enabled:
+            with self._lock:
+                self._histogram(name, tuple(sorted(labels.items())), buckets).observe(value)
+
+    def _histogram(self, name, labels, buckets):
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            histogram = self._histograms[(name, labels)] = Histogram(buckets)
+        return histogram
+
+    def snapshot(self):
+        """{"counters": {...}, "histograms": {...}} con las etiquetas en la clave ("nombre{a=x,b=y}")."""
+        with self._lock:
+            counters = {_series(name, labels): value for (name, labels), value in self._counters.items()}
+            histograms = {_series(name, labels): {"count": h.count, "sum": h.sum, "buckets": dict(zip(map(str, h.buckets + ("+Inf",)), h.cumulative()))}
+                          for (name, labels), h in self._histograms.items()}
+        return {"counters": counters, "histograms": histograms}
+
+    def prometheus_text(self):
+        """Todas las métricas en el formato de texto de Prometheus (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                for (series, labels), value in self._counters.items():
+                    if series == name:
+                        lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for (series, labels), h in self._histograms.items():
+                    if series != name:
+                        continue
+                    for bound, total in zip(h.buckets + ("+Inf",), h.cumulative()):
+                        lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', bound),))} {total}")
+                    lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {h.sum}")
+                    lines.append(f"{PREFIX}{name}_count{_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._open.clear()
+
+    # --- Exportadores ---
+
+    def add_exporter(self, exporter):
+        self._exporters.append(exporter)
+
+    def close(self):
+        """Vuelca las métricas finales a los exportadores y los cierra."""
+        exporters, self._exporters = self._exporters, []
+        snapshot = self.snapshot()
+        for exporter in exporters:
+            exporter.close(snapshot)
+
+
+def _series(name, labels):
+    return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class JsonlExporter:
+    """Un span por línea en `path`; al cerrar, una última línea {"metrics": snapshot}."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self, snapshot=None):
+        with self._lock:
+            if snapshot is not None:
+                self._file.write(json.dumps({"metrics": snapshot}) + "\n")
+            self._file.close()
+
+
+class MetricsServer:
+    """Endpoint HTTP local (hilo daemon) que sirve GET /metrics en formato Prometheus."""
+
+    def __init__(self, tracer, host="127.0.0.1", port=9464):
+        self.tracer = tracer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split("?")[0] != "/metrics":
+                    handler.send_error(404)
+                    return
+                body = tracer.prometheus_text().encode()
+                handler.send_response(200)
+                handler.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass # sin una línea por scrape en la consola
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1] # con port=0, el puerto libre elegido
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        pass # las métricas se leen en cada scrape; los spans individuales no se sirven
+
+    def close(self, snapshot=None):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+tracer = Tracer() # instancia compartida: los módulos la importan directamente y configure_tracing la activa
+
+
+def configure_tracing(enabled=True, jsonl_path=None, metrics_port=None, metrics_host="127.0.0.1"):
+    """Activa (o desactiva) la instrumentación compartida y añade los exportadores pedidos. Devuelve el tracer."""
+    tracer.close()
+    tracer.enabled = enabled
+    if enabled and jsonl_path:
+        tracer.add_exporter(JsonlExporter(jsonl_path))
+    if enabled and metrics_port is not None:
+        server = MetricsServer(tracer, metrics_host, metrics_port)
+        tracer.add_exporter(server)
+        print(f"--- [Tracing] Métricas Prometheus en http://{metrics_host}:{server.port}/metrics ---")
+    return tracer
+
+
+def configure_from_env(environ=None):
+    """TRACE_JSONL=fichero y/o METRICS_PORT=puerto activan la instrumentación; sin ninguna queda desactivada."""
+    environ = os.environ if environ is None else environ
+    jsonl_path = environ.get("TRACE_JSONL") or None
+    metrics_port = environ.get("METRICS_PORT")
+    if jsonl_path or metrics_port:
+        configure_tracing(jsonl_path=jsonl_path, metrics_port=int(metrics_port) if metrics_port else None)
+    return tracer
+
+
+atexit.register(tracer.close)
@@ -0,0 +1,55 @@
+import numpy as np
+
+### Validación del escenario modificado contra el de entrada, en una sola pasada vectorizada.
+# Las casas del Scenario son las de la entrada; lo que el modelo no devolvió (o devolvió no numérico) queda en NaN en
+# `modified`, así que la estructura se comprueba con máscaras sobre los arrays: casas sin valor modificado y valores
+# fuera de [low, high]. Las casas inválidas se pueden volver a pedir solas (subset_dict) y parchear (patch_values)
+# en lugar de repetir todo el pipeline.
+
+
+class ValidationReport:
+    def __init__(self, missing, out_of_range):
+        self.missing = missing # máscara: la casa tiene valor inicial y le falta el modificado
+        self.out_of_range = out_of_range # máscara: valor modificado fuera del rango permitido
+
+    @property
+    def invalid(self):
+        return self.missing | self.out_of_range
+
+    @property
+    def ok(self):
+        return not self.invalid.any()
+
+    def indices(self):
+        """Índices planos de las casas a volver a pedir."""
+        return np.flatnonzero(self.invalid)
+
+    def summary(self):
+        return {"missing": int(self.missing.sum()), "out_of_range": int(self.out_of_range.sum())}
+
+
+def validate_scenario(scenario, low=0.0, high=1.0):
+    modified = scenario.modified
+    present = ~np.isnan(modified)
+    missing = ~np.isnan(scenario.initial) & ~present
+    with np.errstate(invalid="ignore"):
+        out_of_range = present & ((modified < low) | (modified > high))
+    return ValidationReport(missing, out_of_range)
+
+
+def subset_dict(scenario, indices, which="initial", decimals=2):
+    """{"Sector-X": {"house-N": valor}} sólo con las casas `indices` (el prompt de la re-petición)."""
+    indices = np.asarray(indices, dtype=np.int64)
+    values = np.round(getattr(scenario, which)[indices].astype(np.float64), decimals).tolist()
+    sector_of = (np.searchsorted(scenario.sector_offsets, indices, side="right") - 1).tolist()
+    result = {}
+    for i, s, value in zip(indices.tolist(), sector_of, values):
+        result.setdefault(scenario.sectors[s], {})[scenario.house_name(i)] = value
+    return result
+
+
+def patch_values(scenario, indices, data_dict):
+    """Copia de scenario.modified con los valores de `data_dict` en las casas `indices` (el resto no se toca)."""
+    modified = scenario.modified.copy()
+    modified[indices] = scenario.values_from_dict(data_dict)[indices]
+    return modified
@@ -0,0 +1,115 @@
+import numpy as np
+
+### Vista desplazable (pan) y ampliable (zoom) sobre el layout del visualizador, con un índice espacial en rejilla.
+# El layout está en coordenadas "de mundo" (las de compute_layout); la vista las lleva a pantalla con
+# pantalla = (mundo - offset) * zoom. Cada frame sólo se colorean y dibujan las casas que devuelve el índice
+# para el rectángulo visible, y el hover / clic sobre una casa consulta sólo las celdas bajo el ratón.
+
+
+class Viewport:
+    def __init__(self, width, height, min_zoom=0.25, max_zoom=8.0):
+        self.width = width
+        self.height = height
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.offset_x = 0.0 # coordenada de mundo en la esquina superior izquierda de la pantalla
+        self.offset_y = 0.0
+        self.zoom = 1.0
+
+    def state(self):
+        """Tupla que cambia cada vez que cambia lo que se ve (para saber cuándo repintar la capa estática)."""
+        return (self.offset_x, self.offset_y, self.zoom, self.width, self.height)
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+
+    def reset(self):
+        self.offset_x = self.offset_y = 0.0
+        self.zoom = 1.0
+
+    def to_screen(self, x, y):
+        """Mundo -> pantalla (escalares o arrays NumPy)."""
+        return (x - self.offset_x) * self.zoom, (y - self.offset_y) * self.zoom
+
+    def to_world(self, sx, sy):
+        return sx / self.zoom + self.offset_x, sy / self.zoom + self.offset_y
+
+    def world_bounds(self):
+        """(x0, y0, x1, y1) del área visible en coordenadas de mundo."""
+        x1, y1 = self.to_world(self.width, self.height)
+        return self.offset_x, self.offset_y, x1, y1
+
+    def pan(self, dx, dy):
+        """Desplaza la vista `dx`, `dy` píxeles de pantalla (positivo: el contenido se mueve a la derecha / abajo)."""
+        self.offset_x -= dx / self.zoom
+        self.offset_y -= dy / self.zoom
+
+    def zoom_at(self, factor, sx, sy):
+        """Multiplica el zoom por `factor` manteniendo fijo el punto de mundo bajo (sx, sy)."""
+        zoom = min(self.max_zoom, max(self.min_zoom, self.zoom * factor))
+        world_x, world_y = self.to_world(sx, sy)
+        self.zoom = zoom
+        self.offset_x = world_x - sx / zoom
+        self.offset_y = world_y - sy / zoom
+
+    def clamp(self, content_width, content_height):
+        """Impide desplazar la vista fuera del contenido (si cabe entero, queda anclado arriba a la izquierda)."""
+        self.offset_x = min(max(self.offset_x, 0.0), max(0.0, content_width - self.width / self.zoom))
+        self.offset_y = min(max(self.offset_y, 0.0), max(0.0, content_height - self.height / self.zoom))
+
+
+class HouseIndex:
+    """
+    Índice espacial en rejilla sobre las casas de un Layout. Cada casa se indexa por el centro de su par de círculos;
+    las celdas son al menos tan grandes como el par, así que basta ampliar la consulta media celda por cada lado.
+    Las casas quedan ordenadas por celda (fila a fila), de modo que una fila de celdas es un tramo contiguo.
+    """
+
+    def __init__(self, layout, radius):
+        self.layout = layout
+        self.radius = radius # radio máximo de un círculo (con pulso) para el hit-testing
+        self.center_x = (layout.initial_x + layout.modified_x) / 2
+        self.center_y = np.asarray(layout.center_y, dtype=np.float64)
+        self.half_width = float(np.max(layout.modified_x - layout.initial_x)) / 2 + radius if len(layout) else radius
+        self.cell = max(2 * self.half_width, 2 * radius, 1.0)
+        count = len(layout)
+        self.cols = max(1, int(np.max(self.center_x) // self.cell) + 1) if count else 1
+        self.rows = max(1, int(np.max(self.center_y) // self.cell) + 1) if count else 1
+        cell_x = np.clip(self.center_x // self.cell, 0, self.cols - 1).astype(np.int64)
+        cell_y = np.clip(self.center_y // self.cell, 0, self.rows - 1).astype(np.int64)
+        key = cell_y * self.cols + cell_x
+        self.order = np.argsort(key, kind="stable")
+        self.starts = np.searchsorted(key[self.order], np.arange(self.cols * self.rows + 1))
+
+    def _candidates(self, x0, y0, x1, y1):
+        cx0 = max(0, int(x0 // self.cell))
+        cx1 = min(self.cols - 1, int(x1 // self.cell))
+        cy0 = max(0, int(y0 // self.cell))
+        cy1 = min(self.rows - 1, int(y1 // self.cell))
+        if cx0 > cx1 or cy0 > cy1:
+            return np.zeros(0, dtype=np.int64)
+        # Un tramo de `order` por fila de celdas
+        parts = [self.order[self.starts[cy * self.cols + cx0]:self.starts[cy * self.cols + cx1 + 1]] for cy in range(cy0, cy1 + 1)]
+        return np.concatenate(parts)
+
+    def visible(self, x0, y0, x1, y1):
+        """Índices (ordenados) de las casas cuyo par de círculos toca el rectángulo de mundo (x0, y0, x1, y1)."""
+        candidates = self._candidates(x0 - self.half_width, y0 - self.radius, x1 + self.half_width, y1 + self.radius)
+        x = self.center_x[candidates]
+        y = self.center_y[candidates]
+        inside = ((x + self.half_width >= x0) & (x - self.half_width <= x1)
+                  & (y + self.radius >= y0) & (y - self.radius <= y1))
+        return np.sort(candidates[inside])
+
+    def house_at(self, x, y):
+        """Casa cuyo círculo inicial o modificado contiene el punto de mundo (x, y), o None."""
+        candidates = self._candidates(x - self.half_width, y - self.radius, x + self.half_width, y + self.radius)
+        if not len(candidates):
+            return None
+        dy2 = (self.center_y[candidates] - y) ** 2
+        r2 = self.radius * self.radius
+        hit = (((self.layout.initial_x[candidates] - x) ** 2 + dy2 <= r2)
+               | ((self.layout.modified_x[candidates] - x) ** 2 + dy2 <= r2))
+        hits = candidates[hit]
+        return int(hits.min()) if len(hits) else None
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import traceback
+from .pool import close_pool
+
+### Worker de regeneración persistente: un único hilo con un event loop de larga vida.
+# Las sesiones del pool HTTP viven en ese loop, así que las conexiones siguen calientes entre
+# pulsaciones de "Regenerar" y no se crean hilos ni loops nuevos por cada petición.
+
+
+class RegenerationWorker:
+    def __init__(self, name="regeneration-worker"):
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._lock = threading.Lock()
+        self._current = None # futuro del último trabajo enviado con supersede=True
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        # Tras stop(): cancelar lo pendiente (p.ej. precargas), cerrar la sesión HTTP y el loop en este mismo hilo
+        try:
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.run_until_complete(close_pool())
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        finally:
+            self.loop.close()
+
+    def submit(self, job, *args, supersede=True, **kwargs):
+        """
+        Ejecuta la corrutina `job(*args, **kwargs)` en el loop del worker. Thread-safe.
+        Devuelve un concurrent.futures.Future. Con supersede=True se cancela el trabajo anterior si sigue en curso.
+        """
+        with self._lock:
+            if supersede and self._current is not None and not self._current.done():
+                print("--- [Worker] Cancelando trabajo anterior (reemplazado por uno nuevo) ---")
+                self._current.cancel()
+            future = asyncio.run_coroutine_threadsafe(self._guard(job, args, kwargs), self.loop)
+            if supersede:
+                self._current = future
+        return future
+
+    async def _guard(self, job, args, kwargs):
+        try:
+            return await job(*args, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"--- [Worker] Error en el trabajo {getattr(job, '__name__', job)}: {e}")
+            traceback.print_exc()
+            raise
+
+    def cancel_current(self):
+        with self._lock:
+            if self._current is not None and not self._current.done():
+                self._current.cancel()
+                return True
+        return False
+
+    def shutdown(self, timeout=5):
+        """Cancela el trabajo en curso, detiene el loop y libera las conexiones del pool."""
+        self.cancel_current()
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
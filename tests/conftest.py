@@ -0,0 +1,36 @@
+import itertools
+import os
+import sys
+# Los módulos se importan como en src/ (from utils... / from main import ...)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import pytest
+
+from utils.cache import get_cache
+from utils.providers import PROVIDERS, LocalStubProvider, register_provider
+
+_stub_ids = itertools.count()
+
+
+@pytest.fixture(autouse=True)
+def stub_model():
+    """
+    Caché compartida vacía al empezar y al terminar cada test, y fábrica de modelos stub:
+    stub_model(responder, provider_class=LocalStubProvider, **opciones) registra un modelo con nombre único
+    (un único adaptador compartido, recuperable con resolve_provider) y devuelve su nombre.
+    Los modelos registrados se quitan del registro global al terminar el test.
+    """
+    registered = []
+
+    def register(responder=None, provider_class=LocalStubProvider, **options):
+        model = f"stub-{next(_stub_ids)}"
+        provider = provider_class(model, responder=responder, **options)
+        register_provider(model, lambda aimodel: provider)
+        registered.append(model)
+        return model
+
+    get_cache().clear()
+    yield register
+    get_cache().clear()
+    for model in registered:
+        PROVIDERS.pop(model, None)
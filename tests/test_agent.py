@@ -0,0 +1,94 @@
+import asyncio
+
+from main import Energy_manager
+from utils.agent import flowtask
+from utils.cache import ResponseCache, get_cache
+from utils.jsonextract import is_json_object
+from utils.providers import LocalStubProvider, resolve_provider
+
+
+class _SlowStub(LocalStubProvider):
+    """Stub que tarda `delay` segundos en responder y cuenta sus llamadas."""
+
+    def __init__(self, aimodel, responder=None, delay=0.0):
+        super().__init__(aimodel, responder)
+        self.delay = delay
+        self.calls = 0
+
+    async def send(self, session, input_text):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.responder(input_text)
+
+
+def _stub(stub_model, output_text, delay=0.0):
+    """Registra un modelo stub que responde siempre `output_text` y devuelve (nombre, adaptador compartido)."""
+    model = stub_model(lambda text: output_text, provider_class=_SlowStub, delay=delay)
+    return model, resolve_provider(model)
+
+
+def test_is_json_object():
+    assert is_json_object('```json\n{"Sector-A": {"house-1": 0.5,}}\n```')
+    assert not is_json_object("not json at all")
+    assert not is_json_object("[1, 2, 3]")
+
+
+def test_manager_wires_default_validator():
+    manager = Energy_manager("test", data_source="local")
+    assert manager.agent_options["validator"] is is_json_object
+    assert manager.modifier.agent_options["validator"] is is_json_object
+
+
+def test_invalid_hedge_answer_does_not_beat_valid_primary(stub_model):
+    primary, _ = _stub(stub_model, '{"Sector-A": {"house-1": 0.5}}', delay=0.1)
+    hedge, hedge_provider = _stub(stub_model, "not json at all")
+    cache = get_cache()
+    agent = flowtask("test", primary, cache=cache, hedge_model=hedge, hedge_delay=0.01, validator=is_json_object)
+
+    output = asyncio.run(agent.request("prompt"))
+
+    assert output == '{"Sector-A": {"house-1": 0.5}}'
+    assert hedge_provider.calls == 1 # el hedge se lanzó, pero su respuesta no pasó el validador
+    assert agent.answered_by == primary
+    assert cache.get(primary, "prompt") == output
+    assert cache.get(hedge, "prompt") is None
+
+
+def test_hedge_answer_is_cached_under_the_hedge_model(stub_model):
+    primary, primary_provider = _stub(stub_model, '{"Sector-A": {"house-1": 0.1}}', delay=1.0)
+    hedge, hedge_provider = _stub(stub_model, '{"Sector-A": {"house-1": 0.9}}')
+    cache = get_cache()
+
+    def agent():
+        return flowtask("test", primary, cache=cache, hedge_model=hedge, hedge_delay=0.01, validator=is_json_object)
+
+    first = agent()
+    output = asyncio.run(first.request("prompt"))
+    assert output == '{"Sector-A": {"house-1": 0.9}}'
+    assert first.answered_by == hedge
+    assert cache.get(hedge, "prompt") == output
+    assert cache.get(primary, "prompt") is None
+
+    # Un agente nuevo con los mismos modelos reutiliza la respuesta del hedge sin volver a llamar a nadie
+    second = agent()
+    assert asyncio.run(second.request("prompt")) == output
+    assert second.answered_by == hedge
+    assert (primary_provider.calls, hedge_provider.calls) == (1, 1)
+
+
+def test_lookup_over_hedge_and_fallbacks_counts_once(stub_model, tmp_path):
+    primary, _ = _stub(stub_model, '{"a": 1}')
+    hedge, _ = _stub(stub_model, '{"a": 2}')
+    fallback, _ = _stub(stub_model, '{"a": 3}')
+    cache = ResponseCache(path=str(tmp_path / "cache.sqlite"))
+    agent = flowtask("test", primary, cache=cache, hedge_model=hedge, hedge_delay=1.0, fallbacks=(fallback,))
+
+    asyncio.run(agent.request("prompt")) # un fallo (los tres modelos) y la respuesta del primario
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    cache.put(fallback, "otro", '{"a": 3}')
+    assert asyncio.run(agent.request("otro")) == '{"a": 3}'
+    assert agent.answered_by == fallback
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.stats()["hit_rate"] == 0.5
+    cache.close()
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from utils.jsonextract import extract_json
+
+
+def test_well_formed_object_in_fences_and_prose():
+    text = 'Aquí tienes:\n```json\n{"Sector-A": {"house-1": 0.5}}\n```\nSaludos'
+    assert extract_json(text) == ({"Sector-A": {"house-1": 0.5}}, True)
+
+
+def test_trailing_commas_are_removed():
+    text = '{"Sector-A": {"house-1": 0.5, "house-2": 0.7,}, "Sector-B": {"house-1": [1, 2,],},}'
+    data, complete = extract_json(text)
+    assert complete
+    assert data == {"Sector-A": {"house-1": 0.5, "house-2": 0.7}, "Sector-B": {"house-1": [1, 2]}}
+
+
+def test_commas_inside_strings_are_kept():
+    data, complete = extract_json('{"note": "a, }", "Sector-A": {"house-1": 0.5,}} y algo más }')
+    assert complete
+    assert data == {"note": "a, }", "Sector-A": {"house-1": 0.5}}
+
+
+def test_truncated_response_keeps_complete_sectors():
+    text = '{"Sector-A": {"house-1": 0.5, "house-2": 0.7,}, "Sector-B": {"house-1": 0.2}, "Sector-C": {"house-1": 0.'
+    data, complete = extract_json(text)
+    assert not complete
+    assert data == {"Sector-A": {"house-1": 0.5, "house-2": 0.7}, "Sector-B": {"house-1": 0.2}}
+
+
+@pytest.mark.parametrize("text", [
+    "sin objeto JSON",
+    '{"Sector-A": {"house-1": 0.',  # truncada antes de cerrar ningún sector
+    '{"Sector-A": {"house-1": 0.5 "house-2": 0.7}}',  # cerrado pero inválido por dentro (falta una coma)
+])
+def test_unrecoverable_responses_raise(text):
+    with pytest.raises(json.JSONDecodeError):
+        extract_json(text)
@@ -0,0 +1,65 @@
+import numpy as np
+import pygame
+
+from utils.colors import Pulse
+from utils.gen_cons import gen_arrays
+from utils.lod import LEVEL_PIXELS, LEVEL_SECTORS, HeatmapRenderer, SectorTiles
+from utils.scenario import Scenario
+
+
+class _CountingPulse(Pulse):
+    """Pulse que anota cuántos valores pasan por la LUT en cada llamada."""
+
+    def __init__(self):
+        super().__init__((0, 255, 0), (255, 255, 0), (255, 0, 0), (128, 128, 128), radius=5, frequency=0.005,
+                         brightness_amplitude=0.3, size_amplitude=0.2)
+        self.sizes = []
+
+    def base_colors(self, values):
+        self.sizes.append(len(values))
+        return super().base_colors(values)
+
+
+def _scenario(sectors, houses_per_sector):
+    scenario = Scenario.from_arrays(*gen_arrays(sectors=sectors, houses_per_sector=houses_per_sector, seed=0))
+    return scenario.with_modified(scenario.initial * np.float32(0.5))
+
+
+def _renderer(width, height):
+    pulse = _CountingPulse()
+    renderer = HeatmapRenderer(pulse, (0, 0, 0))
+    renderer.set_area((0, 0, width, height), gap=0)
+    return renderer, pulse, pygame.Surface((width, height))
+
+
+def test_initial_panel_is_painted_once_per_scenario():
+    scenario = _scenario(4, 50)
+    renderer, pulse, screen = _renderer(200, 100)
+    assert renderer.choose_level(scenario, preferred=LEVEL_PIXELS) == LEVEL_PIXELS
+
+    for t in (0.0, 0.5, 1.0):
+        renderer.render(screen, scenario, LEVEL_PIXELS, t)
+    assert pulse.sizes == [200, 200, 200, 200] # inicial una vez + modificado en cada frame
+
+    renderer.render(screen, _scenario(4, 50), LEVEL_PIXELS, 1.0) # escenario nuevo: se repinta el inicial
+    assert len(pulse.sizes) == 6
+
+
+def test_sector_level_colours_only_the_shown_tiles():
+    # Más casas que píxeles del panel y más sectores que baldosas: la LUT sólo ve las baldosas visibles
+    scenario = _scenario(400, 10)
+    renderer, pulse, screen = _renderer(20, 10)
+    assert renderer.choose_level(scenario) == LEVEL_SECTORS
+    tiles = renderer.sector_tiles(scenario)
+    assert tiles.shown < len(scenario.sectors)
+
+    renderer.render(screen, scenario, LEVEL_SECTORS, 1.0)
+    renderer.render(screen, scenario, LEVEL_SECTORS, 1.0)
+    assert pulse.sizes == [tiles.shown] * 3
+    assert tiles.map.max() <= tiles.shown # índices de baldosa o fondo (shown)
+
+
+def test_sector_tiles_map_background_is_shown_index():
+    tiles = SectorTiles(3, 40, 40)
+    assert tiles.shown == 3
+    assert set(np.unique(tiles.map)) <= {0, 1, 2, 3}
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from main import ConsumptionModifier
+from utils.cache import get_cache
+
+
+def test_sharded_modification_skips_empty_sectors(stub_model):
+    prompts = []
+
+    def echo(prompt):
+        prompts.append(prompt)
+        return prompt[prompt.index("{"):prompt.rindex("}") + 1]
+
+    modifier = ConsumptionModifier("test", stub_model(echo), shard_size=2)
+    data = {"Sector-A": {"house-1": 0.1, "house-2": 0.2, "house-3": 0.3}, "Sector-B": {}, "Sector-C": {"house-1": 0.4}}
+
+    assert [list(shard) for shard in modifier._split_shards(data)] == [["Sector-A"], ["Sector-A"], ["Sector-C"]]
+    result = asyncio.run(modifier.modify_consumption(data, "rules"))
+
+    assert len(prompts) == 3 # ninguna petición para Sector-B
+    assert result == data # el sector vacío se conserva, en su posición
+    assert list(result) == list(data)
+
+
+_DATA = {"Sector-A": {"house-1": 0.1, "house-2": 0.6}, "Sector-B": {"house-1": 0.9}}
+
+
+def test_partial_delta_is_merged_into_unchanged_houses(capsys):
+    modifier = ConsumptionModifier("test", "unused", delta=True)
+    original = {sector: dict(houses) for sector, houses in _DATA.items()}
+
+    result = modifier._apply_delta(_DATA, {"Sector-A": {"house-2": 0.3}})
+
+    assert result == {"Sector-A": {"house-1": 0.1, "house-2": 0.3}, "Sector-B": {"house-1": 0.9}}
+    assert list(result) == list(_DATA)
+    assert _DATA == original # se parchea una copia
+    assert "Delta aplicado: 1 de 3 casas cambiadas" in capsys.readouterr().out
+    assert modifier._apply_delta(_DATA, {}) == _DATA # ningún cambio
+
+
+@pytest.mark.parametrize("delta", [
+    {"Sector-A": {"house-9": 0.3}},  # casa desconocida
+    {"Sector-Z": {"house-1": 0.3}},  # sector desconocido
+    {"Sector-A": 0.3},  # sector mal formado
+    {"Sector-A": {"house-1": 1.5}},  # fuera de [0, 1]
+    {"Sector-A": {"house-1": "0.3"}},  # no numérico
+])
+def test_invalid_delta_is_rejected(delta):
+    modifier = ConsumptionModifier("test", "unused", delta=True)
+    assert modifier._apply_delta(_DATA, delta) is None
+
+
+def test_delta_mode_end_to_end(stub_model):
+    replies = ['{"Sector-B": {"house-1": 0.4}}', '{"Sector-B": {"house-7": 0.4}}']
+
+    def reply(prompt):
+        assert "Respond ONLY with the houses whose value CHANGES" in prompt
+        return replies.pop(0)
+
+    modifier = ConsumptionModifier("test", stub_model(reply), delta=True)
+    result = asyncio.run(modifier._request_modification(_DATA, "rules"))
+    assert result == {"Sector-A": {"house-1": 0.1, "house-2": 0.6}, "Sector-B": {"house-1": 0.4}}
+
+    # Con otros datos (otra clave de caché) el modelo nombra una casa que no existe
+    other = {"Sector-B": {"house-1": 0.8}}
+    assert asyncio.run(modifier._request_modification(other, "rules")) is None
+    prompt = modifier._build_delta_prompt(other, "rules")
+    assert get_cache().get(modifier.ai_model, prompt) is None # la respuesta rechazada no queda en caché
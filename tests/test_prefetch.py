@@ -0,0 +1,70 @@
+import asyncio
+import itertools
+
+from main import Energy_manager
+from utils.prefetch import PrefetchBuffer
+
+
+def _producer(delay=0.01):
+    counter = itertools.count(1)
+
+    async def produce():
+        await asyncio.sleep(delay)
+        return next(counter)
+
+    return produce
+
+
+def test_token_budget_caps_the_prefetched_scenarios():
+    async def scenario():
+        buffer = PrefetchBuffer(_producer(), depth=5, token_budget=250, estimate_tokens=lambda item: 100)
+        await buffer.get()
+        stats = buffer.stats()
+        buffer.invalidate()
+        return stats
+
+    stats = asyncio.run(scenario())
+    # 100 tokens por escenario: caben 2 precargas en 250 aunque la profundidad permita 5
+    assert stats["inflight"] == 2
+    assert stats["reserved_tokens"] == 200
+
+
+def test_hit_inflight_and_miss_counters():
+    async def scenario():
+        buffer = PrefetchBuffer(_producer(), depth=1)
+        first = await buffer.get() # nada listo ni en curso: miss
+        second = await buffer.get() # la precarga lanzada por el primero sigue en curso
+        await asyncio.sleep(0.05)
+        third = await buffer.get() # precarga ya terminada: hit
+        stats = buffer.stats()
+        buffer.invalidate()
+        return (first, second, third), stats
+
+    items, stats = asyncio.run(scenario())
+    assert items == (1, 2, 3)
+    assert (stats["hits"], stats["inflight_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 1 / 3
+
+
+def test_buffer_is_dropped_when_modification_rules_change():
+    manager = Energy_manager("test", data_source="local", modifier_mode="rules", prefetch_depth=2,
+                             local_options={"sectors": 2, "houses_per_sector": 3, "seed": 0})
+
+    async def scenario():
+        assert await manager.next_scenario() is not None
+        old = manager.prefetch_buffer()
+        assert manager.prefetch_buffer() is old # mismas reglas: mismo buffer
+        await asyncio.sleep(0.05)
+        assert old.stats()["ready"] == 2
+
+        manager.modification_rules = "Consumption >= 0.5 is not normal, subtract 0.3."
+        new = manager.prefetch_buffer()
+        old_stats, new_stats = old.stats(), new.stats()
+        new.invalidate()
+        return new is old, old_stats, new_stats
+
+    same, old_stats, new_stats = asyncio.run(scenario())
+    assert not same
+    assert (old_stats["ready"], old_stats["inflight"], old_stats["discarded"]) == (0, 0, 2)
+    assert (new_stats["ready"], new_stats["inflight"]) == (0, 0)
+    assert manager.prefetch_stats() == new_stats
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from utils.agent import flowtask
+from utils.pool import close_pool
+from utils.resilience import ProviderError, RetryPolicy
+
+
+def test_non_json_200_body_is_a_retryable_provider_error(monkeypatch):
+    calls = []
+
+    async def handler(request):
+        calls.append(request.path)
+        return web.Response(text="<html>502 Bad Gateway</html>", content_type="text/html") # proxy con estado 200
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post("/openrouter/api/v1/chat/completions", handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        monkeypatch.setenv("OPENROUTER_BASE_URL", f"http://127.0.0.1:{runner.addresses[0][1]}/openrouter/api/v1")
+        try:
+            agent = flowtask("test", "qwen1", retry=RetryPolicy(max_attempts=2, base_delay=0.0))
+            with pytest.raises(ProviderError, match="no es JSON") as info:
+                await agent.request("prompt")
+            return info.value
+        finally:
+            await close_pool()
+            await runner.cleanup()
+
+    error = asyncio.run(scenario())
+    assert error.retryable
+    assert "Bad Gateway" in error.body
+    assert len(calls) == 2 # se reintentó como cualquier otro fallo transitorio
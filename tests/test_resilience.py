@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.resilience import CircuitBreaker, CircuitOpenError, ProviderError, RetryPolicy, call_with_retry
+
+
+def _open_breaker(reset_timeout=30.0):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    breaker.opened_at = time.monotonic() - reset_timeout - 1.0 # ya pasó reset_timeout
+    return breaker
+
+
+def _run_burst(breaker, outcome, callers=8):
+    """Lanza `callers` llamadas concurrentes; la que llega al proveedor espera y termina con `outcome`."""
+    reached = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def call():
+            reached.append(1)
+            await release.wait()
+            if outcome == "failure":
+                raise ProviderError("sigue caído", status=503, provider="test")
+            return "ok"
+
+        tasks = [asyncio.ensure_future(call_with_retry(call, breaker, RetryPolicy(max_attempts=1))) for _ in range(callers)]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    return reached, asyncio.run(scenario())
+
+
+def test_half_open_lets_a_single_probe_through_concurrent_callers():
+    breaker = _open_breaker()
+    reached, results = _run_burst(breaker, "success")
+    assert len(reached) == 1 # una sola petición de prueba llega al proveedor
+    assert results.count("ok") == 1
+    assert sum(isinstance(result, CircuitOpenError) for result in results) == 7
+    assert breaker.state == "closed"
+    breaker.before_call() # cerrado: vuelve a dejar pasar todo
+
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = _open_breaker()
+    reached, results = _run_burst(breaker, "failure")
+    assert len(reached) == 1
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_lost_probe_is_replaced_after_reset_timeout():
+    breaker = _open_breaker(reset_timeout=30.0)
+    breaker.before_call() # prueba que nunca informa (p.ej. cancelada)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.probe_started -= 31.0
+    breaker.before_call() # se admite una nueva prueba
+    assert breaker.state == "half-open"
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from main import Energy_manager
+from utils.rules import compile_rules
+
+DEFAULT_RULES = Energy_manager("test").modification_rules
+
+
+def test_default_manager_rules_compile():
+    engine = compile_rules(DEFAULT_RULES, seed=0)
+    assert engine is not None
+    values = np.array([0.1, 0.4, 0.9], dtype=np.float32)
+    result = engine.apply_array(values)
+    assert result[:2].tolist() == pytest.approx([0.1, 0.4])
+    assert 0.3 - 1e-6 <= result[2] <= 0.8 + 1e-6
+
+
+def test_single_line_threshold_rule_with_clamp():
+    engine = compile_rules("Consumption >= 0.5 is not normal, subtract 0.3. Ensure final values are between 0.0 and 1.0.")
+    result = engine.apply_array(np.array([0.2, 0.6, 0.9], dtype=np.float32))
+    assert result.tolist() == pytest.approx([0.2, 0.3, 0.6])
+
+
+@pytest.mark.parametrize("rules", [
+    DEFAULT_RULES + "Houses in Sector-B must be doubled.",
+    DEFAULT_RULES + "Sector-C houses should be set to zero regardless",
+    "Houses with consumption >= 0.5 in Sector-A: subtract 0.2",
+    ">= 0.5 subtract 10%",
+    ">= 0.5 reduce by 10 percent",
+    ">= 0.5 multiply by 0.5",
+    ">= 0.5 subtract 0.1 and add 0.2",
+    ">= 0.5 subtract 0.1, otherwise don't do anything",
+    "Lower every value a bit.",
+])
+def test_rules_the_engine_cannot_express_fall_back_to_llm(rules):
+    assert compile_rules(rules) is None
+
+
+def test_auto_mode_hands_unsupported_rules_to_llm():
+    manager = Energy_manager("test", modifier_mode="auto")
+    manager.modification_rules = ">= 0.5 subtract 10%"
+    assert manager.rule_engine() is None
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+
+import pytest
+from aiohttp import web
+
+from main import Energy_manager
+from utils.agent import flowtask
+from utils.cache import get_cache
+from utils.jsonextract import is_json_object
+from utils.jsonstream import IncrementalJSONParser
+from utils.mock_server import MockLLMServer
+from utils.pool import close_pool
+from utils.providers import LocalStubProvider, resolve_provider
+from utils.resilience import ProviderError, RetryPolicy
+from utils.scenario import Scenario
+
+
+async def _collect(agent, prompt):
+    chunks = []
+    try:
+        async for chunk in agent.stream(prompt):
+            chunks.append(chunk)
+    finally:
+        await close_pool()
+    return "".join(chunks)
+
+
+async def _cut_off_server():
+    """Servidor SSE (formato OpenRouter) que cierra la conexión a mitad de respuesta, sin finish_reason ni [DONE]."""
+    async def handler(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        event = {"choices": [{"index": 0, "delta": {"content": '{"Sector-A": {"house-1": 0.5}, "Sector-B": {'}}]}
+        await response.write(f"data: {json.dumps(event)}\n\n".encode())
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/openrouter/api/v1/chat/completions", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}/openrouter/api/v1"
+
+
+def test_cut_off_stream_raises_and_is_not_cached(monkeypatch):
+    cache = get_cache()
+
+    async def scenario():
+        runner, url = await _cut_off_server()
+        monkeypatch.setenv("OPENROUTER_BASE_URL", url)
+        try:
+            agent = flowtask("test", "qwen1", cache=cache, retry=RetryPolicy(max_attempts=1))
+            with pytest.raises(ProviderError, match="sin fin limpio"):
+                await _collect(agent, "prompt")
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+    assert cache.get("qwen1", "prompt") is None
+
+
+def test_clean_stream_is_cached(monkeypatch):
+    cache = get_cache()
+
+    async def scenario():
+        async with MockLLMServer() as server:
+            for name, value in server.env().items():
+                monkeypatch.setenv(name, value)
+            agent = flowtask("test", "qwen1", cache=cache, validator=is_json_object)
+            return await _collect(agent, "genera un dataset")
+
+    output = asyncio.run(scenario())
+    assert is_json_object(output)
+    assert cache.get("qwen1", "genera un dataset") == output
+
+
+class _FailingStream(LocalStubProvider):
+    """Stub cuyo stream falla antes del primer fragmento pidiendo esperar 10 s (Retry-After)."""
+    name = "stub-stream-retry"
+
+    def __init__(self, aimodel, responder=None):
+        super().__init__(aimodel, responder)
+        self.calls = 0
+
+    async def stream(self, session, input_text, chunk_size=64):
+        self.calls += 1
+        raise ProviderError("rate limited", status=429, provider=self.name, retry_after=10.0)
+        yield # generador asíncrono
+
+
+def test_stream_retry_respects_max_total(stub_model):
+    model = stub_model(provider_class=_FailingStream)
+    provider = resolve_provider(model)
+    agent = flowtask("test", model, retry=RetryPolicy(max_attempts=5, max_total=1.0))
+    started = time.perf_counter()
+    with pytest.raises(ProviderError):
+        asyncio.run(_collect(agent, "prompt"))
+    assert time.perf_counter() - started < 1.0
+    assert provider.calls == 1
+
+
+def _stream_manager(stub_model, output_text, **modifier_options):
+    calls = []
+
+    def counted(prompt):
+        calls.append(prompt)
+        return output_text
+
+    manager = Energy_manager("test", ai_model=stub_model(counted), data_source="local", streaming=True, modifier_options=modifier_options,
+                             local_options={"sectors": 2, "houses_per_sector": 2, "seed": 0})
+    return manager, calls
+
+
+def test_unclosed_stream_json_is_discarded_from_cache(stub_model):
+    # Sector-A completo (pasa el validador y se guarda) pero el objeto raíz nunca se cierra
+    manager, calls = _stream_manager(stub_model, '{"Sector-A": {"house-1": 0.5, "house-2": 0.5}, "Sector-B": {')
+    scenario = Scenario.from_dict({"Sector-A": {"house-1": 0.7, "house-2": 0.2}, "Sector-B": {"house-1": 0.4, "house-2": 0.9}})
+
+    for _ in range(2):
+        assert asyncio.run(manager._stream_modification(scenario, lambda event: None)) is None
+
+    prompt = manager.modifier._build_prompt(scenario.to_dict(decimals=2), manager.modification_rules)
+    assert get_cache().get(manager.ai_model, prompt) is None
+    assert len(calls) == 2 # la segunda vez se vuelve a preguntar al modelo
+
+
+def test_stream_logs_ignored_delta_and_shard_modes(stub_model, capsys):
+    manager, _ = _stream_manager(stub_model, '{"Sector-A": {}}', delta=True, shard_size=1)
+    parser = IncrementalJSONParser()
+
+    async def consume():
+        async for _ in manager.modifier.stream_consumption({"Sector-A": {"house-1": 0.5}}, "rules", parser):
+            pass
+
+    asyncio.run(consume())
+    assert "se ignora el modo delta y shards" in capsys.readouterr().out
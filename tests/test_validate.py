@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from main import Energy_manager
+from utils.jsonextract import extract_json
+from utils.scenario import Scenario
+from utils.validate import patch_values, subset_dict, validate_scenario
+
+
+def _prompt_data(prompt):
+    """Los datos del prompt de modificación (el JSON tras "consumption data:")."""
+    data, _ = extract_json(prompt[prompt.index("consumption data:"):])
+    return data
+
+
+def _stub_manager(stub_model, responder, repair_rounds):
+    """Energy_manager con datos locales (2 sectores x 4 casas) y un modelo stub que responde con `responder`."""
+    manager = Energy_manager("test", ai_model=stub_model(responder), data_source="local", repair_rounds=repair_rounds,
+                             local_options={"sectors": 2, "houses_per_sector": 4, "seed": 0})
+    return manager
+
+
+def _halve(data):
+    return {sector: {house: round(value * 0.5, 2) for house, value in houses.items()} for sector, houses in data.items()}
+
+
+def test_validate_scenario_masks():
+    scenario = Scenario.from_dict({"A": {"h1": 0.2, "h2": 0.4, "h3": 0.6}}, {"A": {"h1": 0.1, "h2": 1.5}})
+    report = validate_scenario(scenario)
+    assert report.missing.tolist() == [False, False, True]
+    assert report.out_of_range.tolist() == [False, True, False]
+    assert report.indices().tolist() == [1, 2]
+    assert report.summary() == {"missing": 1, "out_of_range": 1}
+
+
+def test_subset_dict_and_patch_values():
+    scenario = Scenario.from_dict({"A": {"h1": 0.2}, "B": {"h1": 0.4, "h2": 0.6}}, {"A": {"h1": 0.1}})
+    indices = np.array([1, 2])
+    assert subset_dict(scenario, indices) == {"B": {"h1": 0.4, "h2": 0.6}}
+    patched = patch_values(scenario, indices, {"B": {"h1": 0.3, "h2": 0.5}, "A": {"h1": 0.9}})
+    assert patched.tolist() == pytest.approx([0.1, 0.3, 0.5])
+
+
+def test_repair_rounds_bypass_cache_when_same_house_keeps_failing(stub_model):
+    calls = []
+
+    def responder(prompt):
+        data = _prompt_data(prompt)
+        calls.append(sum(len(houses) for houses in data.values()))
+        result = _halve(data)
+        if "house-2" in result.get("Sector-A", {}):
+            result["Sector-A"]["house-2"] = 1.5 # siempre fuera de rango
+        result.get("Sector-A", {}).pop("house-3", None) # siempre ausente
+        return json.dumps(result)
+
+    scenario = asyncio.run(_stub_manager(stub_model, responder, repair_rounds=3).generate_and_modify_data())
+    # 1 modificación completa + 3 re-peticiones sólo de las 2 casas inválidas (ninguna servida desde la caché)
+    assert calls == [8, 2, 2, 2]
+    assert scenario.modified[scenario.index("Sector-A", "house-2")] == 1.0 # recortado tras agotar los intentos
+    assert np.isnan(scenario.modified[scenario.index("Sector-A", "house-3")])
+
+
+def test_repair_fixes_house_that_fails_two_rounds_in_a_row(stub_model):
+    calls = []
+
+    def responder(prompt):
+        data = _prompt_data(prompt)
+        calls.append(sum(len(houses) for houses in data.values()))
+        result = _halve(data)
+        if len(calls) <= 2:
+            result["Sector-B"]["house-4"] = -0.5 # inválida en la modificación y en la primera reparación
+        return json.dumps(result)
+
+    scenario = asyncio.run(_stub_manager(stub_model, responder, repair_rounds=3).generate_and_modify_data())
+    assert calls == [8, 1, 1]
+    assert validate_scenario(scenario).ok
+    i = scenario.index("Sector-B", "house-4")
+    assert scenario.modified[i] == pytest.approx(round(round(float(scenario.initial[i]), 2) * 0.5, 2), abs=1e-6)
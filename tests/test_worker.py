@@ -0,0 +1,53 @@
+import asyncio
+import concurrent.futures
+
+import pytest
+
+from utils.pool import get_pool
+from utils.worker import RegenerationWorker
+
+
+async def _wait_forever(started):
+    started.set()
+    await asyncio.sleep(3600)
+
+
+async def _value(value):
+    return value
+
+
+def test_submit_cancels_the_previous_job_by_default():
+    worker = RegenerationWorker()
+    try:
+        started = asyncio.Event()
+        first = worker.submit(_wait_forever, started)
+        second = worker.submit(_value, 42)
+        assert second.result(timeout=5) == 42
+        with pytest.raises(concurrent.futures.CancelledError):
+            first.result(timeout=5)
+        assert first.cancelled()
+
+        # supersede=False no cancela el trabajo en curso (p.ej. las precargas)
+        third = worker.submit(_wait_forever, asyncio.Event())
+        assert worker.submit(_value, 7, supersede=False).result(timeout=5) == 7
+        assert not third.done()
+    finally:
+        worker.shutdown()
+
+
+def test_shutdown_closes_the_pool_session_and_stops_the_loop():
+    worker = RegenerationWorker()
+
+    async def open_session():
+        return get_pool().session()
+
+    session = worker.submit(open_session).result(timeout=5)
+    pending = worker.submit(_wait_forever, asyncio.Event(), supersede=False)
+    assert not session.closed
+
+    worker.shutdown()
+
+    assert session.closed # close_pool() en el loop del worker
+    assert not worker._thread.is_alive()
+    assert worker.loop.is_closed()
+    assert pending.cancelled() # lo pendiente se cancela al parar